@@ -1,5 +1,7 @@
+import argparse
 import os
 import shutil
+from typing import List, Optional
 
 import uvicorn
 
@@ -31,9 +33,58 @@ def set_multiproc_dir() -> None:
     )
 
 
-def main() -> None:
-    """Entrypoint of the application."""
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Entrypoint of the application.
+
+    Runs the web server by default, a scan job worker with `worker`
+    or the inference server with `inference-server`.
+
+    :param argv: command line arguments.
+    """
+    parser = argparse.ArgumentParser(prog="python -m insightguard")
+    commands = parser.add_subparsers(dest="command")
+    web_parser = commands.add_parser("web", help="Run the web server (default).")
+    web_parser.add_argument("--preload", action="store_true", default=None,
+                            help="Preload the app and fork workers from it.")
+    worker_parser = commands.add_parser("worker", help="Process scan jobs.")
+    worker_parser.add_argument("--concurrency", type=int, default=None)
+    server_parser = commands.add_parser(
+        "inference-server",
+        help="Run models for web workers using the server executor.",
+    )
+    server_parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "inference-server":
+        from insightguard.services.insightguard import server  # noqa: WPS433
+
+        server.main(args.workers)
+        return
+
+    if args.command == "worker":
+        from insightguard.services.jobs.worker import main as run_worker  # noqa: WPS433
+
+        run_worker(args.concurrency)
+        return
+
+    run_web(getattr(args, "preload", None))
+
+
+def run_web(preload: Optional[bool] = None) -> None:
+    """
+    Run uvicorn with the application.
+
+    :param preload: use the preload-and-fork runner, see `web_preload` setting.
+    """
     set_multiproc_dir()
+    preload = settings.web_preload if preload is None else preload
+    if preload and not settings.reload:
+        from insightguard.web.runner import run_preforked  # noqa: WPS433
+
+        run_preforked(settings.workers_count)
+        return
+
     uvicorn.run(
         "insightguard.web.application:get_app",
         workers=settings.workers_count,
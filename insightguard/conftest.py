@@ -1,4 +1,4 @@
-from typing import Any, AsyncGenerator
+from typing import Any, AsyncGenerator, Tuple
 
 import pytest
 from fakeredis import FakeServer
@@ -130,3 +130,20 @@ async def client(
     """
     async with AsyncClient(app=fastapi_app, base_url="http://test") as ac:
         yield ac
+
+
+@pytest.fixture(scope="session")
+async def stand_in_app(anyio_backend: Any) -> AsyncGenerator[Tuple[FastAPI, str], None]:
+    """
+    Started application using SQLite and fakeredis stand-ins.
+
+    Startup registers prometheus metrics globally, so the application
+    is started once and shared by tests.
+
+    :yield: the application and a valid API key.
+    """
+    pytest.importorskip("aiosqlite")
+    from insightguard.tests.benchmarks.stand_ins import benchmark_app  # noqa: WPS433
+
+    async with benchmark_app() as started:
+        yield started
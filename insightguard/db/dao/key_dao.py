@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from insightguard.db.dependencies import get_db_session
+from insightguard.metrics import DEPENDENCY_LATENCY
 from insightguard.db.models.key_model import KeyModel
 from insightguard.db.models.user_model import UserModel
 from insightguard.settings import settings
@@ -32,9 +33,10 @@ class KeyDAO:
         # Check how many keys user has
         keys = await self.get_user_keys(user_id)
 
-        user = await self.session.execute(
-            select(UserModel).where(UserModel.id == user_id)
-        )
+        with DEPENDENCY_LATENCY.labels("db", "get_user").time():
+            user = await self.session.execute(
+                select(UserModel).where(UserModel.id == user_id)
+            )
         user = user.scalar()
 
         if len(keys) >= KEYS_LIMIT[user.account_type] and settings.environment == 'production':
@@ -46,8 +48,9 @@ class KeyDAO:
         key = KeyModel(user_id=user_id)
 
         self.session.add(key)
-        await self.session.commit()
-        await self.session.refresh(key)
+        with DEPENDENCY_LATENCY.labels("db", "create_key").time():
+            await self.session.commit()
+            await self.session.refresh(key)
 
         return key
 
@@ -59,7 +62,8 @@ class KeyDAO:
         :return: A key object.
         """
         query = select(KeyModel).where(KeyModel.key == key and KeyModel.disabled is False)
-        key = await self.session.execute(query)
+        with DEPENDENCY_LATENCY.labels("db", "get_key").time():
+            key = await self.session.execute(query)
         key = key.scalar()
         return key
 
@@ -70,16 +74,18 @@ class KeyDAO:
         :return: A list of key objects.
         """
         query = select(KeyModel).where(KeyModel.user_id == user_id)
-        keys = await self.session.execute(query)
+        with DEPENDENCY_LATENCY.labels("db", "get_user_keys").time():
+            keys = await self.session.execute(query)
         keys = keys.scalars().all()
         return keys
 
-    async def update_key_usage(self, key: KeyModel):
+    async def update_key_usage(self, key: KeyModel, amount: int = 1):
         """
         Update key usage.
 
         :param key: key object.
+        :param amount: number of processed items.
         """
 
-        key.usage += 1
+        key.usage += amount
         self.session.add(key)
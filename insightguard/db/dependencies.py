@@ -3,6 +3,8 @@ from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.requests import Request
 
+from insightguard.metrics import DEPENDENCY_LATENCY
+
 
 async def get_db_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
     """
@@ -16,5 +18,7 @@ async def get_db_session(request: Request) -> AsyncGenerator[AsyncSession, None]
     try:  # noqa: WPS501
         yield session
     finally:
-        await session.commit()
+        # Writes of DAOs, e.g. key usage, are flushed here
+        with DEPENDENCY_LATENCY.labels("db", "commit").time():
+            await session.commit()
         await session.close()
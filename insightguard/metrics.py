@@ -0,0 +1,136 @@
+"""
+Application specific prometheus metrics.
+
+Metrics are registered in the default registry, so they are exposed
+by the instrumentator together with HTTP metrics, also in multiprocess mode.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+BATCH_SIZE = Histogram(
+    "insightguard_batch_size",
+    "Number of texts in a single model forward pass.",
+    ["model", "language"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+BATCH_WAIT = Histogram(
+    "insightguard_batch_wait_seconds",
+    "Time a text waits in the batching queue before its batch starts.",
+    ["model", "language"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+BATCH_QUEUE_DEPTH = Gauge(
+    "insightguard_batch_queue_depth",
+    "Number of texts waiting in the batching queue.",
+    ["model", "language"],
+    multiprocess_mode="livesum",
+)
+
+INFERENCE_QUEUE_WAIT = Histogram(
+    "insightguard_inference_queue_wait_seconds",
+    "Time an inference call waits for a free executor worker.",
+    ["model", "language"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+INFERENCE_EXECUTION = Histogram(
+    "insightguard_inference_execution_seconds",
+    "Time an inference call runs in an executor worker.",
+    ["model", "language"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+INFERENCE_PENDING = Gauge(
+    "insightguard_inference_pending",
+    "Number of inference calls queued or running in the executor.",
+    multiprocess_mode="livesum",
+)
+
+INFERENCE_STAGE = Histogram(
+    "insightguard_inference_stage_seconds",
+    "Time spent in a stage of inference, e.g. tokenize, forward or softmax.",
+    ["model", "language", "stage"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+             0.5, 1, 2.5, 5),
+)
+
+DEPENDENCY_LATENCY = Histogram(
+    "insightguard_dependency_seconds",
+    "Time of calls to the database and redis made while serving requests.",
+    ["dependency", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+CACHE_REQUESTS = Counter(
+    "insightguard_cache_requests",
+    "Prediction cache lookups by tier and result (hit or miss).",
+    ["cache", "tier", "result"],
+)
+
+MODEL_LOAD_TIME = Gauge(
+    "insightguard_model_load_seconds",
+    "Time it took to load and warm up a model.",
+    ["model"],
+    multiprocess_mode="liveall",
+)
+
+RESIDENT_MODELS = Gauge(
+    "insightguard_resident_models",
+    "Number of models loaded in memory.",
+    ["model"],
+    multiprocess_mode="livesum",
+)
+
+RESIDENT_MODEL_BYTES = Gauge(
+    "insightguard_resident_model_bytes",
+    "Estimated memory used by loaded models.",
+    ["model"],
+    multiprocess_mode="livesum",
+)
+
+PROCESS_MEMORY = Gauge(
+    "insightguard_process_memory_bytes",
+    "Memory of a worker process by kind (rss, pss, shared or private).",
+    ["kind"],
+    multiprocess_mode="liveall",
+)
+
+MODEL_EVICTIONS = Counter(
+    "insightguard_model_evictions",
+    "Models unloaded from memory by reason (memory or idle).",
+    ["model", "language", "reason"],
+)
+
+MODEL_RELOAD_TIME = Histogram(
+    "insightguard_model_reload_seconds",
+    "Time it took to load a model again after it was unloaded.",
+    ["model", "language"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60),
+)
+
+JOBS = Counter(
+    "insightguard_jobs",
+    "Finished scan jobs by kind and status (done or failed).",
+    ["kind", "status"],
+)
+
+JOB_ITEMS = Counter(
+    "insightguard_job_items",
+    "Items processed by scan job workers.",
+    ["kind"],
+)
+
+JOB_QUEUE_WAIT = Histogram(
+    "insightguard_job_queue_wait_seconds",
+    "Time from submitting a scan job to its first claim by a worker.",
+    ["kind"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+JOB_LATENCY = Histogram(
+    "insightguard_job_latency_seconds",
+    "Time from submitting a scan job to its completion.",
+    ["kind"],
+    buckets=(0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 7200),
+)
@@ -1,41 +1,132 @@
-import time
-from fastapi import Request, HTTPException
+import hashlib
+import math
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
 from redis.asyncio import Redis
+from redis.exceptions import NoScriptError
+
+from insightguard.metrics import DEPENDENCY_LATENCY
+
+# Generic cell rate algorithm. The key stores the theoretical arrival time
+# (TAT) of the next request in microseconds of redis' clock. Every request
+# moves it by cost * window / limit, requests that would move it more than
+# a window ahead of now are rejected.
+# Returns allowed flag, remaining quota, microseconds until the quota is
+# full again and microseconds until the request would be allowed.
+GCRA_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local interval = window / limit
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+
+local new_tat = tat + cost * interval
+if new_tat - now > window then
+    local remaining = math.max(math.floor((window - (tat - now)) / interval + 1e-6), 0)
+    return {0, remaining, math.ceil(tat - now), math.ceil(new_tat - window - now)}
+end
+
+local ttl = math.max(math.ceil((new_tat - now) / 1000), 1)
+redis.call('SET', KEYS[1], new_tat, 'PX', ttl)
+local remaining = math.floor((window - (new_tat - now)) / interval + 1e-6)
+return {1, remaining, math.ceil(new_tat - now), 0}
+"""
+GCRA_SHA = hashlib.sha1(GCRA_SCRIPT.encode("utf-8")).hexdigest()  # noqa: S303
 
 
 class RateLimiter:
     """
-    Rate limiter middleware.
+    Rate limiter dependency.
+
+    Every API key may send ``rate_limit`` requests per ``rate_limit_window``,
+    at once or spread over it. Quota is restored continuously, so there's no
+    window boundary letting twice the limit through. A request is checked
+    and counted by one atomic script call, so one round trip to redis,
+    and concurrent requests can't exceed the limit.
+
+    Responses get ``RateLimit-*`` headers with the quota. The dependency
+    returns them too, for endpoints returning responses directly.
+    Endpoints scoring many items call :meth:`charge` with their count instead.
 
     :param rate_limit: number of requests allowed per rate_limit_window.
     :param rate_limit_window: time window in seconds.
     :param redis_client: redis client.
+    :param prefix: prefix of redis keys, limiters sharing it share the quota.
     """
 
-    def __init__(self, rate_limit: int, rate_limit_window: int, redis_client: Redis):
+    def __init__(self, rate_limit: int, rate_limit_window: int, redis_client: Redis,
+                 prefix: str = "ratelimit"):
         self.rate_limit = rate_limit
         self.rate_limit_window = rate_limit_window
         self.redis_client = redis_client
+        self.prefix = prefix
 
-    async def __call__(self, request: Request) -> None:
+    async def __call__(self, request: Request, response: Response) -> Dict[str, str]:
         # Get the API key from the request headers
         api_key = request.headers.get("X-API-KEY")
         if not api_key:
             raise HTTPException(status_code=400, detail="API key not provided")
 
-        # Check if the API key has exceeded the rate limit
-        current_time = int(time.time())
-        key = f"api:{api_key}"
-        request_count = await self.redis_client.get(key)
-        if request_count is not None and int(request_count) >= self.rate_limit:
-            reset_time = int(await self.redis_client.ttl(key))
+        return await self.charge(api_key, response=response)
+
+    async def charge(self, api_key: str, cost: int = 1,
+                     response: Optional[Response] = None) -> Dict[str, str]:
+        """
+        Count requests of an API key, rejecting them above its quota.
+
+        :param api_key: API key of the request.
+        :param cost: number of requests, e.g. items of a batch.
+        :param response: response to add quota headers to.
+        :raises HTTPException: with status 429 if the requests don't fit the quota.
+        :return: quota headers.
+        """
+        with DEPENDENCY_LATENCY.labels("redis", "rate_limit").time():
+            allowed, remaining, reset, retry_after = await self.check(api_key, cost)
+
+        headers = {
+            "RateLimit-Limit": str(self.rate_limit),
+            "RateLimit-Remaining": str(remaining),
+            "RateLimit-Reset": str(reset),
+            "RateLimit-Policy": f"{self.rate_limit};w={self.rate_limit_window}",
+        }
+        if not allowed:
             raise HTTPException(
                 status_code=429,
-                detail=f"API key {api_key} has exceeded the rate limit of {self.rate_limit} requests per {self.rate_limit_window} seconds. "
-                f"Please try again in {reset_time} seconds.",
-                headers={"Retry-After": str(reset_time)},
+                detail=f"API key {api_key} has exceeded the rate limit of "
+                f"{self.rate_limit} requests per {self.rate_limit_window} seconds. "
+                f"Please try again in {retry_after} seconds.",
+                headers={**headers, "Retry-After": str(retry_after)},
             )
+        if response is not None:
+            response.headers.update(headers)
+        return headers
+
+    async def check(self, api_key: str, cost: int = 1) -> Tuple[bool, int, int, int]:
+        """
+        Count requests of an API key if they fit its quota.
 
-        # Increment the request count and set the expiry time
-        await self.redis_client.incr(key)
-        await self.redis_client.expire(key, self.rate_limit_window)
+        :param api_key: API key of the request.
+        :param cost: number of requests.
+        :return: whether they are allowed, remaining quota, seconds until
+            the quota is full again and seconds until they would be allowed.
+        """
+        key = f"{self.prefix}:{api_key}"
+        args = (self.rate_limit, self.rate_limit_window * 1000000, cost)
+        try:
+            result = await self.redis_client.evalsha(GCRA_SHA, 1, key, *args)
+        except NoScriptError:
+            result = await self.redis_client.eval(GCRA_SCRIPT, 1, key, *args)
+        allowed, remaining, reset, retry_after = result
+        return (bool(allowed), int(remaining), math.ceil(reset / 1000000),
+                math.ceil(retry_after / 1000000))
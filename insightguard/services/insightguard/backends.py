@@ -0,0 +1,394 @@
+"""
+Inference backends of the bullying models.
+
+Models run either as TensorFlow models converted from the PyTorch
+checkpoints on the hub, or as ONNX models on ONNX Runtime's CPU provider.
+ONNX models are exported, and optionally quantized to int8, with::
+
+    python -m insightguard.services.insightguard.backends export pl --quantize
+
+and compared with the TensorFlow path with::
+
+    python -m insightguard.services.insightguard.backends benchmark pl
+
+Weights of exported models are stored memory-mapped, see
+:mod:`insightguard.services.insightguard.weights`. Models exported before
+are converted with the ``weights`` command.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from insightguard.services.insightguard.resources import resources
+from insightguard.services.insightguard.weights import (MANIFEST,
+                                                        externalize_onnx,
+                                                        load_weights,
+                                                        weights_dir)
+from insightguard.settings import settings
+
+ONNX_MODEL = "model.onnx"
+ONNX_QUANTIZED_MODEL = "model.int8.onnx"
+
+BENCHMARK_TEXTS = (
+    "hello, how are you today?",
+    "you are a complete idiot and everybody knows it",
+    "I really liked the movie we watched yesterday, the ending was great "
+    "and the soundtrack was even better than I expected.",
+)
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    """
+    Softmax over the last axis.
+
+    :param logits: model logits.
+    :return: probabilities.
+    """
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class TFBackend:
+    """
+    TensorFlow model from the hub, served by compiled functions.
+
+    Inputs are padded to the nearest of ``tf_sequence_buckets`` lengths,
+    so the model is traced once per bucket instead of once per length.
+
+    :param name_or_path: hub name or local path of the model.
+    :param from_pt: convert model from PyTorch checkpoint.
+    """
+
+    kind = "tf"
+
+    def __init__(self, name_or_path: str, from_pt: bool = True):
+        tf = resources.get("tensorflow")
+        transformers = resources.get("transformers")
+        self.name_or_path = name_or_path
+        self.model = transformers.TFAutoModelForSequenceClassification.from_pretrained(
+            name_or_path, from_pt=from_pt,
+        )
+        self.id2label: Dict[int, str] = self.model.config.id2label or {}
+        self.memory_bytes = sum(
+            int(np.prod(weight.shape)) * weight.dtype.size
+            for weight in self.model.weights
+        )
+        self.pad_token_id = self.model.config.pad_token_id or 0
+        self.buckets = sorted(settings.tf_sequence_buckets)
+        self._serve = tf.function(self._logits)
+        self._functions: Dict[Tuple[int, Tuple[str, ...]], Any] = {}
+        self._lock = Lock()
+
+    def __call__(self, encoded_input: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Run the model.
+
+        :param encoded_input: tokenizer output as numpy arrays.
+        :return: logits.
+        """
+        length = np.shape(encoded_input["input_ids"])[1]
+        bucket = self.bucket(length)
+        inputs = {
+            name: _pad_right(
+                np.asarray(values, dtype=np.int32),
+                bucket,
+                self.pad_token_id if name == "input_ids" else 0,
+            )
+            for name, values in encoded_input.items()
+        }
+        function = self.serving_function(bucket, tuple(inputs))
+        return function(inputs).numpy()
+
+    def bucket(self, length: int) -> int:
+        """
+        Sequence length the input is padded to.
+
+        :param length: length of the input.
+        :return: the smallest bucket fitting it, or the length if none does.
+        """
+        return next((bucket for bucket in self.buckets if bucket >= length), length)
+
+    def serving_function(self, length: int, input_names: Sequence[str]) -> Any:
+        """
+        Get compiled function for inputs of a sequence length, tracing it once.
+
+        :param length: padded sequence length.
+        :param input_names: names of model inputs.
+        :return: concrete function returning logits.
+        """
+        key = (length, tuple(sorted(input_names)))
+        function = self._functions.get(key)
+        if function is None:
+            with self._lock:
+                function = self._functions.get(key)
+                if function is None:
+                    tf = resources.get("tensorflow")
+                    function = self._serve.get_concrete_function({
+                        name: tf.TensorSpec([None, length], tf.int32, name=name)
+                        for name in key[1]
+                    })
+                    self._functions[key] = function
+        return function
+
+    def warmup(self, input_names: Sequence[str]) -> None:
+        """
+        Trace functions of all buckets ahead of the first request.
+
+        :param input_names: names of model inputs.
+        """
+        for bucket in self.buckets:
+            self.serving_function(bucket, input_names)
+
+    def _logits(self, inputs: Dict[str, Any]) -> Any:
+        return self.model(inputs, training=False).logits
+
+
+class ONNXBackend:
+    """
+    ONNX model exported with :func:`export_onnx`, run on ONNX Runtime CPU provider.
+
+    :param model_dir: directory with the exported model, config and tokenizer.
+    :param quantized: use the int8 model when it was exported.
+    """
+
+    kind = "onnx"
+
+    def __init__(self, model_dir: Path, quantized: bool = True):
+        onnxruntime = resources.get("onnxruntime")
+        model_dir = Path(model_dir)
+        model_path = model_dir / ONNX_QUANTIZED_MODEL
+        if not quantized or not model_path.exists():
+            model_path = model_dir / ONNX_MODEL
+
+        options = onnxruntime.SessionOptions()
+        if settings.onnx_threads:
+            options.intra_op_num_threads = settings.onnx_threads
+        self.memory_bytes = model_path.stat().st_size
+
+        # Sessions use mapped weights in place, so workers share their pages.
+        # Prepacking would copy them into private memory. Mapped weights
+        # don't count towards memory_bytes, which is private to the worker.
+        self.initializers = []
+        self.shared_bytes = 0
+        if settings.onnx_mmap_weights and (weights_dir(model_path) / MANIFEST).exists():
+            options.add_session_config_entry("session.disable_prepacking", "1")
+            for name, array in load_weights(weights_dir(model_path)).items():
+                initializer = onnxruntime.OrtValue.ortvalue_from_numpy(array)
+                options.add_initializer(name, initializer)
+                self.initializers.append(initializer)
+                self.shared_bytes += array.nbytes
+
+        self.name_or_path = str(model_dir)
+        self.model_path = model_path
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"],
+        )
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+        config = json.loads((model_dir / "config.json").read_text(encoding="utf-8"))
+        self.id2label = {
+            int(index): label for index, label in config.get("id2label", {}).items()
+        }
+
+    def __call__(self, encoded_input: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Run the model.
+
+        :param encoded_input: tokenizer output as numpy arrays.
+        :return: logits.
+        """
+        feed = {
+            name: np.asarray(encoded_input[name], dtype=np.int64)
+            for name in self.input_names
+        }
+        return self.session.run(["logits"], feed)[0]
+
+    def warmup(self, input_names: Sequence[str]) -> None:
+        """
+        Nothing to do, ONNX Runtime sessions are ready after loading.
+
+        :param input_names: names of model inputs.
+        """
+
+
+def _pad_right(values: np.ndarray, length: int, pad_value: int) -> np.ndarray:
+    if values.shape[1] >= length:
+        return values
+    return np.pad(
+        values, ((0, 0), (0, length - values.shape[1])), constant_values=pad_value,
+    )
+
+
+def onnx_model_dir(lang: str) -> Path:
+    """
+    Directory of the exported ONNX model of a language.
+
+    :param lang: language of the model.
+    :return: path to the directory.
+    """
+    return Path(settings.onnx_models_dir) / lang
+
+
+def load_backend(lang: str, name_or_path: str, from_pt: bool = True):
+    """
+    Load backend of a language model as selected in settings.
+
+    :param lang: language of the model.
+    :param name_or_path: hub name of the model.
+    :param from_pt: convert TF model from PyTorch checkpoint.
+    :raises ValueError: if backend is unknown.
+    :return: TFBackend or ONNXBackend.
+    """
+    kind = settings.bullying_backends.get(lang, "tf")
+    if kind == "onnx":
+        return ONNXBackend(onnx_model_dir(lang), quantized=settings.onnx_quantized)
+    if kind == "tf":
+        return TFBackend(name_or_path, from_pt=from_pt)
+    raise ValueError(f"Unknown backend '{kind}' for '{lang}' model.")
+
+
+def export_onnx(name: str, output_dir: Path, quantize: bool = False) -> Path:
+    """
+    Export PyTorch checkpoint of a model to ONNX.
+
+    Config and tokenizer are saved next to the model, so the ONNX backend
+    doesn't need the hub at runtime. Weights are moved to memory-mapped
+    stores next to the models.
+
+    :param name: hub name of the model.
+    :param output_dir: destination directory.
+    :param quantize: also write a model with weights quantized to int8.
+    :return: path to the exported model.
+    """
+    import torch  # noqa: WPS433
+
+    transformers = resources.get("transformers")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    tokenizer = transformers.AutoTokenizer.from_pretrained(name)
+    model = transformers.AutoModelForSequenceClassification.from_pretrained(name)
+    model.eval()
+
+    dummy = dict(tokenizer(["hello world"], return_tensors="pt"))
+    model_path = output_dir / ONNX_MODEL
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy,),
+            str(model_path),
+            input_names=list(dummy),
+            output_names=["logits"],
+            dynamic_axes={
+                **{input_name: {0: "batch", 1: "sequence"} for input_name in dummy},
+                "logits": {0: "batch"},
+            },
+            opset_version=14,
+        )
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # noqa: WPS433
+
+        quantize_dynamic(
+            str(model_path),
+            str(output_dir / ONNX_QUANTIZED_MODEL),
+            weight_type=QuantType.QInt8,
+        )
+        externalize_onnx(output_dir / ONNX_QUANTIZED_MODEL)
+    externalize_onnx(model_path)
+    return model_path
+
+
+def benchmark(backend, tokenizer, texts: Sequence[str], runs: int) -> List[float]:
+    """
+    Measure latency of a backend.
+
+    :param backend: backend to measure.
+    :param tokenizer: tokenizer of the model.
+    :param texts: texts predicted in one call.
+    :param runs: number of measured calls.
+    :return: latencies in seconds.
+    """
+    encoded_input = dict(tokenizer(list(texts), padding=True, return_tensors="np"))
+    backend(encoded_input)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend(encoded_input)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Export bullying models to ONNX and benchmark them against TensorFlow.
+
+    :param argv: command line arguments.
+    """
+    from insightguard.services.insightguard.models import model_map  # noqa: WPS433
+
+    parser = argparse.ArgumentParser(description="Manage ONNX bullying models.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Export models to ONNX.")
+    export_parser.add_argument("langs", nargs="*", default=list(model_map))
+    export_parser.add_argument("--quantize", action="store_true")
+
+    weights_parser = commands.add_parser(
+        "weights", help="Store weights of exported models memory-mapped.",
+    )
+    weights_parser.add_argument("langs", nargs="*", default=list(model_map))
+
+    benchmark_parser = commands.add_parser("benchmark", help="Compare with TF.")
+    benchmark_parser.add_argument("langs", nargs="*", default=list(model_map))
+    benchmark_parser.add_argument("--runs", type=int, default=50)
+    benchmark_parser.add_argument("--batch-size", type=int, default=8)
+
+    args = parser.parse_args(argv)
+    for lang in args.langs:
+        if args.command == "export":
+            path = export_onnx(model_map[lang], onnx_model_dir(lang), args.quantize)
+            print(f"{lang}: exported to {path}")  # noqa: WPS421
+        elif args.command == "weights":
+            for model_name in (ONNX_MODEL, ONNX_QUANTIZED_MODEL):
+                model_path = onnx_model_dir(lang) / model_name
+                if model_path.exists():
+                    weights_path = externalize_onnx(model_path)
+                    print(f"{lang}: weights stored in {weights_path}")  # noqa: WPS421
+        else:
+            _print_benchmark(lang, model_map[lang], args.runs, args.batch_size)
+
+
+def _print_benchmark(lang: str, name: str, runs: int, batch_size: int) -> None:
+    transformers = resources.get("transformers")
+    tokenizer = transformers.AutoTokenizer.from_pretrained(name)
+    texts = [BENCHMARK_TEXTS[i % len(BENCHMARK_TEXTS)] for i in range(batch_size)]
+    encoded_input = dict(tokenizer(texts, padding=True, return_tensors="np"))
+
+    backends = [TFBackend(name)]
+    for quantized in (False, True):
+        backend = ONNXBackend(onnx_model_dir(lang), quantized=quantized)
+        if quantized and backend.model_path.name != ONNX_QUANTIZED_MODEL:
+            continue
+        backends.append(backend)
+
+    reference = softmax(backends[0](encoded_input))
+    for backend in backends:
+        latencies = np.array(benchmark(backend, tokenizer, texts, runs)) * 1000
+        delta = np.abs(softmax(backend(encoded_input)) - reference).max()
+        print(  # noqa: WPS421
+            f"{lang} {backend.kind:4} {getattr(backend, 'model_path', name)}: "
+            f"p50 {np.percentile(latencies, 50):.1f}ms "
+            f"p95 {np.percentile(latencies, 95):.1f}ms "
+            f"max score delta {delta:.5f}",
+        )
+
+
+if __name__ == "__main__":
+    main()
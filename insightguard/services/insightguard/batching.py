@@ -0,0 +1,155 @@
+"""Dynamic micro-batching of model predictions."""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Sequence, Set, Tuple
+
+from insightguard.metrics import BATCH_QUEUE_DEPTH, BATCH_SIZE, BATCH_WAIT
+
+
+class QueueFullError(Exception):
+    """Raised when too many texts are already waiting for a batch."""
+
+
+class MicroBatcher:
+    """
+    Collects concurrent predictions into batches.
+
+    Texts submitted while a batch is being collected are run together
+    in one await of ``predict_batch``, as soon as ``max_batch_size`` texts
+    are pending or ``max_wait`` seconds passed since the first of them.
+    Up to ``max_concurrency`` batches run at once, the next one is only
+    collected when one of them finishes, so texts queue into bigger batches
+    while all workers of the executor are busy.
+
+    :param predict_batch: coroutine function returning one score per text.
+    :param max_batch_size: maximum number of texts in a batch.
+    :param max_wait: maximum time in seconds to wait for a batch to fill.
+    :param max_queue_depth: maximum number of pending texts.
+    :param model: model name used in metrics.
+    :param language: language used in metrics.
+    :param max_concurrency: maximum number of batches running at once.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[str]], Awaitable[Sequence[float]]],
+        max_batch_size: int,
+        max_wait: float,
+        max_queue_depth: int,
+        model: str,
+        language: str = "",
+        max_concurrency: int = 1,
+    ):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_depth = max_queue_depth
+        self.max_concurrency = max(max_concurrency, 1)
+        self._pending: Deque[Tuple[str, asyncio.Future, float]] = deque()
+        self._has_pending: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batches: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._labels = {"model": model, "language": language}
+
+    async def submit(self, text: str) -> float:
+        """
+        Add text to the next batch and wait for its score.
+
+        :param text: text to predict.
+        :raises QueueFullError: if the queue is full.
+        :return: score of the text.
+        """
+        if len(self._pending) >= self.max_queue_depth:
+            raise QueueFullError(f"{self.max_queue_depth} texts are already queued.")
+
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._has_pending.set()
+        BATCH_QUEUE_DEPTH.labels(**self._labels).inc()
+        return await future
+
+    async def close(self) -> None:
+        """Stop collecting batches and cancel running and pending predictions."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass  # noqa: WPS420
+            self._task = None
+        batches = list(self._batches)
+        for batch in batches:
+            batch.cancel()
+        await asyncio.gather(*batches, return_exceptions=True)
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            BATCH_QUEUE_DEPTH.labels(**self._labels).dec()
+            if not future.done():
+                future.cancel()
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._has_pending = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:  # noqa: WPS457
+            await self._has_pending.wait()
+            await self._slots.acquire()
+            await self._collect()
+
+            size = min(len(self._pending), self.max_batch_size)
+            batch = [self._pending.popleft() for _ in range(size)]
+            if self._pending:
+                self._has_pending.set()
+            else:
+                self._has_pending.clear()
+            task = self._loop.create_task(self._process(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._batches.discard(task)
+        self._slots.release()
+
+    async def _collect(self) -> None:
+        deadline = self._loop.time() + self.max_wait
+        while len(self._pending) < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                return
+            self._has_pending.clear()
+            try:
+                await asyncio.wait_for(self._has_pending.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _process(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        started = time.perf_counter()
+        BATCH_QUEUE_DEPTH.labels(**self._labels).dec(len(batch))
+        BATCH_SIZE.labels(**self._labels).observe(len(batch))
+        for _, _, queued_at in batch:
+            BATCH_WAIT.labels(**self._labels).observe(started - queued_at)
+
+        try:
+            scores = await self.predict_batch([text for text, _, _ in batch])
+        except asyncio.CancelledError:
+            for _, future, _ in batch:  # noqa: WPS440
+                future.cancel()
+            raise
+        except Exception as exc:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future, _), score in zip(batch, scores):
+            if not future.done():
+                future.set_result(score)
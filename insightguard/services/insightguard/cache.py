@@ -0,0 +1,293 @@
+"""
+Two-tier cache of model predictions.
+
+The first tier is a size-bounded LRU in the worker process, the second one
+is shared by all workers in Redis. Entries of both tiers expire after a TTL.
+Keys contain a version of the model, so a new model never reads scores
+of the previous one.
+"""
+import hashlib
+import logging
+import time
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+from insightguard.metrics import CACHE_REQUESTS, DEPENDENCY_LATENCY
+from insightguard.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ValueT = TypeVar("ValueT")
+
+
+class LRUCache(Generic[ValueT]):
+    """
+    In-process LRU cache with expiring entries.
+
+    :param max_size: maximum number of entries.
+    :param ttl: time to live of entries in seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, ValueT]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[ValueT]:
+        """
+        Get value and mark it as recently used.
+
+        :param key: key of the entry.
+        :return: value, None if missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]  # noqa: WPS420
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: ValueT, ttl: Optional[float] = None) -> None:
+        """
+        Store value, evicting the least recently used entries above max size.
+
+        :param key: key of the entry.
+        :param value: value to store.
+        :param ttl: time to live, defaults to the cache's one.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class PredictionCache:
+    """
+    Cache of scores in a local LRU tier backed by Redis.
+
+    Redis errors are logged and treated as misses, so predictions keep
+    working when Redis is down.
+
+    :param name: name of the cache used in metrics.
+    :param max_size: maximum number of entries in the local tier.
+    :param ttl: time to live of entries in seconds.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: int):
+        self.name = name
+        self.ttl = ttl
+        self.local: LRUCache[float] = LRUCache(max_size, ttl)
+
+    async def get_many(
+        self,
+        keys: List[str],
+        redis_pool: Optional[ConnectionPool],
+    ) -> Dict[str, float]:
+        """
+        Get cached scores.
+
+        :param keys: keys to look up.
+        :param redis_pool: redis connection pool, None to use local tier only.
+        :return: found scores by key.
+        """
+        found: Dict[str, float] = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._count("local", hits=len(found), misses=len(missing))
+
+        if not missing or redis_pool is None:
+            return found
+
+        try:
+            async with Redis(connection_pool=redis_pool) as redis:
+                with DEPENDENCY_LATENCY.labels("redis", "cache_get").time():
+                    values = await redis.mget(missing)
+        except RedisError:
+            logger.warning("Can't read %s cache from redis.", self.name, exc_info=True)
+            return found
+
+        hits = 0
+        for key, value in zip(missing, values):
+            if value is not None:
+                hits += 1
+                found[key] = float(value)
+                self.local.set(key, found[key])
+        self._count("redis", hits=hits, misses=len(missing) - hits)
+        return found
+
+    async def set_many(
+        self,
+        values: Dict[str, float],
+        redis_pool: Optional[ConnectionPool],
+        ttl: Optional[int] = None,
+    ) -> None:
+        """
+        Store scores in both tiers.
+
+        :param values: scores by key.
+        :param redis_pool: redis connection pool, None to use local tier only.
+        :param ttl: time to live of the entries, defaults to the cache's one.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        for key, value in values.items():
+            self.local.set(key, value, ttl)
+
+        if not values or redis_pool is None:
+            return
+
+        try:
+            async with Redis(connection_pool=redis_pool) as redis:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for key, value in values.items():  # noqa: WPS440
+                        pipe.set(key, repr(value), ex=ttl)
+                    with DEPENDENCY_LATENCY.labels("redis", "cache_set").time():
+                        await pipe.execute()
+        except RedisError:
+            logger.warning("Can't write %s cache to redis.", self.name, exc_info=True)
+
+    async def cached(
+        self,
+        keys: List[str],
+        compute: Callable[[List[int]], Awaitable[List[float]]],
+        redis_pool: Optional[ConnectionPool],
+    ) -> List[float]:
+        """
+        Get scores from cache, computing and storing missing ones.
+
+        Repeated keys are computed once.
+
+        :param keys: keys of the scores.
+        :param compute: coroutine function scoring items at given indexes.
+        :param redis_pool: redis connection pool, None to use local tier only.
+        :return: scores in order of keys.
+        """
+        found = await self.get_many(list(dict.fromkeys(keys)), redis_pool)
+
+        missing: Dict[str, int] = {}
+        for index, key in enumerate(keys):
+            if key not in found and key not in missing:
+                missing[key] = index
+
+        if missing:
+            computed = dict(zip(missing, await compute(list(missing.values()))))
+            await self.set_many(computed, redis_pool)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def _count(self, tier: str, hits: int, misses: int) -> None:
+        if hits:
+            CACHE_REQUESTS.labels(self.name, tier, "hit").inc(hits)
+        if misses:
+            CACHE_REQUESTS.labels(self.name, tier, "miss").inc(misses)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text, so trivially different copies share a cache entry.
+
+    :param text: input text.
+    :return: text in NFC form with collapsed whitespace.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def bullying_cache_key(lang: str, model_version: str, text: str) -> str:
+    """
+    Cache key of a bullying score.
+
+    :param lang: language of the model.
+    :param model_version: version of the model, see ``bullying_model_version``.
+    :param text: scored text.
+    :return: cache key.
+    """
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"prediction:bullying:{lang}:{model_version}:{digest}"
+
+
+def is_tracking_param(name: str) -> bool:
+    """
+    Whether a query parameter is a tracking one, see ``url_tracking_params``.
+
+    :param name: name of the parameter.
+    :return: True if it should be dropped.
+    """
+    name = name.lower()
+    return any(
+        name.startswith(pattern[:-1]) if pattern.endswith("*") else name == pattern
+        for pattern in settings.url_tracking_params
+    )
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonical form of an URL, so variants of it share a cache entry.
+
+    Scheme and host are lowercased, default ports, fragments and tracking
+    query parameters are dropped. Other parameters are kept verbatim.
+    Malformed URLs, e.g. with an invalid IPv6 host, are only stripped.
+
+    :param url: URL with or without scheme.
+    :return: canonical URL.
+    """
+    url = url.strip()
+    has_scheme = "://" in url
+    try:
+        parts = urlsplit(url if has_scheme else f"//{url}")
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+
+    userinfo, at, host = parts.netloc.rpartition("@")
+    host = host.lower()
+    for default_scheme, port in (("http", ":80"), ("https", ":443")):
+        if scheme == default_scheme and host.endswith(port):
+            host = host[:-len(port)]
+
+    query = "&".join(
+        param for param in parts.query.split("&")
+        if param and not is_tracking_param(param.split("=", 1)[0])
+    )
+    canonical = urlunsplit((scheme, f"{userinfo}{at}{host}", parts.path, query, ""))
+    return canonical if has_scheme else canonical[2:]
+
+
+def phishing_url_cache_key(url: str) -> str:
+    """
+    Cache key of a phishing score of an URL.
+
+    :param url: canonical URL, see :func:`canonicalize_url`.
+    :return: cache key.
+    """
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return f"prediction:phishing_url:{settings.phishing_url_model_version}:{digest}"
+
+
+bullying_cache = PredictionCache(
+    "bullying",
+    max_size=settings.prediction_cache_size,
+    ttl=settings.prediction_cache_ttl,
+)
+
+phishing_url_cache = PredictionCache(
+    "phishing_url",
+    max_size=settings.prediction_cache_size,
+    ttl=settings.phishing_url_cache_ttl,
+)
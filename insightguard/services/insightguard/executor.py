@@ -0,0 +1,157 @@
+"""Executor running model inference outside of the event loop."""
+import asyncio
+import multiprocessing
+import pickle  # noqa: S403
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from insightguard.metrics import (INFERENCE_EXECUTION, INFERENCE_PENDING,
+                                  INFERENCE_QUEUE_WAIT)
+from insightguard.services.insightguard.batching import QueueFullError
+from insightguard.services.insightguard.server import HEADER, check_peer
+from insightguard.settings import settings
+
+
+def _warmup_worker(names: List[str]) -> None:
+    from insightguard.services.insightguard.models import warmup_model  # noqa: WPS433
+
+    for name in names:
+        warmup_model(name)
+
+
+def _timed(function: Callable[..., Any], *args: Any) -> Tuple[Any, float, float]:
+    started = time.time()
+    result = function(*args)
+    return result, started, time.time()
+
+
+class InferenceExecutor:
+    """
+    Bounded pool of threads or processes running inference.
+
+    Process workers are spawned, not forked, and load their own models,
+    so functions passed to :meth:`run` must be importable module-level ones.
+    Every process worker warms up ``warmup_models`` before taking calls.
+
+    The "server" kind sends calls to the inference server listening on
+    ``socket_path`` instead, see :mod:`insightguard.services.insightguard.server`.
+    Its workers are shared by all web workers.
+
+    :param kind: "thread", "process" or "server".
+    :param workers: number of workers.
+    :param max_queue: maximum number of queued and running calls.
+    :param warmup_models: models loaded by process workers on start.
+    :param socket_path: socket of the inference server.
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int,
+                 warmup_models: Optional[List[str]] = None,
+                 socket_path: Optional[Path] = None):
+        if kind not in {"thread", "process", "server"}:
+            raise ValueError(f"Unknown inference executor {kind}.")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.warmup_models = warmup_models or []
+        self.socket_path = socket_path
+        self.pending = 0
+        self._pool: Optional[Executor] = None
+
+    @property
+    def pool(self) -> Executor:
+        """
+        Underlying executor, created on first use.
+
+        :return: executor.
+        """
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warmup_worker,
+                    initargs=(self.warmup_models,),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="inference",
+                )
+        return self._pool
+
+    async def run(
+        self,
+        function: Callable[..., Any],
+        *args: Any,
+        model: str,
+        language: str = "",
+    ) -> Any:
+        """
+        Run function in the pool and wait for its result.
+
+        :param function: function to call.
+        :param args: arguments of the function.
+        :param model: model name used in metrics.
+        :param language: language used in metrics.
+        :raises QueueFullError: if too many calls are already queued.
+        :return: result of the function.
+        """
+        if self.pending >= self.max_queue:
+            raise QueueFullError(
+                f"{self.max_queue} inference calls are already queued.")
+
+        self.pending += 1
+        INFERENCE_PENDING.inc()
+        submitted = time.time()
+        try:
+            if self.kind == "server":
+                result, started, finished = await self._call_server(function, args)
+            else:
+                loop = asyncio.get_running_loop()
+                result, started, finished = await loop.run_in_executor(
+                    self.pool, _timed, function, *args,
+                )
+        finally:
+            self.pending -= 1
+            INFERENCE_PENDING.dec()
+
+        queue_wait = max(started - submitted, 0)
+        INFERENCE_QUEUE_WAIT.labels(model, language).observe(queue_wait)
+        INFERENCE_EXECUTION.labels(model, language).observe(finished - started)
+        return result
+
+    async def _call_server(
+        self,
+        function: Callable[..., Any],
+        args: Tuple[Any, ...],
+    ) -> Tuple[Any, float, float]:
+        reader, writer = await asyncio.open_unix_connection(str(self.socket_path))
+        try:
+            check_peer(writer.get_extra_info("socket"), Path(self.socket_path))
+            payload = pickle.dumps((function, args), protocol=pickle.HIGHEST_PROTOCOL)
+            writer.write(HEADER.pack(len(payload)) + payload)
+            await writer.drain()
+            (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+            ok, response = pickle.loads(await reader.readexactly(size))  # noqa: S301
+        finally:
+            writer.close()
+        if not ok:
+            raise response
+        return response
+
+    def shutdown(self) -> None:
+        """Stop workers, dropping calls that did not start yet."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+inference_executor = InferenceExecutor(
+    kind=settings.inference_executor,
+    workers=settings.inference_workers,
+    max_queue=settings.inference_max_queue,
+    warmup_models=settings.warmup_models,
+    socket_path=settings.inference_server_socket,
+)
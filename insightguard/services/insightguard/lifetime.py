@@ -1,9 +1,128 @@
+"""InsightGuard service."""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
 from fastapi import FastAPI
 
-from insightguard.services.insightguard.models import BullyingScanner
+from insightguard.metrics import MODEL_LOAD_TIME, PROCESS_MEMORY
+from insightguard.services.insightguard.executor import inference_executor
+from insightguard.services.insightguard.models import (bullying_batchers,
+                                                       bullying_residency,
+                                                       warmup_model)
+from insightguard.services.insightguard.resources import resources
+from insightguard.services.insightguard.url_index import url_index
+from insightguard.services.insightguard.weights import memory_usage
+from insightguard.settings import settings
+
+logger = logging.getLogger(__name__)
 
 
 def init_models(app: FastAPI) -> None:
     app.state.scanner = type("Scanner", (), {})
 
     app.state.scanner.langs = ["pl", "en", "jp", "sp", "ca"]
+
+    app.state.resource_load_times = resources.warmup(settings.preload_resources)
+
+    app.state.models_ready = False
+    app.state.model_load_times = {}
+    app.state.model_warmup_errors = {}
+    app.state.warmup_task = asyncio.create_task(warmup_models(app))
+
+    app.state.unload_task = None
+    if settings.bullying_idle_unload_seconds and inference_executor.kind == "thread":
+        app.state.unload_task = asyncio.create_task(unload_idle_models())
+
+    app.state.memory_task = None
+    if settings.memory_report_interval:
+        app.state.memory_task = asyncio.create_task(report_memory_usage())
+
+    app.state.url_index_task = None
+    if settings.phishing_index_enabled:
+        app.state.url_index_task = asyncio.create_task(refresh_url_index())
+
+
+async def warmup_models(app: FastAPI) -> None:
+    """
+    Loads models from `warmup_models` setting concurrently.
+
+    Every model runs one dummy prediction, so its graph is traced before
+    the first request. The app is marked as ready when all of them succeed.
+
+    :param app: current FastAPI app.
+    """
+    names = settings.warmup_models
+    if inference_executor.kind in {"process", "server"}:
+        # Process and server workers warm up on start, this waits for them.
+        calls = [
+            inference_executor.run(warmup_model, name, model="warmup", language=name)
+            for name in names
+        ]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+    else:
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=max(len(names), 1),
+                                thread_name_prefix="warmup") as pool:
+            calls = [loop.run_in_executor(pool, warmup_model, name) for name in names]
+            results = await asyncio.gather(*calls, return_exceptions=True)
+
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            logger.error("Warmup of %s failed", name, exc_info=result)
+            app.state.model_warmup_errors[name] = str(result)
+        else:
+            logger.info("Warmed up %s in %.3fs", name, result)
+            app.state.model_load_times[name] = result
+            MODEL_LOAD_TIME.labels(name).set(result)
+
+    app.state.models_ready = not app.state.model_warmup_errors
+
+
+async def unload_idle_models() -> None:
+    """
+    Periodically unload idle bullying models.
+
+    Models are also unloaded when they're used, this covers workers
+    that get no traffic at all. Process workers only do the latter.
+    """
+    while True:  # noqa: WPS457
+        await asyncio.sleep(settings.bullying_idle_unload_seconds)
+        bullying_residency.enforce()
+
+
+async def report_memory_usage() -> None:
+    """Periodically update memory metrics of the worker."""
+    while True:  # noqa: WPS457
+        for kind, value in memory_usage().items():
+            PROCESS_MEMORY.labels(kind).set(value)
+        await asyncio.sleep(settings.memory_report_interval)
+
+
+async def refresh_url_index() -> None:
+    """
+    Load the known URL index and periodically rebuild it if its files changed.
+
+    Loading runs in a thread, so it doesn't block the event loop, which
+    only looks up URLs in the already loaded index.
+    """
+    loop = asyncio.get_running_loop()
+    while True:  # noqa: WPS457
+        await loop.run_in_executor(None, url_index.refresh)
+        await asyncio.sleep(settings.phishing_index_check_interval)
+
+
+async def shutdown_models(app: FastAPI) -> None:
+    """
+    Stops model warmup, batchers and the inference executor.
+
+    :param app: current FastAPI app.
+    """
+    app.state.warmup_task.cancel()
+    tasks = (app.state.unload_task, app.state.memory_task, app.state.url_index_task)
+    for task in tasks:
+        if task is not None:
+            task.cancel()
+    for batcher in bullying_batchers.values():
+        await batcher.close()
+    inference_executor.shutdown()
@@ -1,39 +1,57 @@
-import os
+import hashlib
+import logging
+import time
 from datetime import datetime
-from typing import Union, List, Tuple, Set, Dict, Any
+from pathlib import Path
+from typing import Union, List, Set, Optional, Dict, Any, Tuple
 
-import nltk as nltk
-import pandas as pd
-import tensorflow as tf
-from keras.preprocessing.text import Tokenizer
-from keras.utils import pad_sequences
-from transformers import AutoTokenizer, TFAutoModelForSequenceClassification
-
-from threading import Lock, Thread
+from threading import Lock
 import numpy as np
-from datasets import load_dataset
-
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
-
-data = load_dataset("Mitake/PhishingURLsANDBenignURLs")
+from redis.asyncio import ConnectionPool
+
+from insightguard.metrics import INFERENCE_STAGE
+from insightguard.services.insightguard.backends import load_backend, softmax
+from insightguard.services.insightguard.batching import MicroBatcher
+from insightguard.services.insightguard.cache import (bullying_cache,
+                                                      bullying_cache_key,
+                                                      canonicalize_url,
+                                                      phishing_url_cache,
+                                                      phishing_url_cache_key)
+from insightguard.services.insightguard.executor import inference_executor
+from insightguard.services.insightguard.preprocessing import (preprocess_email,
+                                                              preprocess_emails)
+from insightguard.services.insightguard.residency import ModelResidency
+from insightguard.services.insightguard.resources import resources
+from insightguard.services.insightguard.url_index import url_index
+from insightguard.services.insightguard.vocabulary import (EMAIL_VOCABULARY_PATH,
+                                                           MODELS_DIR,
+                                                           FrozenVocabulary,
+                                                           pad_sequences)
+from insightguard.settings import settings
+
+logger = logging.getLogger(__name__)
 
 
 class SingletonMeta(type):
     """
     This is a thread-safe implementation of Singleton.
     https://refactoring.guru/design-patterns/singleton/python/example#example-1
+
+    Every class has its own lock, so different models can load concurrently.
     """
 
     _instances = {}
+    _locks: Dict[type, Lock] = {}
     _lock: Lock = Lock()
 
     def __call__(cls, *args, **kwargs):
-        with cls._lock:
-            if cls not in cls._instances:
-                instance = super().__call__(*args, **kwargs)
-                cls._instances[cls] = instance
+        if cls not in cls._instances:
+            with cls._lock:
+                lock = cls._locks.setdefault(cls, Lock())
+            with lock:
+                if cls not in cls._instances:
+                    instance = super().__call__(*args, **kwargs)
+                    cls._instances[cls] = instance
         return cls._instances[cls]
 
 
@@ -42,18 +60,29 @@ class SingletonMetaWithLang(type):
     This is a thread-safe implementation of Singleton, with addition to store instances
     with different languages.
     https://refactoring.guru/design-patterns/singleton/python/example#example-1
+
+    Every language has its own lock, so different languages can load concurrently.
     """
 
     _instances = {}
+    _locks: Dict[str, Lock] = {}
     _lock: Lock = Lock()
 
     def __call__(cls, lang: str, *args, **kwargs):
-        with cls._lock:
-            if lang not in cls._instances:
-                instance = super().__call__(lang, *args, **kwargs)
-                cls._instances[lang] = instance
+        if lang not in cls._instances:
+            with cls._lock:
+                lock = cls._locks.setdefault(lang, Lock())
+            with lock:
+                if lang not in cls._instances:
+                    instance = super().__call__(lang, *args, **kwargs)
+                    cls._instances[lang] = instance
         return cls._instances[lang]
 
+    def discard(cls, lang: str) -> None:
+        """Drop instance of the language, next call creates a new one."""
+        with cls._lock:
+            cls._instances.pop(lang, None)
+
 
 model_map = {
     "pl": "ptaszynski/bert-base-polish-cyberbullying",
@@ -74,36 +103,302 @@ curse_words = {
 }
 
 
+# Substrings of `id2label` names marking the bullying class, and prefixes
+# negating them (e.g. "not_cyberbullying")
+bullying_labels = ("bully", "toxic", "offens", "hate", "abus", "insult", "harass")
+negated_labels = ("not", "non", "no_", "no-", "no ")
+
+
+def bullying_index_from_labels(id2label: Dict[int, str]) -> Optional[int]:
+    """
+    Find index of the bullying class from model's label names.
+
+    Args:
+        id2label (Dict[int, str]): Mapping from model config
+    Returns:
+        Optional[int]: Index of the bullying label, None if labels are generic
+    Raises:
+        RuntimeError: If more than one label looks like the bullying one
+    """
+    matches = [
+        int(index) for index, label in id2label.items()
+        if any(name in label.lower() for name in bullying_labels)
+        and not label.lower().startswith(negated_labels)
+    ]
+    if len(matches) > 1:
+        raise RuntimeError(f"Ambiguous bullying labels in {id2label}.")
+    return matches[0] if matches else None
+
+
+def split_windows(ids: List[int], size: int, overlap: int) -> List[List[int]]:
+    """
+    Split token ids into windows overlapping by `overlap` tokens.
+
+    Args:
+        ids (List[int]): Token ids of a text, without special tokens
+        size (int): Maximum number of ids in a window
+        overlap (int): Number of ids shared by consecutive windows
+    Returns:
+        List[List[int]]: Windows covering all ids, one if they fit
+    Raises:
+        ValueError: If windows don't advance, overlap isn't smaller than size
+    """
+    if not 0 <= overlap < size:
+        raise ValueError(
+            f"Window overlap {overlap} must be between 0 and window size {size}.")
+    if len(ids) <= size:
+        return [ids]
+    step = size - overlap
+    return [ids[start:start + size] for start in range(0, len(ids) - overlap, step)]
+
+
 class BullyingScanner(metaclass=SingletonMetaWithLang):
     def __init__(self, lang: str):
         self.lang = lang
         self.tokenizer = None
-        self.model = None
+        self.backend = None
+        self.bullying_index = None
         self.load_model(from_pt=True)
 
-    async def find_bullying_index(self) -> int:
+    def find_bullying_index(self) -> int:
         """
-        Find index that reference to 'bullying' value of prediction
+        Find index that reference to 'bullying' value of prediction.
+
+        Uses label names from the model config, and falls back to predicting
+        a sentence that is bullying for sure when labels are generic.
 
         Returns:
             int: Index of 'bulling' value
+        Raises:
+            RuntimeError: If the index can't be told unambiguously
         """
-        sentence = curse_words[self.lang]
-        vals = await self.predict(sentence, both=True)
+        index = bullying_index_from_labels(self.backend.id2label)
+        if index is not None:
+            return index
 
-        if len(vals) == 2:
-            i = 0 if vals[0] > vals[1] else 1
-        else:
-            i = 0
+        vals = self.predict_probabilities(curse_words[self.lang])
+        if len(vals) == 1:
+            return 0
+        if len(vals) > 2 or vals[0] == vals[1]:
+            raise RuntimeError(
+                f"Can't find bullying label for '{self.lang}' model, "
+                f"labels: {self.backend.id2label}, probe: {vals.tolist()}.")
 
-        return i
+        return int(np.argmax(vals))
 
     def load_model(self, from_pt: bool):
         """
-          Loads BERT from pretrained bullying
+          Loads BERT from pretrained bullying with backend selected in settings
+          and finds its bullying label, failing if windows overlap by more
+          than the model fits
+        """
+        transformers = resources.get("transformers")
+        self.backend = load_backend(self.lang, model_map[self.lang], from_pt=from_pt)
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(
+            self.backend.name_or_path)
+        if settings.bullying_window_overlap >= self.body_size:
+            raise ValueError(
+                f"Window overlap {settings.bullying_window_overlap} of '{self.lang}' "
+                f"model must be smaller than its window of {self.body_size} tokens.")
+        self.backend.warmup(self.tokenizer.model_input_names)
+        self.bullying_index = self.find_bullying_index()
+
+    @property
+    def window_size(self) -> int:
+        """Maximum number of tokens in one forward pass of a text."""
+        return min(settings.bullying_window_size, self.tokenizer.model_max_length)
+
+    @property
+    def body_size(self) -> int:
+        """Maximum number of text tokens in a window, without special tokens."""
+        return self.window_size - self.tokenizer.num_special_tokens_to_add()
+
+    def predict_probabilities(self, text: str) -> np.ndarray:
+        """
+        Run the model and return probabilities of every label.
+
+        Args:
+            text (str): The text to be classified.
+        Returns:
+            np.ndarray: Probabilities of labels
+        """
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Run the model once over padded batch of texts.
+
+        Only windows following the first one of long texts need more passes.
+
+        Args:
+            texts (List[str]): The texts to be classified.
+        Returns:
+            np.ndarray: Probabilities of labels, one row per text
+        """
+        return self.predict_windows(texts, bucket_size=max(len(texts), 1))
+
+    def encode_windows(self, texts: List[str]
+                       ) -> Tuple[List[Dict[str, List[int]]], List[int]]:
+        """
+        Tokenize texts into overlapping windows fitting the model.
+
+        Without `bullying_long_text` setting only the first window is kept,
+        so long texts are truncated.
+
+        Args:
+            texts (List[str]): The texts to be classified.
+        Returns:
+            Tuple[List[Dict[str, List[int]]], List[int]]: Unpadded model inputs
+                of every window and index of the text every window belongs to
+        """
+        body_size = self.body_size
+        with_token_types = 'token_type_ids' in self.tokenizer.model_input_names
+
+        features = []
+        text_indexes = []
+        token_ids = self.tokenizer(texts, add_special_tokens=False)['input_ids']
+        for index, ids in enumerate(token_ids):
+            windows = split_windows(ids, body_size, settings.bullying_window_overlap)
+            if not settings.bullying_long_text:
+                windows = windows[:1]
+            for window in windows:
+                input_ids = self.tokenizer.build_inputs_with_special_tokens(window)
+                feature = {
+                    'input_ids': input_ids, 'attention_mask': [1] * len(input_ids),
+                }
+                if with_token_types:
+                    feature['token_type_ids'] = (
+                        self.tokenizer.create_token_type_ids_from_sequences(window))
+                features.append(feature)
+                text_indexes.append(index)
+        return features, text_indexes
+
+    def predict_windows(self, texts: List[str], bucket_size: int,
+                        sort: bool = False) -> np.ndarray:
+        """
+        Score windows of texts and reduce them to one row per text.
+
+        First windows of all texts go first, in passes of `bucket_size`.
+        Following windows of long texts are batched by
+        `bullying_window_batch_size`, and skipped for texts that already have
+        a window scored above `bullying_early_exit_threshold`. Such texts are
+        scored by their highest window, others by `bullying_window_reducer`.
+
+        Args:
+            texts (List[str]): The texts to be classified.
+            bucket_size (int): Maximum number of first windows in one forward pass
+            sort (bool): Sort first windows by length, so passes pad less
+        Returns:
+            np.ndarray: Probabilities of labels, one row per text
+        """
+        with INFERENCE_STAGE.labels("bullying", self.lang, "tokenize").time():
+            features, text_indexes = self.encode_windows(texts)
+        first = [i for i, text in enumerate(text_indexes)
+                 if i == 0 or text_indexes[i - 1] != text]
+        following = [i for i, text in enumerate(text_indexes)
+                     if i and text_indexes[i - 1] == text]
+        if sort:
+            first.sort(key=lambda i: len(features[i]['input_ids']))
+
+        passes = [first[start:start + bucket_size]
+                  for start in range(0, len(first), bucket_size)]
+        window_batch = settings.bullying_window_batch_size
+        passes += [following[start:start + window_batch]
+                   for start in range(0, len(following), window_batch)]
+
+        threshold = settings.bullying_early_exit_threshold
+        rows: List[List[np.ndarray]] = [[] for _ in texts]
+        exited = [False] * len(texts)
+        for windows in passes:
+            windows = [i for i in windows if not exited[text_indexes[i]]]
+            if not windows:
+                continue
+            with INFERENCE_STAGE.labels("bullying", self.lang, "pad").time():
+                encoded_input = self.tokenizer.pad([features[i] for i in windows],
+                                                   return_tensors='np')
+            for i, row in zip(windows, self.forward(encoded_input)):
+                text = text_indexes[i]
+                rows[text].append(row)
+                if (threshold and self.bullying_index is not None
+                        and row[self.bullying_index] >= threshold):
+                    exited[text] = True
+
+        with INFERENCE_STAGE.labels("bullying", self.lang, "reduce").time():
+            return np.stack([
+                self.reduce_windows(np.stack(text_rows), "max" if text_exited else None)
+                for text_rows, text_exited in zip(rows, exited)
+            ])
+
+    def reduce_windows(self, rows: np.ndarray,
+                       reducer: Optional[str] = None) -> np.ndarray:
+        """
+        Reduce probabilities of windows of one text.
+
+        Args:
+            rows (np.ndarray): Probabilities of labels, one row per window
+            reducer (Optional[str]): "max" takes the window most likely to be
+                bullying, "mean" averages them, defaults to `bullying_window_reducer`
+        Returns:
+            np.ndarray: Probabilities of labels of the text
+        Raises:
+            ValueError: If the reducer is unknown
+        """
+        reducer = reducer or settings.bullying_window_reducer
+        if len(rows) == 1:
+            return rows[0]
+        if reducer == "mean" or self.bullying_index is None:
+            return rows.mean(axis=0)
+        if reducer == "max":
+            return rows[int(np.argmax(rows[:, self.bullying_index]))]
+        raise ValueError(f"Unknown window reducer '{reducer}'.")
+
+    def forward(self, encoded_input) -> np.ndarray:
+        """
+        Run the model over already tokenized and padded input.
+
+        Args:
+            encoded_input: Output of the tokenizer, as numpy arrays
+        Returns:
+            np.ndarray: Probabilities of labels, one row per text
+        """
+        with INFERENCE_STAGE.labels("bullying", self.lang, "forward").time():
+            logits = self.backend(encoded_input)
+        with INFERENCE_STAGE.labels("bullying", self.lang, "softmax").time():
+            return softmax(logits)
+
+    def predict_scores(self, texts: List[str]) -> List[float]:
+        """
+        Predict the probability of every text being a cyberbullying message.
+
+        Args:
+            texts (List[str]): The texts to be classified.
+        Returns:
+            List[float]: Probabilities of bullying, in order of texts
+        """
+        if self.backend is None:
+            self.load_model(from_pt=True)
+
+        return self.predict_batch(texts)[:, self.bullying_index].tolist()
+
+    def predict_scores_bucketed(self, texts: List[str],
+                                bucket_size: int) -> List[float]:
+        """
+        Predict many texts in buckets of similar token length.
+
+        Texts are tokenized once and sorted by length, so every forward pass
+        pads its bucket only to the longest text in it, not in the whole input.
+
+        Args:
+            texts (List[str]): The texts to be classified.
+            bucket_size (int): Maximum number of texts in one forward pass
+        Returns:
+            List[float]: Probabilities of bullying, in order of texts
         """
-        self.model = TFAutoModelForSequenceClassification.from_pretrained(
-            model_map[self.lang], from_pt=from_pt)
+        if self.backend is None:
+            self.load_model(from_pt=True)
+
+        probabilities = self.predict_windows(texts, bucket_size, sort=True)
+        return probabilities[:, self.bullying_index].tolist()
 
     async def predict(self, text: str, both: bool = False) -> Union[float, List[float]]:
         """
@@ -111,36 +406,168 @@ class BullyingScanner(metaclass=SingletonMetaWithLang):
         Args:
             text (str): The text to be classified.
             both (bool): Return one value from model or both
-            from_pt (bool): Load model from pytorch
         Returns:
             Union[float, List[float]]: The probability of the text being a cyberbullying message.
         """
-        if self.tokenizer is None:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_map[self.lang])
+        if both:
+            if self.backend is None:
+                self.load_model(from_pt=True)
+            return self.predict_probabilities(text).tolist()
 
-        if self.model is None:
-            self.load_model(from_pt=True)
+        return await bullying_score(self.lang, text)
 
-        encoded_input = self.tokenizer.encode_plus(text, padding=True, truncation=True,
-                                                   max_length=2048, return_tensors='tf')
 
-        with tf.device('/CPU:0'), tf.GradientTape() as tape:
-            output = self.model(encoded_input)
-            logits = output.logits
+# Bullying models are loaded through it, so rarely used languages can be
+# unloaded when they don't fit the memory budget
+bullying_residency = ModelResidency(
+    "bullying",
+    load=BullyingScanner,
+    unload=BullyingScanner.discard,
+    size=lambda scanner: scanner.backend.memory_bytes,
+    budget=settings.bullying_memory_budget_mb * 2 ** 20,
+    pinned=settings.bullying_pinned_languages,
+    idle_ttl=settings.bullying_idle_unload_seconds,
+)
 
-        probabilities = tf.nn.softmax(logits)
+bullying_batchers: Dict[str, MicroBatcher] = {}
 
-        if both:
-            return probabilities[0].numpy().tolist()
 
-        predicted_value = probabilities.numpy()[0][await self.find_bullying_index()]
+def get_bullying_batcher(lang: str) -> MicroBatcher:
+    """
+    Get micro-batcher collecting predictions of the language model.
+
+    It runs as many batches at once as the inference executor has workers.
+
+    Args:
+        lang (str): Language of the model
+    Returns:
+        MicroBatcher: Batcher running `BullyingScanner.predict_scores`
+    """
+    if lang not in bullying_batchers:
+        async def predict_batch(texts: List[str]) -> List[float]:
+            return await inference_executor.run(
+                predict_bullying, lang, texts, model="bullying", language=lang)
+
+        bullying_batchers[lang] = MicroBatcher(
+            predict_batch,
+            max_batch_size=settings.bullying_batch_max_size,
+            max_wait=settings.bullying_batch_max_wait_ms / 1000,
+            max_queue_depth=settings.bullying_batch_max_queue,
+            model="bullying",
+            language=lang,
+            max_concurrency=inference_executor.workers,
+        )
+    return bullying_batchers[lang]
+
+
+def bullying_model_version(lang: str) -> str:
+    """
+    Version of the language model used in cache keys.
+
+    It changes with the model, its backend and `bullying_model_version` setting.
+
+    Args:
+        lang (str): Language of the model
+    Returns:
+        str: Short version hash
+    """
+    backend = settings.bullying_backends.get(lang, "tf")
+    if backend == "onnx":
+        backend = "onnx-int8" if settings.onnx_quantized else "onnx"
+    version = f"{model_map[lang]}:{backend}:{settings.bullying_model_version}"
+    return hashlib.sha1(version.encode("utf-8")).hexdigest()[:12]
+
+
+async def bullying_score(lang: str, text: str,
+                         redis_pool: Optional[ConnectionPool] = None) -> float:
+    """
+    Predict the probability of the text being a cyberbullying message.
+
+    Cached scores are returned from `bullying_cache`, other texts are batched
+    with concurrent ones and run in the inference executor.
+
+    Args:
+        lang (str): Language of the model
+        text (str): The text to be classified.
+        redis_pool (Optional[ConnectionPool]): Pool of the shared cache tier
+    Returns:
+        float: The probability of the text being a cyberbullying message.
+    """
+    if not settings.prediction_cache_enabled:
+        return await get_bullying_batcher(lang).submit(text)
+
+    async def compute(indexes: List[int]) -> List[float]:
+        return [await get_bullying_batcher(lang).submit(text)]
+
+    key = bullying_cache_key(lang, bullying_model_version(lang), text)
+    scores = await bullying_cache.cached([key], compute, redis_pool)
+    return scores[0]
+
+
+async def bullying_scores(lang: str, texts: List[str],
+                          redis_pool: Optional[ConnectionPool] = None) -> List[float]:
+    """
+    Predict many texts of one language in length buckets.
+
+    Cached and repeated texts are predicted only once.
+
+    Args:
+        lang (str): Language of the model
+        texts (List[str]): The texts to be classified.
+        redis_pool (Optional[ConnectionPool]): Pool of the shared cache tier
+    Returns:
+        List[float]: Probabilities of bullying, in order of texts
+    """
+    async def compute(indexes: List[int]) -> List[float]:
+        return await inference_executor.run(
+            predict_bullying_bucketed, lang, [texts[i] for i in indexes],
+            settings.bullying_batch_max_size, model="bullying", language=lang)
+
+    if not settings.prediction_cache_enabled:
+        return await compute(list(range(len(texts))))
 
-        return predicted_value
+    version = bullying_model_version(lang)
+    keys = [bullying_cache_key(lang, version, text) for text in texts]
+    return await bullying_cache.cached(keys, compute, redis_pool)
+
+
+# Keras models served by the phishing URL and email endpoints
+phishing_model_path = str(MODELS_DIR / 'phishing.h5')
+phishing_email_model_path = str(MODELS_DIR / 'phishing-email.h5')
+
+# URL scores below it are benign and cached as negative results
+phishing_threshold = 0.5
 
 
 class PhishingURLClassifier(metaclass=SingletonMeta):
-    def __init__(self, model_path: str = 'models/phishing.h5'):
+    def __init__(self, model_path: str = str(MODELS_DIR / 'phishing.h5'),
+                 vocabulary_path: Optional[str] = None):
+        tf = resources.get("tensorflow")
         self.model = tf.keras.models.load_model(model_path)
+        self.vocabulary = self.load_vocabulary(
+            vocabulary_path or Path(model_path).with_suffix('.vocab.json'))
+
+    @staticmethod
+    def load_vocabulary(path: Path) -> FrozenVocabulary:
+        """
+        Load the frozen URL vocabulary stored next to the model.
+
+        Falls back to fitting it on the training dataset (once per process)
+        when the artifact has not been built yet.
+
+        Args:
+            path (Path): Path to the vocabulary file
+        Returns:
+            FrozenVocabulary: Vocabulary used to sequence urls
+        """
+        if Path(path).exists():
+            return FrozenVocabulary.load(path)
+
+        logger.warning(
+            "URL vocabulary %s not found, fitting it on the dataset. Build it with "
+            "`python -m insightguard.services.insightguard.vocabulary url`.", path)
+        data = resources.get("phishing_url_dataset")
+        return FrozenVocabulary.fit(data['train']['url'], num_words=10000)
 
     @staticmethod
     def normalize(values):
@@ -167,59 +594,201 @@ class PhishingURLClassifier(metaclass=SingletonMeta):
         Returns:
             Tuple[Set[str], List[float]]: Tuple of urls and values
         """
-        tokenizer = Tokenizer(num_words=10000)
-        tokenizer.fit_on_texts(data['train']['url'])
-
-        urls_sequenced = tokenizer.texts_to_sequences(urls)
-        urls_sequenced = pad_sequences(urls_sequenced, maxlen=100)
-        values = (self.model.predict(urls_sequenced), urls)
+        with INFERENCE_STAGE.labels("phishing_url", "", "tokenize").time():
+            urls_sequenced = self.vocabulary.texts_to_sequences(urls)
+            urls_sequenced = pad_sequences(urls_sequenced, maxlen=100)
+        with INFERENCE_STAGE.labels("phishing_url", "", "forward").time():
+            values = (self.model.predict(urls_sequenced), urls)
         if normalize:
             values = self.normalize(values)
         return values
 
 
-nltk.download('stopwords')
-nltk.download('punkt')
-stop_words = set(stopwords.words('english'))
-stemmer = PorterStemmer()
-
-email_data = pd.read_csv('./insightguard/services/insightguard/datasets/fraud_email_.csv')
-
-
 class PhishingEmailClassifier(metaclass=SingletonMeta):
-    def __init__(self, model_path: str = 'models/phishing-email.h5'):
+    def __init__(self, model_path: str = phishing_email_model_path,
+                 vocabulary_path: Optional[str] = None):
+        tf = resources.get("tensorflow")
         self.model = tf.keras.models.load_model(model_path)
+        self.vocabulary = self.load_vocabulary(vocabulary_path or EMAIL_VOCABULARY_PATH)
 
-        self.tokenizer = Tokenizer(num_words=10000)
+    @staticmethod
+    def load_vocabulary(path: Path) -> FrozenVocabulary:
+        """
+        Load the frozen email vocabulary.
+
+        Falls back to fitting it on the training CSV (once per process)
+        when the artifact has not been built yet.
 
-        preprocessed_text = email_data['Text'].apply(self.preprocess_text)
+        Args:
+            path (Path): Path to the vocabulary file
+        Returns:
+            FrozenVocabulary: Vocabulary used to sequence emails
+        """
+        if Path(path).exists():
+            return FrozenVocabulary.load(path)
 
+        logger.warning(
+            "Email vocabulary %s not found, fitting it on the dataset. Build it with "
+            "`python -m insightguard.services.insightguard.vocabulary email`.", path)
+        email_data = resources.get("fraud_emails")
+        return FrozenVocabulary.fit(preprocess_emails(email_data['Text']),
+                                    num_words=10000)
 
-    def preprocess_text(self, text):
-        if isinstance(text, str):
-            tokens = nltk.word_tokenize(text)
-            tokens = [word for word in tokens if word.lower() not in stop_words]
-            tokens = [stemmer.stem(word) for word in tokens]
-            return ' '.join(tokens)
-        else:
-            return ''
+    def preprocess_text(self, text) -> str:
+        return preprocess_email(text)
 
     def predict(self, content: str) -> float:
         """
-        Predict phishing urls
+        Predict phishing email
 
         Args:
             content (str): Content of email to predict
         Returns:
             float: Value of prediction
         """
-        content = self.preprocess_text(content)
+        return self.predict_batch([content])[0]
 
-        self.tokenizer.fit_on_texts([content])
-
-        input_sequence = self.tokenizer.texts_to_sequences([content])
-        input_data = pad_sequences(input_sequence, maxlen=100)
+    def predict_batch(self, contents: List[str]) -> List[float]:
+        """
+        Predict many emails in one padded model call.
 
-        values = self.model.predict(input_data)[0][0]
+        Args:
+            contents (List[str]): Contents of emails to predict
+        Returns:
+            List[float]: Values of predictions, in order of contents
+        """
+        with INFERENCE_STAGE.labels("phishing_email", "", "preprocess").time():
+            preprocessed = preprocess_emails(contents)
+        with INFERENCE_STAGE.labels("phishing_email", "", "tokenize").time():
+            input_sequences = self.vocabulary.texts_to_sequences(preprocessed)
+            input_data = pad_sequences(input_sequences, maxlen=100)
+        with INFERENCE_STAGE.labels("phishing_email", "", "forward").time():
+            values = self.model.predict(input_data, batch_size=len(input_data))[:, 0]
+
+        return values.tolist()
+
+
+# Entry points for the inference executor. They're module-level functions,
+# so process workers can unpickle them and build their own model singletons.
+def predict_bullying(lang: str, texts: List[str]) -> List[float]:
+    with bullying_residency.use(lang) as scanner:
+        return scanner.predict_scores(texts)
+
+
+def predict_bullying_bucketed(lang: str, texts: List[str],
+                              bucket_size: int) -> List[float]:
+    with bullying_residency.use(lang) as scanner:
+        return scanner.predict_scores_bucketed(texts, bucket_size)
+
+
+def predict_phishing_urls(urls: Set[str], lookup: bool = True,
+                          model_path: str = phishing_model_path
+                          ) -> List[Dict[str, Any]]:
+    known = {}
+    if lookup and settings.phishing_index_enabled:
+        known = url_index.lookup_many(urls)
+    now = datetime.now()
+    results = [
+        {'url': url, 'prediction': score, 'created_at': now, 'source': 'index'}
+        for url, score in known.items()
+    ]
+    unknown = [url for url in urls if url not in known]
+    if unknown:
+        predictions = PhishingURLClassifier(model_path).predict(unknown, normalize=True)
+        results += [dict(prediction, source='model') for prediction in predictions]
+    return results
+
+
+def predict_phishing_email(content: str,
+                           model_path: str = phishing_email_model_path) -> float:
+    return float(PhishingEmailClassifier(model_path).predict(content))
+
+
+def predict_phishing_emails(contents: List[str],
+                            model_path: str = phishing_email_model_path
+                            ) -> List[float]:
+    return PhishingEmailClassifier(model_path).predict_batch(contents)
+
+
+async def phishing_url_predictions(urls: Set[str],
+                                   redis_pool: Optional[ConnectionPool] = None
+                                   ) -> List[Dict[str, Any]]:
+    """
+    Score URLs from the known URL index, the result cache or the model.
+
+    URLs are canonicalized, so variants differing in tracking parameters or
+    fragments share a cache entry and are scored as the same URL. Only model
+    scores are cached, index answers always come from the current index.
+    URLs the index of this process didn't answer aren't looked up again by
+    the inference worker, unless the index isn't loaded yet.
+
+    Args:
+        urls (Set[str]): URLs to score
+        redis_pool (Optional[ConnectionPool]): Pool of the shared cache tier
+    Returns:
+        List[Dict[str, Any]]: Prediction and its source of every URL
+    """
+    now = datetime.now()
+    known = {}
+    looked_up = settings.phishing_index_enabled and url_index.loaded
+    if looked_up:
+        known = url_index.lookup_many(urls, refresh=False)
+    canonical = {url: canonicalize_url(url) for url in urls if url not in known}
+    keys = {url: phishing_url_cache_key(url) for url in set(canonical.values())}
+
+    scores: Dict[str, float] = {}
+    sources: Dict[str, str] = {}
+    if settings.prediction_cache_enabled:
+        found = await phishing_url_cache.get_many(list(keys.values()), redis_pool)
+        scores = {url: found[key] for url, key in keys.items() if key in found}
+
+    missing = {url for url in keys if url not in scores}
+    if missing:
+        predictions = await inference_executor.run(
+            predict_phishing_urls, missing, not looked_up, model="phishing_url")
+        for prediction in predictions:
+            scores[prediction['url']] = prediction['prediction']
+            sources[prediction['url']] = prediction['source']
+
+        if settings.prediction_cache_enabled:
+            predicted = {keys[url]: scores[url] for url, source in sources.items()
+                         if source == 'model'}
+            await phishing_url_cache.set_many(
+                {key: score for key, score in predicted.items()
+                 if score >= phishing_threshold}, redis_pool)
+            await phishing_url_cache.set_many(
+                {key: score for key, score in predicted.items()
+                 if score < phishing_threshold}, redis_pool,
+                ttl=settings.phishing_url_negative_cache_ttl)
+
+    results = [
+        {'url': url, 'prediction': score, 'created_at': now, 'source': 'index'}
+        for url, score in known.items()
+    ]
+    results += [
+        {'url': url, 'prediction': scores[canonical_url], 'created_at': now,
+         'source': sources.get(canonical_url, 'model')}
+        for url, canonical_url in canonical.items()
+    ]
+    return results
+
+
+def warmup_model(name: str) -> float:
+    """
+    Load a model and run one dummy prediction to trace its graph.
 
-        return values
+    Args:
+        name (str): Language of a bullying model, "phishing_url" or "phishing_email"
+    Returns:
+        float: Time it took in seconds
+    """
+    start = time.perf_counter()
+    if name == "phishing_url":
+        PhishingURLClassifier(phishing_model_path).predict({"https://example.com/"})
+        if settings.phishing_index_enabled:
+            url_index.refresh()
+    elif name == "phishing_email":
+        predict_phishing_email("Hello, please find the report attached.")
+    else:
+        predict_bullying(name, [curse_words[name]])
+    return time.perf_counter() - start
@@ -0,0 +1,234 @@
+"""
+Fast preprocessing of emails for the phishing email classifier.
+
+``nltk.word_tokenize`` loads the Punkt parameters, splits text into sentences
+and then runs the Treebank rules over every sentence, and ``PorterStemmer.stem``
+is called for every token. Here the Punkt parameters are loaded once and the
+Treebank rules are precompiled once, stems and stopword checks are kept in
+a bounded LRU cache shared by all calls, and batches reuse the work for
+repeated emails. Output is the same as with the NLTK pipeline.
+
+Throughput is compared with the NLTK pipeline with::
+
+    python -m insightguard.services.insightguard.preprocessing benchmark
+"""
+import argparse
+import re
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from insightguard.services.insightguard.resources import FRAUD_EMAILS_PATH, resources
+from insightguard.settings import settings
+
+Rule = Tuple["re.Pattern[str]", str]
+
+# Rules of nltk's NLTKWordTokenizer, applied in this order.
+STARTING_QUOTES: List[Rule] = [
+    (re.compile("([«“‘„]|[`]+)"), r" \1 "),
+    (re.compile(r'^"'), "``"),
+    (re.compile("(``)"), r" \1 "),
+    (re.compile(r"""([ ([{<])("|'{2})"""), r"\1 `` "),
+    (re.compile(r"(?i)(')(?!re|ve|ll|m|t|s|d|n)(\w)\b"), r"\1 \2"),
+]
+PUNCTUATION: List[Rule] = [
+    (re.compile(r"""([^.])(\.)([\])}>"'»”’ ]*)\s*$"""), r"\1 \2 \3 "),
+    (re.compile(r"([:,])([^\d])"), r" \1 \2"),
+    (re.compile("([:,])$"), r" \1 "),
+    (re.compile(r"\.{2,}"), r" \g<0> "),
+    (re.compile("[;@#$%&]"), r" \g<0> "),
+    (re.compile(r"""([^.])(\.)([\])}>"']*)\s*$"""), r"\1 \2\3 "),
+    (re.compile("[?!]"), r" \g<0> "),
+    (re.compile("([^'])' "), r"\1 ' "),
+    (re.compile("[*]"), r" \g<0> "),
+    (re.compile(r"[\][(){}<>]"), r" \g<0> "),
+    (re.compile("--"), " -- "),
+]
+ENDING_QUOTES: List[Rule] = [
+    (re.compile("([»”’])"), r" \1 "),
+    (re.compile("''"), " '' "),
+    (re.compile('"'), " '' "),
+    (re.compile("([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+    (re.compile("([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+]
+CONTRACTIONS: List[Rule] = [
+    (re.compile(pattern), r" \1 \2 ")
+    for pattern in (
+        r"(?i)\b(can)(not)\b",
+        r"(?i)\b(d)('ye)\b",
+        r"(?i)\b(gim)(me)\b",
+        r"(?i)\b(gon)(na)\b",
+        r"(?i)\b(got)(ta)\b",
+        r"(?i)\b(lem)(me)\b",
+        r"(?i)\b(more)('n)\b",
+        r"(?i)\b(wan)(na)(?=\s)",
+        r"(?i) ('t)(is)\b",
+        r"(?i) ('t)(was)\b",
+    )
+]
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into sentences with Punkt, like ``nltk.sent_tokenize``.
+
+    The English Punkt parameters are loaded once and shared by all calls.
+    Whitespace inside sentences is kept, as Treebank rules depend on it.
+
+    :param text: input text.
+    :return: list of sentences.
+    """
+    return resources.get("punkt").tokenize(text)
+
+
+def tokenize_sentence(text: str) -> List[str]:
+    """
+    Split sentence into Treebank tokens, like ``NLTKWordTokenizer.tokenize``.
+
+    :param text: single sentence.
+    :return: list of tokens.
+    """
+    for pattern, substitution in STARTING_QUOTES:
+        text = pattern.sub(substitution, text)
+    for pattern, substitution in PUNCTUATION:  # noqa: WPS440
+        text = pattern.sub(substitution, text)
+    text = f" {text} "
+    for pattern, substitution in ENDING_QUOTES:  # noqa: WPS440
+        text = pattern.sub(substitution, text)
+    for pattern, substitution in CONTRACTIONS:  # noqa: WPS440
+        text = pattern.sub(substitution, text)
+    return text.split()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into words, like ``nltk.word_tokenize``.
+
+    :param text: input text.
+    :return: list of tokens.
+    """
+    return [
+        token
+        for sentence in split_sentences(text)
+        for token in tokenize_sentence(sentence)
+    ]
+
+
+@lru_cache(maxsize=1)
+def stem_function() -> Callable[[str], Optional[str]]:
+    """
+    Porter stemmer dropping stopwords, behind an LRU cache shared by all calls.
+
+    Stopwords are matched case-insensitively, so a token is only lowercased
+    the first time it's seen.
+
+    :return: cached function giving the stem of a token, None for stopwords.
+    """
+    stop_words = resources.get("stopwords")
+    stemmer = resources.get("stemmer")
+
+    def stem(token: str) -> Optional[str]:
+        if token.lower() in stop_words:
+            return None
+        return stemmer.stem(token)
+
+    return lru_cache(maxsize=settings.email_stem_cache_size)(stem)
+
+
+def preprocess_email(text) -> str:
+    """
+    Tokenize email, drop stopwords and stem the remaining words.
+
+    :param text: content of the email, non-string values (e.g. NaN) give ''.
+    :return: space separated stems.
+    """
+    if not isinstance(text, str):
+        return ""
+    stems = map(stem_function(), tokenize(text))
+    return " ".join(stem for stem in stems if stem is not None)
+
+
+def preprocess_emails(texts: Iterable) -> List[str]:
+    """
+    Preprocess many emails, repeated ones only once.
+
+    :param texts: contents of the emails.
+    :return: preprocessed emails in order of texts.
+    """
+    done: Dict[str, str] = {}
+    preprocessed = []
+    for text in texts:
+        if not isinstance(text, str):
+            preprocessed.append("")
+            continue
+        if text not in done:
+            done[text] = preprocess_email(text)
+        preprocessed.append(done[text])
+    return preprocessed
+
+
+def preprocess_email_nltk(text) -> str:
+    """
+    Reference preprocessing with ``nltk.word_tokenize`` and an uncached stemmer.
+
+    :param text: content of the email.
+    :return: space separated stems.
+    """
+    if not isinstance(text, str):
+        return ""
+    nltk = resources.get("nltk")
+    stop_words = resources.get("stopwords")
+    stemmer = resources.get("stemmer")
+    tokens = nltk.word_tokenize(text)
+    return " ".join(
+        stemmer.stem(word) for word in tokens if word.lower() not in stop_words
+    )
+
+
+def benchmark(texts: List[str], function: Callable[[List[str]], List[str]]) -> float:
+    """
+    Measure throughput of a preprocessing function.
+
+    :param texts: emails to preprocess.
+    :param function: function preprocessing a list of emails.
+    :return: emails per second.
+    """
+    start = time.perf_counter()
+    function(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Compare throughput of the NLTK and fast preprocessing.
+
+    :param argv: command line arguments.
+    """
+    import pandas  # noqa: WPS433
+
+    parser = argparse.ArgumentParser(description="Benchmark email preprocessing.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    benchmark_parser = commands.add_parser("benchmark", help="Measure emails/sec.")
+    benchmark_parser.add_argument("--input", type=Path, default=FRAUD_EMAILS_PATH)
+    benchmark_parser.add_argument("--limit", type=int, default=2000)
+
+    args = parser.parse_args(argv)
+    texts = [
+        text for text in pandas.read_csv(args.input)["Text"].tolist()[:args.limit]
+        if isinstance(text, str)
+    ]
+    resources.warmup(["nltk", "punkt", "stopwords", "stemmer"])
+    results = {
+        "nltk": benchmark(
+            texts, lambda batch: [preprocess_email_nltk(text) for text in batch],
+        ),
+        "fast (cold cache)": benchmark(texts, preprocess_emails),
+        "fast (warm cache)": benchmark(texts, preprocess_emails),
+    }
+    for name, throughput in results.items():
+        print(f"{name:18} {throughput:10.1f} emails/sec")  # noqa: WPS421
+
+
+if __name__ == "__main__":
+    main()
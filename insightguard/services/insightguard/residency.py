@@ -0,0 +1,180 @@
+"""
+Memory-budgeted residency of per-language models.
+
+Every loaded model stays in memory of every worker, although some languages
+get almost no traffic. :class:`ModelResidency` tracks size and last use
+of loaded models and unloads the least recently used ones above a memory
+budget, or after they were idle for a while. Pinned models are never
+unloaded, and models are never unloaded while a prediction uses them.
+Unloaded models are loaded again on their next use.
+"""
+import gc
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Iterable, Iterator, List, Set
+
+from insightguard.metrics import (MODEL_EVICTIONS, MODEL_RELOAD_TIME,
+                                  RESIDENT_MODEL_BYTES, RESIDENT_MODELS)
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    def __init__(self, size: int):
+        self.size = size
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+class ModelResidency:
+    """
+    Keeps loaded models within a memory budget.
+
+    :param model: model name used in metrics.
+    :param load: function returning the (cached) model of a key.
+    :param unload: function dropping the cached model of a key.
+    :param size: function returning memory used by a model in bytes, only
+        counting memory private to the process, not mapped shared weights.
+    :param budget: memory budget in bytes, 0 for unlimited.
+    :param pinned: keys of models that are never unloaded.
+    :param idle_ttl: unload models unused for this many seconds, 0 to disable.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        load: Callable[[str], Any],
+        unload: Callable[[str], None],
+        size: Callable[[Any], int],
+        budget: int = 0,
+        pinned: Iterable[str] = (),
+        idle_ttl: float = 0,
+    ):
+        self.model = model
+        self.load = load
+        self.unload = unload
+        self.size = size
+        self.budget = budget
+        self.pinned: Set[str] = set(pinned)
+        self.idle_ttl = idle_ttl
+        self._resident: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._evicted: Set[str] = set()
+        self._lock = Lock()
+
+    @property
+    def resident(self) -> List[str]:
+        """
+        Keys of loaded models, least recently used first.
+
+        :return: list of keys.
+        """
+        with self._lock:
+            return list(self._resident)
+
+    @property
+    def resident_bytes(self) -> int:
+        """
+        Memory used by loaded models.
+
+        :return: size in bytes.
+        """
+        with self._lock:
+            return sum(entry.size for entry in self._resident.values())
+
+    @contextmanager
+    def use(self, key: str) -> Iterator[Any]:
+        """
+        Load model if needed and keep it resident until the block exits.
+
+        :param key: key of the model, e.g. its language.
+        :yield: loaded model.
+        """
+        model = self._acquire(key)
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._resident[key].in_use -= 1
+            self.enforce()
+
+    def enforce(self) -> List[str]:
+        """
+        Unload idle models and least recently used ones above the budget.
+
+        :return: keys of unloaded models.
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            # The most recently used model stays even if it alone is over budget
+            for key, entry in list(self._resident.items())[:-1]:
+                if not self._evictable(key, entry):
+                    continue
+                if self.idle_ttl and now - entry.last_used > self.idle_ttl:
+                    evicted.append(self._evict(key, "idle"))
+                elif self.budget and self._total() > self.budget:
+                    evicted.append(self._evict(key, "memory"))
+            self._update_gauges()
+
+        if evicted:
+            gc.collect()
+        return evicted
+
+    def _acquire(self, key: str) -> Any:
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                entry.in_use += 1
+                entry.last_used = time.monotonic()
+                self._resident.move_to_end(key)
+
+        if entry is not None:
+            try:
+                return self.load(key)
+            except Exception:
+                with self._lock:
+                    entry.in_use -= 1
+                raise
+
+        start = time.perf_counter()
+        model = self.load(key)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is None:
+                entry = _Entry(self.size(model))
+                self._resident[key] = entry
+                if key in self._evicted:
+                    self._evicted.discard(key)
+                    MODEL_RELOAD_TIME.labels(self.model, key).observe(elapsed)
+                    logger.info(
+                        "Reloaded %s %s model in %.3fs", key, self.model, elapsed)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+            self._resident.move_to_end(key)
+            self._update_gauges()
+        return model
+
+    def _evictable(self, key: str, entry: _Entry) -> bool:
+        return key not in self.pinned and not entry.in_use
+
+    def _evict(self, key: str, reason: str) -> str:
+        entry = self._resident.pop(key)
+        self.unload(key)
+        self._evicted.add(key)
+        MODEL_EVICTIONS.labels(self.model, key, reason).inc()
+        logger.info(
+            "Unloaded %s %s model (%d MB, %s)",
+            key, self.model, entry.size // 2 ** 20, reason,
+        )
+        return key
+
+    def _total(self) -> int:
+        return sum(entry.size for entry in self._resident.values())
+
+    def _update_gauges(self) -> None:
+        RESIDENT_MODELS.labels(self.model).set(len(self._resident))
+        RESIDENT_MODEL_BYTES.labels(self.model).set(self._total())
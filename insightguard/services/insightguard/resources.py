@@ -0,0 +1,186 @@
+"""
+Lazy registry of heavy resources used by the classifiers.
+
+Importing tensorflow, transformers or pandas and downloading datasets or
+NLTK corpora takes seconds and needs network access, so nothing is loaded
+at import time. Every resource is loaded on first :meth:`ResourceRegistry.get`
+or explicitly with :meth:`ResourceRegistry.warmup`, and its load time is
+recorded.
+"""
+import logging
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DATASETS_DIR = Path(__file__).resolve().parent / "datasets"
+FRAUD_EMAILS_PATH = DATASETS_DIR / "fraud_email_.csv"
+
+
+class Resource:
+    """
+    Single lazily loaded resource.
+
+    :param name: name of the resource.
+    :param loader: function returning the resource.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self.loader = loader
+        self.load_time: Optional[float] = None
+        self._value: Any = None
+        self._loaded = False
+        self._lock = Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """
+        Whether the resource has been loaded already.
+
+        :return: True if loaded.
+        """
+        return self._loaded
+
+    def get(self) -> Any:
+        """
+        Return the resource, loading it on first use.
+
+        :return: loaded resource.
+        """
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                self._value = self.loader()
+                self.load_time = time.perf_counter() - start
+                self._loaded = True
+                logger.info("Loaded %s in %.3fs", self.name, self.load_time)
+        return self._value
+
+
+class ResourceRegistry:
+    """Registry of named lazy resources."""
+
+    def __init__(self) -> None:
+        self._resources: Dict[str, Resource] = {}
+
+    def register(self, name: str) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+        """
+        Register decorated function as loader of a resource.
+
+        :param name: name of the resource.
+        :return: decorator.
+        """
+
+        def decorator(loader: Callable[[], Any]) -> Callable[[], Any]:
+            self._resources[name] = Resource(name, loader)
+            return loader
+
+        return decorator
+
+    def get(self, name: str) -> Any:
+        """
+        Get resource by name, loading it if needed.
+
+        :param name: name of the resource.
+        :return: loaded resource.
+        """
+        return self._resources[name].get()
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """
+        Load resources ahead of the first request.
+
+        :param names: resources to load, all registered ones if not given.
+        :return: load time of every requested resource in seconds.
+        """
+        names = list(self._resources) if names is None else list(names)
+        for name in names:
+            self.get(name)
+        return {name: self._resources[name].load_time or 0.0 for name in names}
+
+    @property
+    def load_times(self) -> Dict[str, float]:
+        """
+        Load times of already loaded resources.
+
+        :return: mapping of resource name to load time in seconds.
+        """
+        return {
+            name: resource.load_time
+            for name, resource in self._resources.items()
+            if resource.loaded
+        }
+
+
+resources = ResourceRegistry()
+
+
+@resources.register("tensorflow")
+def _load_tensorflow() -> Any:
+    import tensorflow  # noqa: WPS433
+
+    return tensorflow
+
+
+@resources.register("transformers")
+def _load_transformers() -> Any:
+    import transformers  # noqa: WPS433
+
+    return transformers
+
+
+@resources.register("onnxruntime")
+def _load_onnxruntime() -> Any:
+    import onnxruntime  # noqa: WPS433
+
+    return onnxruntime
+
+
+@resources.register("nltk")
+def _load_nltk() -> Any:
+    import nltk  # noqa: WPS433
+
+    for path, package in (("corpora/stopwords", "stopwords"),
+                          ("tokenizers/punkt", "punkt")):
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(package, quiet=True)
+    return nltk
+
+
+@resources.register("stopwords")
+def _load_stopwords() -> Any:
+    nltk = resources.get("nltk")
+    return set(nltk.corpus.stopwords.words("english"))
+
+
+@resources.register("punkt")
+def _load_punkt() -> Any:
+    nltk = resources.get("nltk")
+    return nltk.data.load("tokenizers/punkt/english.pickle")
+
+
+@resources.register("stemmer")
+def _load_stemmer() -> Any:
+    nltk = resources.get("nltk")
+    return nltk.stem.PorterStemmer()
+
+
+@resources.register("phishing_url_dataset")
+def _load_phishing_url_dataset() -> Any:
+    from datasets import load_dataset  # noqa: WPS433
+
+    return load_dataset("Mitake/PhishingURLsANDBenignURLs")
+
+
+@resources.register("fraud_emails")
+def _load_fraud_emails() -> Any:
+    import pandas  # noqa: WPS433
+
+    return pandas.read_csv(FRAUD_EMAILS_PATH)
@@ -0,0 +1,392 @@
+"""
+Inference server shared by all web workers.
+
+The parent process imports model libraries, loads resources and bullying
+models on the ONNX backend, then forks inference workers, so their memory
+is shared copy-on-write. Web workers call them over a Unix socket with the
+"server" inference executor, so web and inference capacity scale
+independently.
+
+ONNX Runtime sessions survive a fork when they have no thread pool, so the
+server runs them on a single thread, workers and their threads run calls
+in parallel instead, see :func:`preload_models`. TensorFlow can't run in
+a process forked after it executed an operation, so every worker loads its
+TensorFlow models after the fork, see ``warmup_models``.
+
+Calls are pickled, so only local clients of the same user may connect.
+The socket is created with 0600 permissions in a directory other users
+can't write to, and clients check the server runs as their user before
+unpickling its responses, see :func:`check_peer`.
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import pickle  # noqa: S403
+import signal
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from insightguard.services.insightguard.weights import memory_usage
+from insightguard.settings import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("!I")
+# pid, uid and gid of SO_PEERCRED
+PEER_CREDENTIALS = struct.Struct("3i")
+# Workers exiting are restarted after this delay, doubled for every restart
+# of a worker that exited before running MAX_RESTART_DELAY seconds.
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+
+
+class RemoteError(Exception):
+    """Error of a call in the inference server that can't be pickled."""
+
+
+def _recv_exactly(connection: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer.")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def send_message(connection: socket.socket, message: Any) -> None:
+    """
+    Send a length prefixed pickled message.
+
+    :param connection: connected socket.
+    :param message: picklable message.
+    """
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    connection.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(connection: socket.socket) -> Any:
+    """
+    Receive a message sent with :func:`send_message`.
+
+    :param connection: connected socket.
+    :return: unpickled message.
+    """
+    (size,) = HEADER.unpack(_recv_exactly(connection, HEADER.size))
+    return pickle.loads(_recv_exactly(connection, size))  # noqa: S301
+
+
+def private_dir(path: Path) -> None:
+    """
+    Create a directory accessible only by the current user, or check an existing one.
+
+    :param path: directory.
+    :raises PermissionError: if it's owned by another user or writable by others.
+    """
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = path.stat()
+    if info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise PermissionError(
+            f"{path} must be owned by the current user and not writable by others.")
+
+
+def check_peer(connection: Any, socket_path: Path) -> None:
+    """
+    Check that the process on the other end of a Unix socket runs as the current user.
+
+    Responses are unpickled, so a socket bound by another user, e.g. while
+    the server isn't running, would run their code in the caller.
+    The owner of the socket file is checked where SO_PEERCRED is missing.
+
+    :param connection: connected socket.
+    :param socket_path: path of the socket.
+    :raises PermissionError: if the peer runs as another user.
+    """
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                            PEER_CREDENTIALS.size)
+        _, uid, _ = PEER_CREDENTIALS.unpack(credentials)
+    else:
+        uid = socket_path.stat().st_uid
+    if uid != os.getuid():
+        raise PermissionError(
+            f"Inference server on {socket_path} runs as user {uid}, "
+            f"not as the current user.")
+
+
+def call(function: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[bool, Any]:
+    """
+    Call function, timing it like the local executors do.
+
+    :param function: function to call.
+    :param args: arguments of the function.
+    :return: (True, (result, started, finished)) or (False, error).
+    """
+    started = time.time()
+    try:
+        result = function(*args)
+    except Exception as exc:
+        return False, exc
+    return True, (result, started, time.time())
+
+
+def handle(connection: socket.socket) -> None:
+    """
+    Serve a single call of a client and close the connection.
+
+    :param connection: accepted connection.
+    """
+    with connection:
+        try:
+            function, args = recv_message(connection)
+        except (ConnectionError, pickle.UnpicklingError, AttributeError, ImportError):
+            logger.warning("Invalid inference call", exc_info=True)
+            return
+        response = call(function, args)
+        try:
+            send_message(connection, response)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            send_message(connection, (False, RemoteError(repr(response[1]))))
+        except OSError:
+            logger.warning("Client of an inference call is gone")
+
+
+def preload_models(names: List[str]) -> List[str]:
+    """
+    Load models that are safe to fork in this process, so workers share them.
+
+    These are bullying models on the ONNX backend, their sessions are
+    created without a thread pool, as its threads wouldn't exist in workers.
+
+    :param names: models of the `warmup_models` setting.
+    :return: loaded models.
+    """
+    from insightguard.services.insightguard.models import warmup_model  # noqa: WPS433
+
+    preloaded = [
+        name for name in names if settings.bullying_backends.get(name) == "onnx"
+    ]
+    if preloaded and settings.onnx_threads != 1:
+        logger.info("ONNX models of the inference server run on a single thread")
+        settings.onnx_threads = 1
+    for name in preloaded:
+        logger.info("Preloaded %s in %.3fs", name, warmup_model(name))
+    return preloaded
+
+
+def serve(listener: socket.socket, threads: int, warmup: List[str]) -> None:
+    """
+    Main loop of an inference worker.
+
+    Connections are only accepted while a thread is free, so busy workers
+    leave them to others. Stops on SIGTERM after running calls finish.
+
+    :param listener: listening socket shared with other workers.
+    :param threads: number of calls run at once.
+    :param warmup: models loaded before accepting calls, preloaded ones are
+        only warmed up.
+    """
+    from insightguard.services.insightguard.models import warmup_model  # noqa: WPS433
+
+    stopping = threading.Event()
+
+    def stop(signum: int, frame: Any) -> None:  # noqa: WPS430
+        stopping.set()
+        listener.close()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for name in warmup:
+        logger.info("Worker %d warmed up %s in %.3fs", os.getpid(), name,
+                    warmup_model(name))
+    logger.info("Worker %d memory: %s", os.getpid(), memory_usage())
+
+    free = threading.BoundedSemaphore(threads)
+
+    def run(connection: socket.socket) -> None:  # noqa: WPS430
+        try:
+            handle(connection)
+        finally:
+            free.release()
+
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="inference")
+    with pool:
+        while not stopping.is_set():
+            free.acquire()
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                free.release()
+                if stopping.is_set():
+                    break
+                raise
+            pool.submit(run, connection)
+
+
+class InferenceServer:
+    """
+    Parent of forked inference workers listening on a Unix socket.
+
+    :param socket_path: path of the socket.
+    :param workers: number of forked worker processes.
+    :param threads: calls run at once by every worker.
+    :param warmup: models loaded by every worker before accepting calls.
+    """
+
+    def __init__(self, socket_path: Path, workers: int, threads: int,
+                 warmup: Optional[List[str]] = None):
+        self.socket_path = Path(socket_path)
+        self.workers = workers
+        self.threads = threads
+        self.warmup = warmup or []
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.started_at: Dict[int, float] = {}
+        self.restarts: Dict[int, int] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._listener: Optional[socket.socket] = None
+        self._stopping = False
+        self._context = multiprocessing.get_context("fork")
+
+    def start(self) -> None:
+        """Bind the socket and fork workers."""
+        private_dir(self.socket_path.parent)
+        self.socket_path.unlink(missing_ok=True)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            listener.bind(str(self.socket_path))
+        finally:
+            os.umask(old_umask)
+        listener.listen(socket.SOMAXCONN)
+        self._listener = listener
+
+        # Objects loaded so far are never freed, keep the collector
+        # from touching them, so their pages stay shared.
+        gc.freeze()
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+    def spawn(self, slot: int) -> None:
+        """
+        Fork a worker into a slot.
+
+        :param slot: index of the worker.
+        """
+        process = self._context.Process(
+            target=serve,
+            args=(self._listener, self.threads, self.warmup),
+            name=f"inference-{slot}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[slot] = process
+        self.started_at[slot] = time.monotonic()
+        logger.info("Started inference worker %d (pid %d)", slot, process.pid)
+
+    def check(self, timeout: float = 1) -> None:
+        """
+        Wait for workers to exit and restart them with a delay.
+
+        The delay doubles for workers that keep exiting soon after start,
+        e.g. because their models fail to load, so they don't fork in a loop.
+
+        :param timeout: seconds to wait.
+        """
+        now = time.monotonic()
+        for slot, restart_at in list(self._restart_at.items()):
+            if restart_at <= now and not self._stopping:
+                del self._restart_at[slot]
+                self.spawn(slot)
+        if self._restart_at:
+            timeout = min(timeout, max(min(self._restart_at.values()) - now, 0))
+
+        sentinels = {
+            process.sentinel: slot
+            for slot, process in self.processes.items()
+            if slot not in self._restart_at
+        }
+        for sentinel in wait(list(sentinels), timeout=timeout):
+            slot = sentinels[sentinel]  # type: ignore
+            process = self.processes[slot]
+            process.join()
+            if self._stopping:
+                return
+            uptime = time.monotonic() - self.started_at[slot]
+            if uptime >= MAX_RESTART_DELAY:
+                self.restarts[slot] = 0
+            restarts = self.restarts.get(slot, 0)
+            delay = min(RESTART_DELAY * 2 ** restarts, MAX_RESTART_DELAY)
+            self.restarts[slot] = restarts + 1
+            logger.error(
+                "Inference worker %d (pid %d) exited with %s after %.1fs, "
+                "restarting in %.1fs",
+                slot, process.pid, process.exitcode, uptime, delay,
+            )
+            self._restart_at[slot] = time.monotonic() + delay
+
+    def supervise(self) -> None:
+        """Respawn workers that exited until :meth:`stop` is called."""
+        while not self._stopping:
+            self.check()
+
+    def stop(self, timeout: float = 30) -> None:
+        """
+        Stop workers and remove the socket.
+
+        :param timeout: seconds to wait for running calls.
+        """
+        self._stopping = True
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():  # noqa: WPS440
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        self.socket_path.unlink(missing_ok=True)
+
+
+def main(workers: Optional[int] = None) -> None:
+    """
+    Entrypoint of the inference server.
+
+    :param workers: number of worker processes.
+    """
+    logging.basicConfig(level=settings.log_level.value)
+
+    # Imported before forking, so all workers share the libraries.
+    import insightguard.services.insightguard.models  # noqa: F401, WPS301, WPS433
+    from insightguard.services.insightguard.resources import resources  # noqa: WPS433
+
+    resources.warmup(settings.preload_resources)
+    preload_models(settings.warmup_models)
+    server = InferenceServer(
+        settings.inference_server_socket,
+        workers=workers or settings.inference_server_workers,
+        threads=settings.inference_workers,
+        warmup=settings.warmup_models,
+    )
+
+    def stop(signum: int, frame: Any) -> None:  # noqa: WPS430
+        server._stopping = True  # noqa: WPS437
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.start()
+    logger.info("Inference server listening on %s", server.socket_path)
+    try:
+        server.supervise()
+    finally:
+        server.stop()
@@ -0,0 +1,351 @@
+"""
+Index of known phishing and benign URLs, checked before the URL model.
+
+The index has an exact-match table of labeled URLs, exported from the
+training dataset with::
+
+    python -m insightguard.services.insightguard.url_index build
+
+and extended by operator blocklist files. Blocklist lines are URLs or
+domains, ``#`` starts a comment. Blocked domains (and their subdomains)
+are kept in a Bloom filter. Domains of dataset URLs aren't blocked, as
+phishing pages are often hosted on shared domains.
+
+Lookups check the files for changes at most every check interval. A changed
+index is built aside and swapped in at once, so lookups never see a partial one.
+"""
+import argparse
+import hashlib
+import logging
+import math
+import os
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from insightguard.services.insightguard.resources import resources
+from insightguard.settings import settings
+
+logger = logging.getLogger(__name__)
+
+PHISHING = 1.0
+BENIGN = 0.0
+
+
+class BloomFilter:
+    """
+    Set membership with a bounded false positive rate and no false negatives.
+
+    :param capacity: expected number of items.
+    :param error_rate: false positive rate at capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    def add(self, item: str) -> None:
+        """
+        Add item to the filter.
+
+        :param item: item to add.
+        """
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + index * second) % self.size for index in range(self.hashes))
+
+
+def url_key(url: str) -> str:
+    """
+    Key of an URL in the index.
+
+    Scheme, credentials and fragment are dropped, host is lowercased
+    and trailing slashes are removed.
+
+    :param url: URL with or without scheme.
+    :raises ValueError: if the URL is malformed, e.g. has an invalid IPv6 host.
+    :return: key of the URL.
+    """
+    url = url.strip()
+    parts = urlsplit(url if "://" in url else f"//{url}")
+    key = parts.netloc.rsplit("@", 1)[-1].lower() + parts.path.rstrip("/")
+    if parts.query:
+        key = f"{key}?{parts.query}"
+    return key
+
+
+def parent_domains(key: str) -> List[str]:
+    """
+    Host of an URL key and its parent domains, without the top-level one.
+
+    :param key: key from :func:`url_key`.
+    :return: domains from the most specific one.
+    """
+    host = key.split("/", 1)[0].split("?", 1)[0].split(":", 1)[0]
+    labels = host.rstrip(".").split(".")
+    return [".".join(labels[index:]) for index in range(max(len(labels) - 1, 1))]
+
+
+class URLIndex:
+    """
+    Immutable snapshot of known URLs and blocked domains.
+
+    :param labels: scores of known URLs by their key.
+    :param domains: blocked domains.
+    :param error_rate: false positive rate of the domain filter.
+    :param skipped: number of malformed lines skipped while loading.
+    """
+
+    def __init__(self, labels: Dict[str, float], domains: Sequence[str],
+                 error_rate: float, skipped: int = 0):
+        self.labels = labels
+        self.skipped = skipped
+        self.domain_count = len(domains)
+        self.domains = BloomFilter(len(domains), error_rate)
+        for domain in domains:
+            self.domains.add(domain)
+
+    def __len__(self) -> int:
+        return len(self.labels) + self.domain_count
+
+    def lookup(self, url: str) -> Optional[float]:
+        """
+        Score of a known URL.
+
+        Known phishing URLs and blocked domains win over known benign URLs.
+        Malformed URLs are unknown, so the model scores them.
+
+        :param url: URL to look up.
+        :return: 1.0 for phishing, 0.0 for benign, None if unknown.
+        """
+        try:
+            key = url_key(url)
+        except ValueError:
+            return None
+        score = self.labels.get(key)
+        if score == PHISHING:
+            return score
+        if self.domain_count and any(
+            domain in self.domains for domain in parent_domains(key)
+        ):
+            return PHISHING
+        return score
+
+
+def load_index(dataset_path: Path, blocklist_paths: Sequence[Path],
+               error_rate: float) -> URLIndex:
+    """
+    Build index from the dataset export and blocklist files.
+
+    Malformed lines are skipped with a warning and counted.
+
+    :param dataset_path: TSV with ``label<TAB>url`` lines, skipped if missing.
+    :param blocklist_paths: files with blocked URLs and domains.
+    :param error_rate: false positive rate of the domain filter.
+    :return: built index.
+    """
+    labels: Dict[str, float] = {}
+    skipped = 0
+    if Path(dataset_path).exists():
+        with open(dataset_path, encoding="utf-8") as dataset:
+            for number, line in enumerate(dataset, 1):
+                label, _, url = line.rstrip("\n").partition("\t")
+                if not url:
+                    continue
+                try:
+                    labels[url_key(url)] = float(label)
+                except ValueError:
+                    logger.warning(
+                        "Skipping malformed line %d of %s", number, dataset_path)
+                    skipped += 1
+
+    domains = []
+    for path in blocklist_paths:
+        with open(path, encoding="utf-8") as blocklist:
+            for number, line in enumerate(blocklist, 1):  # noqa: WPS440
+                entry = line.split("#", 1)[0].strip()
+                if not entry:
+                    continue
+                if "/" not in entry and ":" not in entry:
+                    domains.append(entry.lower().rstrip("."))
+                    continue
+                try:
+                    labels[url_key(entry)] = PHISHING
+                except ValueError:
+                    logger.warning("Skipping malformed line %d of %s", number, path)
+                    skipped += 1
+    return URLIndex(labels, domains, error_rate, skipped)
+
+
+class URLIndexStore:
+    """
+    Keeps the index in sync with its files.
+
+    :param dataset_path: TSV exported from the dataset.
+    :param blocklist_paths: operator blocklist files.
+    :param error_rate: false positive rate of the domain filter.
+    :param check_interval: seconds between checks for changed files.
+    """
+
+    def __init__(self, dataset_path: Path, blocklist_paths: Sequence[Path],
+                 error_rate: float, check_interval: float):
+        self.dataset_path = Path(dataset_path)
+        self.blocklist_paths = [Path(path) for path in blocklist_paths]
+        self.error_rate = error_rate
+        self.check_interval = check_interval
+        self._index: Optional[URLIndex] = None
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self._lock = Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """
+        Whether the index was loaded in this process.
+
+        :return: True once the first refresh finished.
+        """
+        return self._index is not None
+
+    @property
+    def index(self) -> URLIndex:
+        """
+        Current index, rebuilt first if its files changed.
+
+        :return: index snapshot.
+        """
+        stale = time.monotonic() - self._checked_at > self.check_interval
+        if self._index is None or stale:
+            self.refresh()
+        return self._index
+
+    def lookup_many(self, urls: Iterable[str],
+                    refresh: bool = True) -> Dict[str, float]:
+        """
+        Scores of known URLs.
+
+        :param urls: URLs to look up.
+        :param refresh: check files for changes first. Without it nothing is
+            found until the index was loaded, so it's safe on the event loop.
+        :return: scores of URLs found in the index.
+        """
+        index = self.index if refresh else self._index
+        if index is None:
+            return {}
+        found = {}
+        for url in urls:
+            score = index.lookup(url)
+            if score is not None:
+                found[url] = score
+        return found
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the index if any of its files changed.
+
+        Errors are logged and the previous index is kept.
+
+        :return: True if the index was rebuilt.
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._file_signature()
+            if self._index is not None and signature == self._signature:
+                return False
+            start = time.perf_counter()
+            try:
+                index = load_index(
+                    self.dataset_path, self.blocklist_paths, self.error_rate)
+            except (OSError, ValueError):
+                logger.exception("Can't load URL index, keeping the previous one.")
+                if self._index is None:
+                    self._index = URLIndex({}, [], self.error_rate)
+                return False
+            self._index = index
+            self._signature = signature
+            logger.info(
+                "Loaded URL index of %d entries in %.3fs, skipped %d malformed lines",
+                len(index), time.perf_counter() - start, index.skipped,
+            )
+            return True
+
+    def _file_signature(self) -> Tuple:
+        signature = []
+        for path in [self.dataset_path, *self.blocklist_paths]:
+            try:
+                stat = path.stat()
+            except OSError:
+                signature.append((str(path), None))
+            else:
+                signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+
+def export_dataset(output: Path, label_column: str, phishing_label: int) -> int:
+    """
+    Export labeled URLs of the training dataset as the index TSV.
+
+    The file is replaced atomically, so running workers never read it half written.
+
+    :param output: destination file.
+    :param label_column: column of the dataset with labels.
+    :param phishing_label: value of the label marking phishing URLs.
+    :return: number of exported URLs.
+    """
+    data = resources.get("phishing_url_dataset")["train"]
+    temporary = output.with_suffix(f"{output.suffix}.tmp")
+    count = 0
+    with open(temporary, "w", encoding="utf-8") as export:
+        for url, label in zip(data["url"], data[label_column]):
+            url = url.strip()
+            if url and "\t" not in url and "\n" not in url:
+                export.write(f"{int(label == phishing_label)}\t{url}\n")
+                count += 1
+    os.replace(temporary, output)
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Build the URL index from the training dataset.
+
+    :param argv: command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Manage the known URL index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Export the labeled dataset.")
+    build_parser.add_argument(
+        "--output", type=Path, default=settings.phishing_index_path)
+    build_parser.add_argument("--label-column", default="label")
+    build_parser.add_argument("--phishing-label", type=int, default=1)
+
+    args = parser.parse_args(argv)
+    count = export_dataset(args.output, args.label_column, args.phishing_label)
+    print(f"Exported {count} URLs to {args.output}")  # noqa: WPS421
+
+
+url_index = URLIndexStore(
+    settings.phishing_index_path,
+    settings.phishing_blocklist_files,
+    error_rate=settings.phishing_index_error_rate,
+    check_interval=settings.phishing_index_check_interval,
+)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Frozen vocabularies for the phishing classifiers.
+
+Keras ``Tokenizer`` objects used to be fitted on the training data at request
+time. This module fits the word index once, stores it as a small versioned
+JSON file next to the model and reproduces ``Tokenizer.texts_to_sequences``
+and ``pad_sequences`` without importing keras.
+
+Artifacts are built with::
+
+    python -m insightguard.services.insightguard.vocabulary url
+    python -m insightguard.services.insightguard.vocabulary email
+"""
+import argparse
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from insightguard.services.insightguard.resources import FRAUD_EMAILS_PATH
+
+# Bump when the layout of the artifact changes.
+FORMAT_VERSION = 1
+
+# Defaults of ``keras.preprocessing.text.Tokenizer``.
+KERAS_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+MODELS_DIR = Path(__file__).resolve().parent / "models"
+URL_VOCABULARY_PATH = MODELS_DIR / "phishing.vocab.json"
+EMAIL_VOCABULARY_PATH = MODELS_DIR / "phishing-email.vocab.json"
+
+
+class FrozenVocabulary:
+    """
+    Read-only word index compatible with ``keras.preprocessing.text.Tokenizer``.
+
+    Only words that ``texts_to_sequences`` can emit (index below ``num_words``)
+    are kept, so the artifact stays compact.
+
+    :param word_index: mapping of word to its index (starting from 1).
+    :param num_words: size of the vocabulary the model was trained with.
+    :param filters: characters replaced by ``split`` before splitting.
+    :param lower: lowercase texts before splitting.
+    :param split: separator used to split texts into words.
+    :param metadata: free-form information about how the vocabulary was built.
+    """
+
+    def __init__(
+        self,
+        word_index: Dict[str, int],
+        num_words: Optional[int] = None,
+        filters: str = KERAS_FILTERS,
+        lower: bool = True,
+        split: str = " ",
+        metadata: Optional[Dict[str, str]] = None,
+    ):
+        if num_words:
+            word_index = {
+                word: index for word, index in word_index.items() if index < num_words
+            }
+        self.word_index = word_index
+        self.num_words = num_words
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.metadata = metadata or {}
+        self._translate_map = str.maketrans({char: split for char in filters})
+
+    def __len__(self) -> int:
+        return len(self.word_index)
+
+    @classmethod
+    def fit(cls, texts: Iterable[str], num_words: Optional[int] = None,
+            **kwargs) -> "FrozenVocabulary":
+        """
+        Build a vocabulary the same way ``Tokenizer.fit_on_texts`` does.
+
+        Words are ranked by frequency, ties keep the order of first occurrence.
+
+        :param texts: training texts.
+        :param num_words: size of the vocabulary.
+        :param kwargs: tokenization options, see class docstring.
+        :return: fitted vocabulary.
+        """
+        vocabulary = cls({}, num_words=num_words, **kwargs)
+        word_counts: Dict[str, int] = OrderedDict()
+        for text in texts:
+            for word in vocabulary.text_to_word_sequence(text):
+                word_counts[word] = word_counts.get(word, 0) + 1
+
+        ranked = sorted(word_counts.items(), key=lambda item: item[1], reverse=True)
+        word_index = {word: index for index, (word, _) in enumerate(ranked, start=1)}
+        return cls(word_index, num_words=num_words, **kwargs)
+
+    def text_to_word_sequence(self, text: str) -> List[str]:
+        """
+        Split text into words, mirrors ``keras`` ``text_to_word_sequence``.
+
+        :param text: input text.
+        :return: list of words.
+        """
+        if self.lower:
+            text = text.lower()
+        return [word for word in text.translate(self._translate_map).split(self.split)
+                if word]
+
+    def texts_to_sequences(self, texts: Iterable[str]) -> List[List[int]]:
+        """
+        Turn texts into lists of word indexes, unknown words are skipped.
+
+        :param texts: input texts.
+        :return: list of sequences.
+        """
+        word_index = self.word_index
+        return [
+            [word_index[word] for word in self.text_to_word_sequence(text)
+             if word in word_index]
+            for text in texts
+        ]
+
+    def save(self, path: Path) -> None:
+        """
+        Store vocabulary as JSON.
+
+        :param path: destination file.
+        """
+        payload = {
+            "format_version": FORMAT_VERSION,
+            "num_words": self.num_words,
+            "filters": self.filters,
+            "lower": self.lower,
+            "split": self.split,
+            "metadata": self.metadata,
+            "word_index": self.word_index,
+        }
+        Path(path).write_text(
+            json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "FrozenVocabulary":
+        """
+        Load vocabulary stored with :meth:`save`.
+
+        :param path: vocabulary file.
+        :raises ValueError: if file was written by an incompatible version.
+        :return: loaded vocabulary.
+        """
+        payload = json.loads(Path(path).read_text(encoding="utf-8"))
+        if payload.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported vocabulary format {payload.get('format_version')} "
+                f"in {path}, expected {FORMAT_VERSION}.",
+            )
+        return cls(
+            payload["word_index"],
+            num_words=payload["num_words"],
+            filters=payload["filters"],
+            lower=payload["lower"],
+            split=payload["split"],
+            metadata=payload.get("metadata"),
+        )
+
+
+def pad_sequences(sequences: Sequence[List[int]], maxlen: int) -> np.ndarray:
+    """
+    Pad and truncate sequences at the front, like ``keras.utils.pad_sequences``.
+
+    :param sequences: list of sequences.
+    :param maxlen: length of the output rows.
+    :return: int32 matrix of shape (len(sequences), maxlen).
+    """
+    padded = np.zeros((len(sequences), maxlen), dtype="int32")
+    for row, sequence in enumerate(sequences):
+        if sequence:
+            trimmed = sequence[-maxlen:]
+            padded[row, -len(trimmed):] = trimmed
+    return padded
+
+
+def build_url_vocabulary(num_words: int = 10000) -> FrozenVocabulary:
+    """
+    Fit the URL vocabulary on the phishing dataset.
+
+    :param num_words: size of the vocabulary.
+    :return: fitted vocabulary.
+    """
+    from datasets import load_dataset  # noqa: WPS433
+
+    dataset_name = "Mitake/PhishingURLsANDBenignURLs"
+    data = load_dataset(dataset_name)
+    return FrozenVocabulary.fit(
+        data["train"]["url"],
+        num_words=num_words,
+        metadata={"source": dataset_name, "split": "train"},
+    )
+
+
+def build_email_vocabulary(
+    csv_path: Path = FRAUD_EMAILS_PATH,
+    num_words: int = 10000,
+) -> FrozenVocabulary:
+    """
+    Fit the email vocabulary on preprocessed emails of the training CSV.
+
+    :param csv_path: CSV with emails in the ``Text`` column.
+    :param num_words: size of the vocabulary.
+    :return: fitted vocabulary.
+    """
+    import pandas  # noqa: WPS433
+
+    from insightguard.services.insightguard.preprocessing import (  # noqa: WPS433
+        preprocess_emails,
+    )
+
+    emails = pandas.read_csv(csv_path)["Text"]
+    return FrozenVocabulary.fit(
+        preprocess_emails(emails),
+        num_words=num_words,
+        metadata={"source": Path(csv_path).name, "column": "Text"},
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Build vocabulary artifacts.
+
+    :param argv: command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    url_parser = commands.add_parser("url", help="Fit the phishing URL vocabulary.")
+    url_parser.add_argument("--output", type=Path, default=URL_VOCABULARY_PATH)
+    url_parser.add_argument("--num-words", type=int, default=10000)
+
+    email_parser = commands.add_parser(
+        "email", help="Fit the phishing email vocabulary.")
+    email_parser.add_argument("--input", type=Path, default=FRAUD_EMAILS_PATH)
+    email_parser.add_argument("--output", type=Path, default=EMAIL_VOCABULARY_PATH)
+    email_parser.add_argument("--num-words", type=int, default=10000)
+
+    args = parser.parse_args(argv)
+    if args.command == "url":
+        vocabulary = build_url_vocabulary(args.num_words)
+    else:
+        vocabulary = build_email_vocabulary(args.input, args.num_words)
+    vocabulary.save(args.output)
+    print(f"Saved {len(vocabulary)} words to {args.output}")  # noqa: WPS421
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Memory-mapped model weights.
+
+Weights are stored as one ``.npy`` file per tensor and loaded with
+``mmap_mode``, so all processes on a host share the same page cache pages
+instead of private copies. Exported ONNX models keep their large
+initializers in such a store, referenced as ONNX external data, so they
+also load without it.
+
+:func:`memory_usage` reports how much memory of a process is shared.
+"""
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+SMAPS_ROLLUP = Path("/proc/self/smaps_rollup")
+
+# Initializers smaller than this stay inside the ONNX model.
+EXTERNAL_SIZE_THRESHOLD = 1024
+
+
+def weights_dir(model_path: Path) -> Path:
+    """
+    Directory of the weights of a model file.
+
+    :param model_path: path to the model, e.g. model.int8.onnx.
+    :return: path to the weights, e.g. model.int8.weights.
+    """
+    return Path(model_path).with_suffix(".weights")
+
+
+def save_weights(
+    arrays: Dict[str, np.ndarray],
+    directory: Path,
+) -> Dict[str, Tuple[str, int, int]]:
+    """
+    Replace a weight store with the given arrays.
+
+    :param arrays: weights by tensor name.
+    :param directory: destination directory.
+    :return: file, data offset and length in bytes of every tensor.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+    manifest = {}
+    locations = {}
+    for index, (name, array) in enumerate(arrays.items()):
+        file_name = f"{index:05d}.npy"
+        path = directory / file_name
+        array = np.ascontiguousarray(array)
+        np.save(path, array)
+        manifest[name] = file_name
+        locations[name] = (file_name, path.stat().st_size - array.nbytes, array.nbytes)
+    (directory / MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return locations
+
+
+def load_weights(directory: Path) -> Dict[str, np.ndarray]:
+    """
+    Map weights of a store into memory, read only.
+
+    :param directory: directory written by :func:`save_weights`.
+    :return: weights by tensor name.
+    """
+    manifest = json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+    return {
+        name: np.load(directory / file_name, mmap_mode="r")
+        for name, file_name in manifest.items()
+    }
+
+
+def externalize_onnx(model_path: Path) -> Path:
+    """
+    Move large initializers of an ONNX model into a weight store.
+
+    The model references them as external data at their offsets in
+    the ``.npy`` files, so weights are stored once.
+
+    :param model_path: path to the model, rewritten in place.
+    :return: directory of the weights.
+    """
+    import onnx  # noqa: WPS433
+    from onnx import numpy_helper  # noqa: WPS433
+    from onnx.external_data_helper import set_external_data  # noqa: WPS433
+
+    model = onnx.load(str(model_path))
+    tensors = {}
+    arrays = {}
+    for tensor in model.graph.initializer:
+        if tensor.data_type == onnx.TensorProto.STRING:
+            continue
+        array = numpy_helper.to_array(tensor)
+        if array.nbytes >= EXTERNAL_SIZE_THRESHOLD:
+            tensors[tensor.name] = tensor
+            arrays[tensor.name] = array
+
+    directory = weights_dir(model_path)
+    locations = save_weights(arrays, directory)
+    for name, (file_name, offset, length) in locations.items():
+        tensor = tensors[name]
+        for field in ("raw_data", "float_data", "int32_data", "int64_data",
+                      "double_data", "uint64_data"):
+            tensor.ClearField(field)
+        set_external_data(tensor, location=f"{directory.name}/{file_name}",
+                          offset=offset, length=length)
+        tensor.data_location = onnx.TensorProto.EXTERNAL
+    onnx.save_model(model, str(model_path))
+    return directory
+
+
+def memory_usage(path: Path = SMAPS_ROLLUP) -> Dict[str, int]:
+    """
+    Memory of the current process split into shared and unique pages.
+
+    Pages of mapped weights used by several workers count as shared,
+    PSS divides them between the processes sharing them.
+
+    :param path: smaps_rollup file of the process.
+    :return: rss, pss, shared and private bytes, empty if not on Linux.
+    """
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return {}
+
+    fields: Dict[str, int] = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        parts = value.split()
+        if len(parts) == 2 and parts[1] == "kB":
+            fields[name] = int(parts[0]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
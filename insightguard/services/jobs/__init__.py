@@ -0,0 +1 @@
+"""Asynchronous scan jobs."""
@@ -0,0 +1,331 @@
+"""
+Redis-backed queue of scan jobs.
+
+A job is a hash ``job:{id}`` with its status and progress, a list of input
+items ``job:{id}:items`` and a list of results ``job:{id}:results``, one per
+processed item. Ids of queued jobs wait in ``jobs:queue``. A worker claims
+a job by moving its id to ``jobs:processing`` and holds a lease on it in
+``jobs:leases``, renewed with every processed chunk. A job is acked when
+it is done or failed. Jobs of crashed workers are requeued once their lease
+expires, and resume after the last stored result.
+
+Every claim gets a new lease token, and claims, results and acks are
+atomic scripts checking it. A worker whose lease expired and was claimed
+by another can't store results or finish the job anymore.
+"""
+import json
+import math
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from redis.asyncio import ConnectionPool, Redis
+
+QUEUE = "jobs:queue"
+PROCESSING = "jobs:processing"
+LEASES = "jobs:leases"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Moves the oldest queued job to processing and leases it with a new token.
+# The job hash key is derived from the id, which isn't known in advance.
+# ARGV: lease deadline, token, now, job key prefix, running status.
+CLAIM_SCRIPT = """
+local job_id = redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'LEFT')
+if not job_id then
+    return false
+end
+local job = ARGV[4] .. job_id
+if redis.call('EXISTS', job) == 0 then
+    redis.call('LREM', KEYS[2], 0, job_id)
+    return false
+end
+redis.call('ZADD', KEYS[3], ARGV[1], job_id)
+redis.call('HSET', job, 'status', ARGV[5], 'lease', ARGV[2])
+redis.call('HSETNX', job, 'started_at', ARGV[3])
+redis.call('HINCRBY', job, 'attempts', 1)
+return job_id
+"""
+
+# Appends results if the lease is held and they continue the stored ones.
+# KEYS: job hash, results, leases.
+# ARGV: job id, token, offset, lease deadline, results...
+ADD_RESULTS_SCRIPT = """
+local unpack = unpack or table.unpack
+if redis.call('HGET', KEYS[1], 'lease') ~= ARGV[2]
+        or not redis.call('ZSCORE', KEYS[3], ARGV[1])
+        or redis.call('LLEN', KEYS[2]) ~= tonumber(ARGV[3]) then
+    return 0
+end
+for first = 5, #ARGV, 1000 do
+    redis.call('RPUSH', KEYS[2], unpack(ARGV, first, math.min(first + 999, #ARGV)))
+end
+redis.call('HSET', KEYS[1], 'processed', redis.call('LLEN', KEYS[2]))
+redis.call('ZADD', KEYS[3], 'XX', ARGV[4], ARGV[1])
+return 1
+"""
+
+# Scripts below get KEYS: processing, leases, job hash, items, results, queue.
+FINISH = """
+local function finish(job_id, status, error, finished_at, ttl)
+    redis.call('LREM', KEYS[1], 0, job_id)
+    redis.call('ZREM', KEYS[2], job_id)
+    redis.call('HSET', KEYS[3], 'status', status, 'error', error,
+               'finished_at', finished_at)
+    redis.call('HDEL', KEYS[3], 'lease')
+    for index = 3, 5 do
+        redis.call('EXPIRE', KEYS[index], ttl)
+    end
+end
+"""
+
+# ARGV: job id, token, status, error, now, ttl.
+ACK_SCRIPT = FINISH + """
+if redis.call('HGET', KEYS[3], 'lease') ~= ARGV[2] then
+    return 0
+end
+finish(ARGV[1], ARGV[3], ARGV[4], ARGV[5], ARGV[6])
+return 1
+"""
+
+# Requeues the job, or fails it after max attempts. Without a token only
+# an expired lease is released. Unless the claim counts as an attempt, the
+# job is requeued and its attempt taken back.
+# ARGV: job id, token, now, max attempts, error, ttl, queued and failed status,
+# "1" if the claim counts as an attempt.
+RELEASE_SCRIPT = FINISH + """
+local deadline = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not deadline then
+    return ''
+end
+if ARGV[2] == '' then
+    if tonumber(deadline) > tonumber(ARGV[3]) then
+        return ''
+    end
+elseif redis.call('HGET', KEYS[3], 'lease') ~= ARGV[2] then
+    return ''
+end
+local attempts = tonumber(redis.call('HGET', KEYS[3], 'attempts') or '0')
+if ARGV[9] ~= '1' then
+    redis.call('HINCRBY', KEYS[3], 'attempts', -1)
+elseif attempts >= tonumber(ARGV[4]) then
+    finish(ARGV[1], ARGV[8], ARGV[5], ARGV[3], ARGV[6])
+    return ARGV[8]
+end
+redis.call('LREM', KEYS[1], 0, ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[3], 'status', ARGV[7])
+redis.call('HDEL', KEYS[3], 'lease')
+redis.call('RPUSH', KEYS[6], ARGV[1])
+return ARGV[7]
+"""
+
+
+class Lease(NamedTuple):
+    """Claimed job and the token its updates are checked against."""
+
+    job_id: str
+    token: str
+
+
+def job_key(job_id: str, part: str = "") -> str:
+    """
+    Redis key of a job.
+
+    :param job_id: id of the job.
+    :param part: "items", "results" or empty for the job hash.
+    :return: redis key.
+    """
+    return f"job:{job_id}:{part}" if part else f"job:{job_id}"
+
+
+class JobQueue:
+    """
+    Queue of scan jobs with at-least-once processing.
+
+    :param redis_pool: redis connection pool.
+    :param lease: seconds a worker holds a job without progress.
+    :param max_attempts: attempts before a job fails.
+    :param ttl: seconds finished jobs and their results are kept.
+    """
+
+    def __init__(self, redis_pool: ConnectionPool, lease: float, max_attempts: int,
+                 ttl: int):
+        self.redis_pool = redis_pool
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+
+    async def submit(self, kind: str, items: List[Any], owner: str) -> str:
+        """
+        Store job and put it in the queue.
+
+        :param kind: kind of the scan, e.g. "bullying".
+        :param items: input items, JSON serializable.
+        :param owner: hash of the API key that submitted the job.
+        :return: id of the job.
+        """
+        job_id = uuid.uuid4().hex
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.hset(job_key(job_id), mapping={
+                    "id": job_id,
+                    "kind": kind,
+                    "owner": owner,
+                    "status": QUEUED,
+                    "total": len(items),
+                    "processed": 0,
+                    "attempts": 0,
+                    "created_at": time.time(),
+                })
+                if items:
+                    pipe.rpush(job_key(job_id, "items"),
+                               *(json.dumps(item) for item in items))
+                pipe.lpush(QUEUE, job_id)
+                await pipe.execute()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, str]]:
+        """
+        Get status and progress of a job.
+
+        :param job_id: id of the job.
+        :return: job hash, None if it doesn't exist.
+        """
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            job = await redis.hgetall(job_key(job_id))
+        return {key.decode(): value.decode() for key, value in job.items()} or None
+
+    async def items(self, job_id: str, offset: int, limit: int) -> List[Any]:
+        """
+        Get input items of a job.
+
+        :param job_id: id of the job.
+        :param offset: index of the first item.
+        :param limit: maximum number of items.
+        :return: items.
+        """
+        return await self._range(job_key(job_id, "items"), offset, limit)
+
+    async def results(self, job_id: str, offset: int, limit: int) -> List[Any]:
+        """
+        Get a page of results of a job.
+
+        :param job_id: id of the job.
+        :param offset: index of the first result.
+        :param limit: maximum number of results.
+        :return: results, in order of items.
+        """
+        return await self._range(job_key(job_id, "results"), offset, limit)
+
+    async def claim(self, timeout: int = 0) -> Optional[Lease]:
+        """
+        Take the oldest queued job and lease it.
+
+        :param timeout: whole seconds to wait for a job, 0 to not wait.
+        :return: lease of the job, None if none was queued.
+        """
+        deadline = time.monotonic() + timeout
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            claim = redis.register_script(CLAIM_SCRIPT)
+            while True:  # noqa: WPS457
+                token = uuid.uuid4().hex
+                now = time.time()
+                job_id = await claim(
+                    keys=[QUEUE, PROCESSING, LEASES],
+                    args=[now + self.lease, token, now, job_key(""), RUNNING],
+                )
+                if job_id is not None:
+                    return Lease(job_id.decode(), token)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                # Wait until a job is queued without taking it, then race for it
+                await redis.blmove(QUEUE, QUEUE, math.ceil(remaining), "RIGHT", "RIGHT")
+
+    async def add_results(self, lease: Lease, offset: int, results: List[Any]) -> bool:
+        """
+        Store results of the next chunk of items and renew the lease.
+
+        Results are stored only while the lease is held and ``offset`` is the
+        number of stored results, so a worker that lost its lease can't add
+        duplicate results.
+
+        :param lease: lease of the job.
+        :param offset: index of the first item of the chunk.
+        :param results: results in order of items.
+        :return: whether results were stored, False if the lease was lost.
+        """
+        job_id = lease.job_id
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            stored = await redis.register_script(ADD_RESULTS_SCRIPT)(
+                keys=[job_key(job_id), job_key(job_id, "results"), LEASES],
+                args=[job_id, lease.token, offset, time.time() + self.lease,
+                      *(json.dumps(result) for result in results)],
+            )
+        return bool(stored)
+
+    async def ack(self, lease: Lease, status: str = DONE, error: str = "") -> bool:
+        """
+        Finish job, its data expires after the TTL.
+
+        :param lease: lease of the job.
+        :param status: final status, done or failed.
+        :param error: reason of a failure.
+        :return: whether the job was finished, False if the lease was lost.
+        """
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            finished = await redis.register_script(ACK_SCRIPT)(
+                keys=self._keys(lease.job_id),
+                args=[lease.job_id, lease.token, status, error, time.time(), self.ttl],
+            )
+        return bool(finished)
+
+    async def release(self, job_id: str, error: str = "", token: str = "",
+                      attempt: bool = True) -> str:
+        """
+        Put a claimed job back to the queue, or fail it after too many attempts.
+
+        Without a token only an expired lease is released. Only the caller
+        that removes the lease releases the job, so a job is requeued once
+        even if many workers see its lease expire.
+
+        :param job_id: id of the job.
+        :param error: reason of the release.
+        :param token: token of the lease held by the caller.
+        :param attempt: count the claim as an attempt, False for transient
+            errors, e.g. a full inference queue.
+        :return: new status of the job, empty if the lease wasn't released.
+        """
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            status = await redis.register_script(RELEASE_SCRIPT)(
+                keys=self._keys(job_id),
+                args=[job_id, token, time.time(), self.max_attempts,
+                      error or "Too many attempts.", self.ttl, QUEUED, FAILED,
+                      int(attempt)],
+            )
+        return status.decode()
+
+    async def expired(self) -> List[str]:
+        """
+        Ids of claimed jobs whose lease expired, e.g. after a worker crashed.
+
+        :return: ids of the jobs.
+        """
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            job_ids = await redis.zrangebyscore(LEASES, "-inf", time.time())
+        return [job_id.decode() for job_id in job_ids]
+
+    def _keys(self, job_id: str) -> List[str]:
+        return [PROCESSING, LEASES, job_key(job_id), job_key(job_id, "items"),
+                job_key(job_id, "results"), QUEUE]
+
+    async def _range(self, key: str, offset: int, limit: int) -> List[Any]:
+        if limit <= 0:
+            return []
+        async with Redis(connection_pool=self.redis_pool) as redis:
+            values = await redis.lrange(key, offset, offset + limit - 1)
+        return [json.loads(value) for value in values]
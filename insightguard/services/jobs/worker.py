@@ -0,0 +1,247 @@
+"""
+Worker processing scan jobs, started with::
+
+    python -m insightguard worker
+
+Jobs are processed in chunks of ``job_chunk_size`` items by the same
+prediction functions the API uses, so batching, caching and the inference
+executor work the same way.
+"""
+import asyncio
+import logging
+import signal
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from prometheus_client import start_http_server
+from redis.asyncio import ConnectionPool
+
+from insightguard.metrics import JOB_ITEMS, JOB_LATENCY, JOB_QUEUE_WAIT, JOBS
+from insightguard.services.insightguard.batching import QueueFullError
+from insightguard.services.insightguard.executor import inference_executor
+from insightguard.services.insightguard.lifetime import refresh_url_index
+from insightguard.services.insightguard.models import (bullying_scores,
+                                                       phishing_url_predictions,
+                                                       predict_phishing_emails)
+from insightguard.services.jobs.queue import DONE, FAILED, JobQueue, Lease
+from insightguard.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker waits after an error of its loop or a full inference
+# queue, doubled for every consecutive error.
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+Scan = Callable[[List[Any], ConnectionPool], Awaitable[List[Dict[str, Any]]]]
+
+
+async def scan_bullying(items: List[Dict[str, str]],
+                        redis_pool: ConnectionPool) -> List[Dict[str, Any]]:
+    """
+    Score texts for bullying, grouped by language.
+
+    :param items: dicts with text and language.
+    :param redis_pool: redis pool of the prediction cache.
+    :return: items with their predictions.
+    """
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for index, item in enumerate(items):
+        groups[item["language"]].append(index)
+
+    results = [dict(item) for item in items]
+    for language, indexes in groups.items():
+        scores = await bullying_scores(
+            language, [items[index]["text"] for index in indexes], redis_pool)
+        for index, score in zip(indexes, scores):
+            results[index]["prediction"] = score
+    return results
+
+
+async def scan_urls(items: List[str],
+                    redis_pool: ConnectionPool) -> List[Dict[str, Any]]:
+    """
+    Score URLs for phishing.
+
+    :param items: URLs.
+    :param redis_pool: redis pool of the result cache.
+    :return: URLs with their predictions and sources.
+    """
+    predictions = await phishing_url_predictions(set(items), redis_pool)
+    by_url = {prediction["url"]: prediction for prediction in predictions}
+    return [
+        {"url": url, "prediction": by_url[url]["prediction"],
+         "source": by_url[url]["source"]}
+        for url in items
+    ]
+
+
+async def scan_emails(items: List[Dict[str, str]],
+                      redis_pool: ConnectionPool) -> List[Dict[str, Any]]:
+    """
+    Score emails for phishing.
+
+    :param items: dicts with id and content.
+    :param redis_pool: unused, emails aren't cached.
+    :return: ids with their predictions.
+    """
+    predictions = await inference_executor.run(
+        predict_phishing_emails, [item["content"] for item in items],
+        model="phishing_email")
+    return [
+        {"id": item["id"], "prediction": prediction}
+        for item, prediction in zip(items, predictions)
+    ]
+
+
+scans: Dict[str, Scan] = {
+    "bullying": scan_bullying,
+    "url": scan_urls,
+    "email": scan_emails,
+}
+
+
+class JobWorker:
+    """
+    Processes jobs of a queue.
+
+    :param queue: queue of jobs.
+    :param redis_pool: redis pool of the prediction caches.
+    :param chunk_size: items processed between progress updates.
+    :param poll_timeout: whole seconds to wait for a job before checking leases.
+    """
+
+    def __init__(self, queue: JobQueue, redis_pool: ConnectionPool, chunk_size: int,
+                 poll_timeout: int = 1):
+        self.queue = queue
+        self.redis_pool = redis_pool
+        self.chunk_size = chunk_size
+        self.poll_timeout = poll_timeout
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """
+        Claim and process jobs until stopped.
+
+        Errors, e.g. of a redis connection, are logged and retried with a
+        growing delay. Leases of jobs interrupted by them expire, so the
+        jobs are requeued.
+
+        :param stop: event stopping the worker after its current job.
+        """
+        errors = 0
+        while not stop.is_set():
+            try:
+                await self.step()
+            except Exception:
+                delay = min(RETRY_DELAY * 2 ** errors, MAX_RETRY_DELAY)
+                errors += 1
+                logger.exception("Job worker failed, retrying in %.1fs", delay)
+                await asyncio.sleep(delay)
+            else:
+                errors = 0
+
+    async def step(self) -> None:
+        """Requeue jobs with expired leases, then claim and process one job."""
+        for job_id in await self.queue.expired():
+            status = await self.queue.release(job_id, "Lease expired.")
+            if status:
+                logger.warning("Job %s lease expired, %s", job_id, status)
+        lease = await self.queue.claim(self.poll_timeout)
+        if lease is not None:
+            await self.process(lease)
+
+    async def process(self, lease: Lease) -> None:
+        """
+        Process remaining items of a claimed job and ack it.
+
+        Failed jobs are released, so they're retried until max attempts.
+        Jobs hitting a full inference queue are released without using an
+        attempt, after which the worker waits. Processing stops when the
+        lease is lost, e.g. it expired during a slow chunk and another worker
+        claimed the job.
+
+        :param lease: lease of the job.
+        """
+        job_id = lease.job_id
+        job = await self.queue.get(job_id)
+        if job is None:
+            await self.queue.ack(lease, FAILED, "Job data expired.")
+            return
+        kind = job["kind"]
+        if int(job["attempts"]) == 1:
+            JOB_QUEUE_WAIT.labels(kind).observe(time.time() - float(job["created_at"]))
+
+        try:
+            processed = int(job["processed"])
+            while True:  # noqa: WPS457
+                items = await self.queue.items(job_id, processed, self.chunk_size)
+                if not items:
+                    break
+                results = await scans[kind](items, self.redis_pool)
+                if not await self.queue.add_results(lease, processed, results):
+                    logger.warning("Job %s lease was lost, stopping", job_id)
+                    return
+                processed += len(items)
+                JOB_ITEMS.labels(kind).inc(len(items))
+        except QueueFullError as exc:
+            logger.warning("Job %s postponed: %s", job_id, exc)
+            await self.queue.release(job_id, str(exc), lease.token, attempt=False)
+            await asyncio.sleep(RETRY_DELAY)
+            return
+        except Exception as exc:
+            logger.exception("Job %s failed", job_id)
+            status = await self.queue.release(
+                job_id, str(exc) or type(exc).__name__, lease.token)
+            if status == FAILED:
+                JOBS.labels(kind, FAILED).inc()
+            return
+
+        if not await self.queue.ack(lease, DONE):
+            logger.warning("Job %s lease was lost before it was acked", job_id)
+            return
+        JOBS.labels(kind, DONE).inc()
+        JOB_LATENCY.labels(kind).observe(time.time() - float(job["created_at"]))
+
+
+async def run_worker(concurrency: Optional[int] = None) -> None:
+    """
+    Run job workers until SIGINT or SIGTERM.
+
+    :param concurrency: number of jobs processed at once.
+    """
+    redis_pool = ConnectionPool.from_url(str(settings.redis_url))
+    queue = JobQueue(redis_pool, lease=settings.job_lease_seconds,
+                     max_attempts=settings.job_max_attempts, ttl=settings.job_ttl)
+    worker = JobWorker(queue, redis_pool, chunk_size=settings.job_chunk_size)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    index_task = None
+    if settings.phishing_index_enabled:
+        index_task = asyncio.create_task(refresh_url_index())
+
+    concurrency = concurrency or settings.job_worker_concurrency
+    logger.info("Job worker started, processing %d jobs at once", concurrency)
+    try:
+        await asyncio.gather(*(worker.run(stop) for _ in range(concurrency)))
+    finally:
+        if index_task is not None:
+            index_task.cancel()
+        inference_executor.shutdown()
+        await redis_pool.disconnect()
+
+
+def main(concurrency: Optional[int] = None) -> None:
+    """
+    Entrypoint of the job worker.
+
+    :param concurrency: number of jobs processed at once.
+    """
+    logging.basicConfig(level=settings.log_level.value)
+    if settings.job_worker_metrics_port:
+        start_http_server(settings.job_worker_metrics_port)
+    asyncio.run(run_worker(concurrency))
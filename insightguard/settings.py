@@ -2,12 +2,18 @@ import enum
 import os
 from pathlib import Path
 from tempfile import gettempdir
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseSettings
+from pydantic import BaseSettings, validator
 from yarl import URL
 
 TEMP_DIR = Path(gettempdir())
+# Private directory of sockets, XDG_RUNTIME_DIR is only accessible by its user
+RUNTIME_DIR = (
+    Path(os.environ["XDG_RUNTIME_DIR"]) / "insightguard"
+    if os.environ.get("XDG_RUNTIME_DIR")
+    else TEMP_DIR / f"insightguard-{os.getuid()}"
+)
 
 
 class LogLevel(str, enum.Enum):  # noqa: WPS600
@@ -35,6 +41,8 @@ class Settings(BaseSettings):
     workers_count: int = 1
     # Enable uvicorn reloading
     reload: bool = False
+    # Import the app once and fork uvicorn workers from it, faster (re)starts
+    web_preload: bool = False
 
     # Current environment
     environment: str = "dev"
@@ -67,10 +75,182 @@ class Settings(BaseSettings):
     refresh_token_expire_minutes: int = 60 * 24 * 7
     access_token_expire_minutes: int = 30
 
+    # Heavy resources (see services/insightguard/resources.py) to load on startup
+    # instead of on first use, e.g. ["tensorflow", "transformers"]
+    preload_resources: List[str] = []
+
+    # Cache of predictions: in-process LRU tier in front of a shared redis tier.
+    # The redis tier is bounded by the TTL and the server's maxmemory policy.
+    prediction_cache_enabled: bool = True
+    prediction_cache_size: int = 10000
+    prediction_cache_ttl: int = 60 * 60 * 24
+    # Bump to invalidate cached bullying scores, e.g. after retraining a model
+    bullying_model_version: str = "1"
+
+    # Executor running model inference off the event loop: "thread", "process"
+    # or "server" to use `python -m insightguard inference-server`
+    inference_executor: str = "thread"
+    # Threads or processes of the executor, threads of every server worker
+    inference_workers: int = 2
+    # Socket the inference server listens on, its directory is created with
+    # 0700 permissions and must not be writable by other users
+    inference_server_socket: Path = RUNTIME_DIR / "inference.sock"
+    # Processes forked by the inference server
+    inference_server_workers: int = 2
+    # Inference calls queued above this number are rejected with 503
+    inference_max_queue: int = 256
+
+    # Backend of bullying models per language, "tf" or "onnx", e.g. {"ca": "onnx"}.
+    # Languages not listed use "tf".
+    bullying_backends: Dict[str, str] = {}
+    # Models exported with `python -m insightguard.services.insightguard.backends`
+    onnx_models_dir: Path = Path(__file__).parent / "services/insightguard/models/onnx"
+    # Use int8 quantized ONNX models when they were exported
+    onnx_quantized: bool = True
+    # TF bullying models are compiled for these sequence lengths and inputs
+    # are padded to the nearest one. All of them are traced on model load.
+    tf_sequence_buckets: List[int] = [32, 64, 128, 256, 512]
+    # ONNX Runtime intra-op threads, 0 means its default. The inference server
+    # runs ONNX models on one thread, so they can be loaded before it forks.
+    onnx_threads: int = 0
+    # Use memory-mapped weights of exported ONNX models, shared by all workers
+    onnx_mmap_weights: bool = True
+    # Interval of updating the process memory metric in seconds, 0 disables it
+    memory_report_interval: int = 30
+
+    # Micro-batching of bullying predictions: a batch runs when it has
+    # max_size texts or max_wait_ms passed since its first text.
+    # max_size also caps length buckets of /api/bullying/batch
+    bullying_batch_max_size: int = 32
+    bullying_batch_max_wait_ms: float = 5.0
+    # Texts waiting for a batch above this number are rejected with 503
+    bullying_batch_max_queue: int = 1024
+    # Maximum number of texts in a single /api/bullying/batch request
+    bullying_batch_max_items: int = 1000
+
+    # Long texts are split into windows of window_size tokens (capped by the
+    # model's maximum), overlapping by window_overlap tokens. Without
+    # long_text they're truncated to the first window.
+    bullying_long_text: bool = True
+    bullying_window_size: int = 512
+    bullying_window_overlap: int = 128
+    # Windows after the first one of long texts scored in one forward pass
+    bullying_window_batch_size: int = 8
+    # Windows of a text are reduced with "max" or "mean"
+    bullying_window_reducer: str = "max"
+    # Remaining windows of a text are skipped once one scores at least this,
+    # 0 disables early exit
+    bullying_early_exit_threshold: float = 0.95
+
+    # Known URLs are answered from an index before the URL model: a TSV
+    # exported from the dataset and operator blocklists of URLs and domains.
+    # The index is rebuilt when the files change, checked every check_interval.
+    phishing_index_enabled: bool = True
+    phishing_index_path: Path = (
+        Path(__file__).parent / "services/insightguard/models/phishing-urls.index.tsv"
+    )
+    phishing_blocklist_files: List[Path] = []
+    phishing_index_check_interval: float = 30
+    # False positive rate of the blocked domain filter
+    phishing_index_error_rate: float = 1e-6
+
+    # Scores of URLs are cached by their canonical form, without tracking
+    # query parameters (names ending with * are prefixes). Phishing scores
+    # live for cache_ttl, benign ones for negative_cache_ttl seconds.
+    url_tracking_params: List[str] = [
+        "utm_*", "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid",
+        "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "igshid", "ref_src",
+    ]
+    phishing_url_cache_ttl: int = 86400
+    phishing_url_negative_cache_ttl: int = 3600
+    # Change to invalidate cached URL scores, e.g. after retraining
+    phishing_url_model_version: str = "1"
+
+    # /api/phishing/url/stream scores URLs in chunks of this size and rejects
+    # lines longer than max_line characters
+    phishing_url_stream_chunk_size: int = 256
+    phishing_url_stream_max_line: int = 8192
+
+    # Maximum number of emails in a single /api/phishing/email/batch request
+    phishing_email_batch_max_items: int = 1000
+    # Maximum number of cached stems of email words
+    email_stem_cache_size: int = 100000
+
+    # Scan jobs: maximum items of a job, items processed between progress
+    # updates, seconds a worker holds a job without progress before it's
+    # requeued, attempts before a job fails and seconds finished jobs are kept
+    job_max_items: int = 1000000
+    job_chunk_size: int = 256
+    job_lease_seconds: float = 300
+    job_max_attempts: int = 3
+    job_ttl: int = 86400
+    # Items an API key may submit in jobs per window of seconds, a quota
+    # separate from the one of interactive endpoints
+    job_rate_limit: int = 1000000
+    job_rate_limit_window: int = 86400
+    # Jobs processed at once by `python -m insightguard worker`, and port
+    # of its prometheus metrics, 0 to disable
+    job_worker_concurrency: int = 2
+    job_worker_metrics_port: int = 0
+
+    # Models loaded concurrently on startup: languages of bullying models,
+    # "phishing_url" and "phishing_email". /api/ready returns 503 until they're warm.
+    warmup_models: List[str] = []
+
+    # Memory budget of loaded bullying models in MB, 0 for unlimited.
+    # Least recently used languages are unloaded above it. Memory-mapped
+    # ONNX weights are shared by workers and don't count against it.
+    bullying_memory_budget_mb: int = 0
+    # Languages whose bullying models are never unloaded
+    bullying_pinned_languages: List[str] = []
+    # Unload bullying models unused for this many seconds, 0 to disable
+    bullying_idle_unload_seconds: int = 0
+
     # Jail settings
     jail_time: int = 20
     max_login_attempts: int = 3
 
+    @validator("bullying_window_overlap")
+    def check_window_overlap(cls, overlap: int, values: Dict[str, Any]) -> int:
+        """
+        Check that consecutive windows of long texts advance.
+
+        :param overlap: tokens shared by consecutive windows.
+        :param values: settings validated so far.
+        :raises ValueError: if overlap is negative or not smaller than window size.
+        :return: overlap.
+        """
+        size = values.get("bullying_window_size")
+        if size is not None and not 0 <= overlap < size:
+            raise ValueError(f"must be between 0 and bullying_window_size ({size})")
+        return overlap
+
+    @validator("bullying_window_reducer")
+    def check_window_reducer(cls, reducer: str) -> str:
+        """
+        Check that windows are reduced by a known function.
+
+        :param reducer: name of the reducer.
+        :raises ValueError: if reducer isn't "max" or "mean".
+        :return: reducer.
+        """
+        if reducer not in {"max", "mean"}:
+            raise ValueError('must be "max" or "mean"')
+        return reducer
+
+    @validator("bullying_early_exit_threshold")
+    def check_early_exit_threshold(cls, threshold: float) -> float:
+        """
+        Check that the early exit threshold is a probability.
+
+        :param threshold: bullying probability ending scoring of a text.
+        :raises ValueError: if threshold isn't between 0 and 1.
+        :return: threshold.
+        """
+        if not 0 <= threshold <= 1:
+            raise ValueError("must be between 0 and 1")
+        return threshold
+
     @property
     def db_url(self) -> URL:
         """
@@ -0,0 +1,12 @@
+"""
+Endpoint benchmarks.
+
+The app from ``get_app()`` runs in-process with fakeredis and SQLite
+instead of Redis and Postgres, see :mod:`.stand_ins`. Run them with::
+
+    python -m insightguard.tests.benchmarks run --output head.json
+    python -m insightguard.tests.benchmarks compare base.json head.json
+
+Models are real, set ``INSIGHTGUARD_WARMUP_MODELS`` to load them before
+measuring.
+"""
@@ -0,0 +1,207 @@
+"""Run endpoint benchmarks or compare their results."""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess  # noqa: S404
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from httpx import AsyncClient
+from redis.asyncio import Redis
+
+from insightguard.settings import settings
+from insightguard.tests.benchmarks import rate_limiter
+from insightguard.tests.benchmarks.load import SCENARIOS, compare, run_load
+from insightguard.tests.benchmarks.stand_ins import benchmark_app
+
+
+def git_commit() -> Optional[str]:
+    """
+    Commit of the working tree, if it's a git checkout.
+
+    :return: commit hash.
+    """
+    try:
+        output = subprocess.run(  # noqa: S603, S607
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+async def run(
+    scenarios: List[str],
+    concurrency: List[int],
+    requests: int,
+    warmup: int,
+) -> Dict[str, Any]:
+    """
+    Benchmark scenarios at every concurrency level.
+
+    :param scenarios: names of scenarios.
+    :param concurrency: numbers of requests in flight.
+    :param requests: measured requests of every run.
+    :param warmup: requests sent before measuring every scenario.
+    :return: metadata and results of all runs.
+    """
+    results = []
+    async with benchmark_app() as (app, api_key):
+        async with AsyncClient(app=app, base_url="http://benchmark") as client:
+            for scenario in scenarios:
+                if warmup:
+                    await run_load(client, scenario, api_key, max(concurrency), warmup)
+                for level in concurrency:
+                    result = await run_load(client, scenario, api_key, level, requests)
+                    print(  # noqa: WPS421
+                        f"{scenario:18} c={level:<3} p50 {result['p50_ms']:8.2f}ms "
+                        f"p95 {result['p95_ms']:8.2f}ms p99 {result['p99_ms']:8.2f}ms "
+                        f"{result['throughput_rps']:9.1f} req/s "
+                        f"errors {result['errors']}",
+                        file=sys.stderr,
+                    )
+                    results.append(result)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "inference_executor": settings.inference_executor,
+            "requests": requests,
+        },
+        "results": results,
+    }
+
+
+async def run_rate_limiter(
+    redis_url: Optional[str],
+    concurrency: List[int],
+    requests: int,
+    limit: int,
+    rtt: float,
+) -> Dict[str, Any]:
+    """
+    Compare the rate limiter with its previous implementation.
+
+    :param redis_url: redis to run against, fakeredis if not set.
+    :param concurrency: numbers of requests in flight.
+    :param requests: requests of every run.
+    :param limit: rate limit of one API key.
+    :param rtt: round trip time added to every command in seconds.
+    :return: metadata and results of all runs.
+    """
+    if redis_url:
+        redis_client = Redis.from_url(redis_url)
+    else:
+        redis_client = FakeRedis(server=FakeServer())
+    try:
+        results = await rate_limiter.run(
+            redis_client, concurrency, requests, limit, rtt)
+    finally:
+        await redis_client.close()
+    for result in results:
+        print(  # noqa: WPS421
+            f"{result['scenario']:20} c={result['concurrency']:<3} "
+            f"p50 {result['p50_ms']:8.3f}ms p99 {result['p99_ms']:8.3f}ms "
+            f"{result['throughput_rps']:9.1f} req/s "
+            f"allowed {result['allowed']}/{limit}",
+            file=sys.stderr,
+        )
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "redis": "real" if redis_url else "fakeredis",
+            "requests": requests,
+            "limit": limit,
+            "rtt_ms": rtt * 1000,
+        },
+        "results": results,
+    }
+
+
+def print_comparison(changes: List[Dict[str, Any]]) -> None:
+    """
+    Print relative changes of runs.
+
+    :param changes: output of :func:`compare`.
+    """
+    for change in changes:
+        print(  # noqa: WPS421
+            f"{change['scenario']:18} c={change['concurrency']:<3} "
+            f"p50 {change['p50_ms']:+7.1%} p95 {change['p95_ms']:+7.1%} "
+            f"p99 {change['p99_ms']:+7.1%} "
+            f"throughput {change['throughput_rps']:+7.1%}"
+            f"{'  REGRESSED' if change['regressed'] else ''}",
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Entrypoint of benchmarks.
+
+    :param argv: command line arguments.
+    :return: exit code, 1 if compared results regressed.
+    """
+    parser = argparse.ArgumentParser(prog="python -m insightguard.tests.benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Benchmark endpoints.")
+    run_parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS),
+                            default=list(SCENARIOS))
+    run_parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    run_parser.add_argument("--requests", type=int, default=200)
+    run_parser.add_argument("--warmup", type=int, default=20)
+    run_parser.add_argument("--output", type=Path, help="JSON file, stdout if not set.")
+
+    limiter_parser = commands.add_parser(
+        "rate-limiter", help="Compare the rate limiter with the previous one.",
+    )
+    limiter_parser.add_argument("--redis-url",
+                                help="Redis to use, fakeredis if not set.")
+    limiter_parser.add_argument("--concurrency", nargs="+", type=int,
+                                default=[1, 8, 32])
+    limiter_parser.add_argument("--requests", type=int, default=2000)
+    limiter_parser.add_argument("--limit", type=int, default=1000)
+    limiter_parser.add_argument("--rtt-ms", type=float, default=0,
+                                help="Round trip time added to every redis command.")
+    limiter_parser.add_argument("--output", type=Path,
+                                help="JSON file, stdout if not set.")
+
+    compare_parser = commands.add_parser("compare", help="Compare two results.")
+    compare_parser.add_argument("base", type=Path)
+    compare_parser.add_argument("head", type=Path)
+    compare_parser.add_argument("--max-regression", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command in {"run", "rate-limiter"}:
+        if args.command == "run":
+            report = asyncio.run(run(args.scenarios, args.concurrency,
+                                     args.requests, args.warmup))
+        else:
+            report = asyncio.run(run_rate_limiter(args.redis_url, args.concurrency,
+                                                  args.requests, args.limit,
+                                                  args.rtt_ms / 1000))
+        output = json.dumps(report, indent=2)
+        if args.output:
+            args.output.write_text(output, encoding="utf-8")
+        else:
+            print(output)  # noqa: WPS421
+        return 0
+
+    base = json.loads(args.base.read_text(encoding="utf-8"))["results"]
+    head = json.loads(args.head.read_text(encoding="utf-8"))["results"]
+    changes, regressed = compare(base, head, args.max_regression)
+    print_comparison(changes)
+    return int(regressed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""Load generator, statistics and comparison of endpoint benchmarks."""
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+from httpx import AsyncClient
+
+RequestFactory = Callable[[int, str], Dict[str, Any]]
+
+TEXTS = (
+    "hello, how are you today?",
+    "you are a complete idiot and everybody knows it",
+    "I really liked the movie we watched yesterday, the ending was great.",
+)
+
+EMAIL = (
+    "Dear customer, your account has been suspended. Please verify your "
+    "details at the link below within 24 hours to avoid losing access."
+)
+
+
+def _headers(api_key: str) -> Dict[str, str]:
+    return {"X-API-KEY": api_key}
+
+
+# Texts and URLs differ between requests, so predictions aren't cached.
+SCENARIOS: Dict[str, RequestFactory] = {
+    "bullying": lambda index, api_key: {
+        "method": "POST",
+        "url": "/api/bullying/",
+        "json": {"text": f"{TEXTS[index % len(TEXTS)]} #{index}", "language": "en"},
+        "headers": _headers(api_key),
+    },
+    "phishing_url": lambda index, api_key: {
+        "method": "POST",
+        "url": "/api/phishing/url",
+        "json": {"url": [f"https://login-{index}.example.com/verify?id={index}"]},
+        "headers": _headers(api_key),
+    },
+    "phishing_email": lambda index, api_key: {
+        "method": "POST",
+        "url": "/api/phishing/email",
+        "json": {"content": f"{EMAIL} Case {index}."},
+        "headers": _headers(api_key),
+    },
+    "password_strength": lambda index, api_key: {
+        "method": "GET",
+        "url": "/api/password/strength",
+        "params": {"password": f"Tr0ub4dor&{index}"},
+        "headers": _headers(api_key),
+    },
+    "password_generate": lambda index, api_key: {
+        "method": "POST",
+        "url": "/api/password/generate",
+        "json": {"length": 16},
+        "headers": _headers(api_key),
+    },
+    "key": lambda index, api_key: {
+        "method": "GET",
+        "url": "/api/key/",
+        "params": {"key": api_key},
+    },
+}
+
+
+async def run_load(
+    client: AsyncClient,
+    scenario: str,
+    api_key: str,
+    concurrency: int,
+    requests: int,
+) -> Dict[str, Any]:
+    """
+    Send requests of a scenario from concurrent clients.
+
+    :param client: client of the app.
+    :param scenario: name of the scenario, see ``SCENARIOS``.
+    :param api_key: valid API key.
+    :param concurrency: number of requests in flight.
+    :param requests: total number of requests.
+    :return: statistics, see :func:`summarize`.
+    """
+    build = SCENARIOS[scenario]
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    indexes = iter(range(requests))
+
+    async def user() -> None:  # noqa: WPS430
+        for index in indexes:
+            start = time.perf_counter()
+            try:
+                response = await client.request(**build(index, api_key))
+            except Exception:
+                statuses["exception"] += 1
+            else:
+                statuses[str(response.status_code)] += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return summarize(scenario, concurrency, latencies, statuses,
+                     time.perf_counter() - started)
+
+
+def summarize(
+    scenario: str,
+    concurrency: int,
+    latencies: List[float],
+    statuses: Dict[str, int],
+    elapsed: float,
+) -> Dict[str, Any]:
+    """
+    Statistics of a benchmark run.
+
+    :param scenario: name of the scenario.
+    :param concurrency: number of requests in flight.
+    :param latencies: latencies of requests in seconds.
+    :param statuses: number of responses by status code.
+    :param elapsed: duration of the run in seconds.
+    :return: latency percentiles in milliseconds, throughput and errors.
+    """
+    milliseconds = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    successful = sum(
+        count for status, count in statuses.items()
+        if status.isdigit() and int(status) < 400
+    )
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(latencies) - successful,
+        "statuses": dict(sorted(statuses.items())),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+    }
+
+
+def compare(
+    base: List[Dict[str, Any]],
+    head: List[Dict[str, Any]],
+    max_regression: float,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Compare results of two runs.
+
+    A run regressed when p95 latency grew or throughput dropped by more
+    than ``max_regression``, or it has errors the base run didn't.
+
+    :param base: results of the base run.
+    :param head: results of the compared run.
+    :param max_regression: allowed relative change, e.g. 0.1.
+    :return: changes of every scenario run in both, and whether any regressed.
+    """
+    base_results = {(row["scenario"], row["concurrency"]): row for row in base}
+    changes = []
+    for row in head:
+        reference = base_results.get((row["scenario"], row["concurrency"]))
+        if reference is None:
+            continue
+        change = {"scenario": row["scenario"], "concurrency": row["concurrency"]}
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            change[metric] = (
+                row[metric] / reference[metric] - 1 if reference[metric] else 0.0
+            )
+        change["regressed"] = (
+            change["p95_ms"] > max_regression
+            or change["throughput_rps"] < -max_regression
+            or row["errors"] > reference["errors"]
+        )
+        changes.append(change)
+    return changes, any(change["regressed"] for change in changes)
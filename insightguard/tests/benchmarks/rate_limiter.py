@@ -0,0 +1,138 @@
+"""Throughput of the rate limiter compared with its previous implementation."""
+import asyncio
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from starlette.requests import Request
+from starlette.responses import Response
+
+from insightguard.ratelimiter.limiter import RateLimiter
+from insightguard.tests.benchmarks.load import summarize
+
+
+class LegacyRateLimiter:
+    """
+    Rate limiter before the atomic script, for comparison.
+
+    GET, maybe TTL, INCR and EXPIRE are separate round trips, so concurrent
+    requests can all pass the check before any of them is counted.
+
+    :param rate_limit: number of requests allowed per rate_limit_window.
+    :param rate_limit_window: time window in seconds.
+    :param redis_client: redis client.
+    """
+
+    def __init__(self, rate_limit: int, rate_limit_window: int, redis_client: Redis):
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.redis_client = redis_client
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        key = f"api:{request.headers['X-API-KEY']}"
+        request_count = await self.redis_client.get(key)
+        if request_count is not None and int(request_count) >= self.rate_limit:
+            reset_time = int(await self.redis_client.ttl(key))
+            raise HTTPException(
+                status_code=429, headers={"Retry-After": str(reset_time)})
+        await self.redis_client.incr(key)
+        await self.redis_client.expire(key, self.rate_limit_window)
+
+
+class DelayedRedis:
+    """
+    Redis client adding a delay to every command, like a network round trip.
+
+    :param redis_client: wrapped client.
+    :param delay: delay in seconds.
+    """
+
+    def __init__(self, redis_client: Redis, delay: float):
+        self.redis_client = redis_client
+        self.delay = delay
+
+    def __getattr__(self, name: str) -> Any:
+        command = getattr(self.redis_client, name)
+
+        async def delayed(*args: Any, **kwargs: Any) -> Any:  # noqa: WPS430
+            await asyncio.sleep(self.delay)
+            return await command(*args, **kwargs)
+
+        return delayed
+
+
+async def measure(
+    scenario: str,
+    limiter: Any,
+    api_key: str,
+    concurrency: int,
+    requests: int,
+) -> Dict[str, Any]:
+    """
+    Send requests of one API key through a limiter.
+
+    :param scenario: name of the run in results.
+    :param limiter: limiter dependency.
+    :param api_key: API key of requests.
+    :param concurrency: number of requests in flight.
+    :param requests: total number of requests.
+    :return: statistics with the number of allowed requests.
+    """
+    request = Request({"type": "http", "headers": [(b"x-api-key", api_key.encode())]})
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    indexes = iter(range(requests))
+
+    async def user() -> None:  # noqa: WPS430
+        for _ in indexes:
+            start = time.perf_counter()
+            try:
+                await limiter(request, Response())
+            except HTTPException as exc:
+                statuses[str(exc.status_code)] += 1
+            else:
+                statuses["200"] += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    result = summarize(scenario, concurrency, latencies, statuses,
+                       time.perf_counter() - started)
+    # Rejections are the expected outcome of requests above the limit
+    result["errors"] = 0
+    result["allowed"] = statuses["200"]
+    return result
+
+
+async def run(redis_client: Redis, concurrency: List[int], requests: int,
+              limit: int, rtt: float = 0) -> List[Dict[str, Any]]:
+    """
+    Compare both limiters at every concurrency level.
+
+    Each run uses a new API key, ``allowed`` above ``limit`` means the limiter
+    let through more requests than it should.
+
+    :param redis_client: redis to run against.
+    :param concurrency: numbers of requests in flight.
+    :param requests: requests of every run.
+    :param limit: rate limit of one API key.
+    :param rtt: round trip time added to every command in seconds.
+    :return: results of all runs.
+    """
+    if rtt:
+        redis_client = DelayedRedis(redis_client, rtt)  # type: ignore
+    limiters = {
+        "legacy": LegacyRateLimiter(limit, 3600, redis_client),
+        "gcra": RateLimiter(limit, 3600, redis_client),
+    }
+    results = []
+    for level in concurrency:
+        for name, limiter in limiters.items():
+            results.append(await measure(
+                f"rate_limiter_{name}", limiter, f"benchmark-{uuid.uuid4().hex}",
+                level, requests,
+            ))
+    return results
@@ -0,0 +1,106 @@
+"""Stand-ins of Postgres and Redis for running the app in-process."""
+import contextlib
+import logging
+import tempfile
+from typing import AsyncIterator, List, Tuple
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeConnection, FakeRedis
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from redis.asyncio import ConnectionPool
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from insightguard.db.meta import meta
+from insightguard.db.models import load_all_models
+from insightguard.db.models.key_model import KeyModel
+from insightguard.db.models.user_model import UserModel
+from insightguard.ratelimiter.limiter import RateLimiter
+from insightguard.web.application import get_app
+
+logger = logging.getLogger(__name__)
+
+
+def rate_limiters(app: FastAPI) -> List[RateLimiter]:
+    """
+    Rate limiters used as dependencies of routes or by their modules.
+
+    :param app: application.
+    :return: distinct rate limiters.
+    """
+    found = {}
+    dependants = [
+        route.dependant for route in app.routes if isinstance(route, APIRoute)
+    ]
+    while dependants:
+        dependant = dependants.pop()
+        if isinstance(dependant.call, RateLimiter):
+            found[id(dependant.call)] = dependant.call
+        for value in getattr(dependant.call, "__globals__", {}).values():
+            if isinstance(value, RateLimiter):
+                found[id(value)] = value
+        dependants.extend(dependant.dependencies)
+    return list(found.values())
+
+
+async def create_api_key(session_factory: async_sessionmaker) -> str:
+    """
+    Create an active enterprise user with an API key.
+
+    :param session_factory: factory of database sessions.
+    :return: the API key.
+    """
+    async with session_factory() as session:
+        user = UserModel(username="benchmark", hashed_password="-",
+                         email="benchmark@example.com", account_type="enterprise",
+                         disabled=False)
+        session.add(user)
+        await session.flush()
+        key = KeyModel(user_id=user.id)
+        session.add(key)
+        await session.commit()
+        return key.key
+
+
+@contextlib.asynccontextmanager
+async def benchmark_app() -> AsyncIterator[Tuple[FastAPI, str]]:
+    """
+    Started application using SQLite and fakeredis.
+
+    Startup events run as in production, then the database engine,
+    the redis pool and clients of rate limiters are replaced.
+    Waits for model warmup, see ``warmup_models`` setting.
+
+    :yield: the application and a valid API key.
+    """
+    app = get_app()
+    await app.router.startup()
+    limiters = rate_limiters(app)
+    redis_clients = [limiter.redis_client for limiter in limiters]
+
+    with tempfile.TemporaryDirectory(prefix="insightguard-benchmark") as tmp_dir:
+        load_all_models()
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_dir}/insightguard.db")
+        async with engine.begin() as connection:
+            await connection.run_sync(meta.create_all)
+        await app.state.db_engine.dispose()
+        app.state.db_engine = engine
+        app.state.db_session_factory = async_sessionmaker(engine,
+                                                          expire_on_commit=False)
+
+        server = FakeServer()
+        await app.state.redis_pool.disconnect()
+        app.state.redis_pool = ConnectionPool(connection_class=FakeConnection,
+                                              server=server)
+        for limiter in limiters:
+            limiter.redis_client = FakeRedis(server=server)
+
+        try:
+            await app.state.warmup_task
+            for name, error in app.state.model_warmup_errors.items():
+                logger.warning("Model %s is not warmed up: %s", name, error)
+            yield app, await create_api_key(app.state.db_session_factory)
+        finally:
+            await app.router.shutdown()
+            for limiter, redis_client in zip(limiters, redis_clients):
+                limiter.redis_client = redis_client
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from insightguard.services.insightguard.backends import (BENCHMARK_TEXTS,
+                                                         ONNXBackend,
+                                                         TFBackend,
+                                                         onnx_model_dir,
+                                                         softmax)
+from insightguard.services.insightguard.models import model_map
+from insightguard.settings import settings
+
+# Maximum difference of probabilities between TF and ONNX models.
+FP32_TOLERANCE = 1e-3
+INT8_TOLERANCE = 5e-2
+
+
+def test_softmax() -> None:
+    """Checks that softmax is stable for large logits."""
+    probabilities = softmax(np.array([[1000.0, 1000.0], [0.0, np.log(3.0)]]))
+    np.testing.assert_allclose(probabilities, [[0.5, 0.5], [0.25, 0.75]])
+
+
+@pytest.mark.parametrize("lang", list(model_map))
+@pytest.mark.parametrize("quantized", [False, True])
+def test_onnx_parity(lang: str, quantized: bool) -> None:
+    """Checks that exported ONNX models score like the TF ones."""
+    model_dir = onnx_model_dir(lang)
+    if not model_dir.exists():
+        pytest.skip(f"ONNX model for '{lang}' is not exported.")
+    pytest.importorskip("onnxruntime")
+    transformers = pytest.importorskip("transformers")
+
+    onnx_backend = ONNXBackend(model_dir, quantized=quantized)
+    if quantized and "int8" not in onnx_backend.model_path.name:
+        pytest.skip(f"Quantized ONNX model for '{lang}' is not exported.")
+
+    tokenizer = transformers.AutoTokenizer.from_pretrained(str(model_dir))
+    encoded_input = dict(tokenizer(list(BENCHMARK_TEXTS), padding=True,
+                                   return_tensors="np"))
+    expected = softmax(TFBackend(model_map[lang])(encoded_input))
+    actual = softmax(onnx_backend(encoded_input))
+
+    tolerance = INT8_TOLERANCE if quantized else FP32_TOLERANCE
+    assert np.abs(actual - expected).max() <= tolerance
+
+
+@pytest.fixture(scope="module")
+def tiny_tf_model(tmp_path_factory) -> str:
+    """
+    Randomly initialized tiny BERT saved as a TF checkpoint.
+
+    :param tmp_path_factory: factory of temporary directories.
+    :return: path to the model.
+    """
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("tensorflow")
+    config = transformers.BertConfig(
+        vocab_size=50, hidden_size=8, num_hidden_layers=1, num_attention_heads=2,
+        intermediate_size=16, max_position_embeddings=64, num_labels=2,
+    )
+    path = tmp_path_factory.mktemp("tiny-bert")
+    transformers.TFBertForSequenceClassification(config).save_pretrained(path)
+    return str(path)
+
+
+def test_tf_bucketed_serving(tiny_tf_model: str, monkeypatch) -> None:
+    """Checks that inputs padded to buckets score like unpadded eager ones."""
+    monkeypatch.setattr(settings, "tf_sequence_buckets", [8, 16])
+    backend = TFBackend(tiny_tf_model, from_pt=False)
+    encoded_input = {
+        "input_ids": np.array([[2, 7, 9, 3, 0], [2, 5, 3, 0, 0]]),
+        "attention_mask": np.array([[1, 1, 1, 1, 0], [1, 1, 1, 0, 0]]),
+    }
+    expected = backend.model(encoded_input, training=False).logits.numpy()
+
+    backend.warmup(list(encoded_input))
+    np.testing.assert_allclose(backend(encoded_input), expected, atol=1e-5)
+    assert backend.bucket(5) == 8
+    assert backend.bucket(20) == 20
+    assert set(backend._functions) == {
+        (8, ("attention_mask", "input_ids")),
+        (16, ("attention_mask", "input_ids")),
+    }
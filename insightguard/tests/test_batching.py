@@ -0,0 +1,89 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from insightguard.services.insightguard.batching import MicroBatcher, QueueFullError
+
+
+@pytest.mark.anyio
+async def test_concurrent_texts_share_a_batch() -> None:
+    """Checks that concurrent texts run in one batch and get their own scores."""
+    batches: List[List[str]] = []
+
+    async def predict_batch(texts: List[str]) -> List[float]:
+        batches.append(texts)
+        return [float(len(text)) for text in texts]
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=8, max_wait=0.05,
+                           max_queue_depth=16, model="test")
+    texts = ["a", "bb", "ccc", "dddd"]
+    scores = await asyncio.gather(*(batcher.submit(text) for text in texts))
+    await batcher.close()
+
+    assert scores == [1.0, 2.0, 3.0, 4.0]
+    assert batches == [texts]
+
+
+@pytest.mark.anyio
+async def test_batch_size_and_queue_limits() -> None:
+    """Checks that batches are capped and a full queue is rejected."""
+    batches: List[List[str]] = []
+
+    async def predict_batch(texts: List[str]) -> List[float]:
+        batches.append(texts)
+        return [0.0] * len(texts)
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=2, max_wait=0.05,
+                           max_queue_depth=3, model="test")
+    pending = [asyncio.ensure_future(batcher.submit(str(i))) for i in range(3)]
+    await asyncio.sleep(0)
+    with pytest.raises(QueueFullError):
+        await batcher.submit("overflow")
+    await asyncio.gather(*pending)
+    await batcher.close()
+
+    assert [len(batch) for batch in batches] == [2, 1]
+
+
+@pytest.mark.anyio
+async def test_batches_run_concurrently() -> None:
+    """Checks that up to max_concurrency batches are in flight at once."""
+    running = 0
+    peak = 0
+
+    async def predict_batch(texts: List[str]) -> List[float]:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return [0.0] * len(texts)
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=1, max_wait=0.01,
+                           max_queue_depth=8, model="test", max_concurrency=2)
+    await asyncio.gather(*(batcher.submit(str(i)) for i in range(4)))
+    await batcher.close()
+
+    assert peak == 2
+
+
+@pytest.mark.anyio
+async def test_close_cancels_running_batches() -> None:
+    """Checks that closing the batcher doesn't leave callers hanging."""
+    started = asyncio.Event()
+
+    async def predict_batch(texts: List[str]) -> List[float]:
+        started.set()
+        await asyncio.sleep(10)
+        return [0.0] * len(texts)
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=1, max_wait=0.01,
+                           max_queue_depth=8, model="test")
+    pending = [asyncio.ensure_future(batcher.submit(str(i))) for i in range(2)]
+    await started.wait()
+    await batcher.close()
+
+    for future in pending:
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(future, 1)
@@ -0,0 +1,54 @@
+from typing import Tuple
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from insightguard.tests.benchmarks.load import compare, run_load, summarize
+
+
+def test_summarize() -> None:
+    """Checks percentiles, throughput and errors of a run."""
+    latencies = [index / 1000 for index in range(1, 101)]
+    result = summarize("key", 4, latencies, {"200": 98, "500": 1, "exception": 1}, 2.0)
+
+    assert result["requests"] == 100
+    assert result["errors"] == 2
+    assert result["p50_ms"] == pytest.approx(50.5)
+    assert result["p99_ms"] == pytest.approx(99.01)
+    assert result["throughput_rps"] == 50
+
+
+def test_compare() -> None:
+    """Checks that slower p95 latency and new errors are regressions."""
+    base = [
+        {"scenario": "key", "concurrency": 1, "p50_ms": 2, "p95_ms": 4,
+         "p99_ms": 5, "throughput_rps": 400, "errors": 0},
+        {"scenario": "bullying", "concurrency": 1, "p50_ms": 20, "p95_ms": 40,
+         "p99_ms": 50, "throughput_rps": 50, "errors": 0},
+    ]
+    head = [
+        {**base[0], "p95_ms": 4.2},
+        {**base[1], "errors": 3},
+        {**base[0], "concurrency": 8},
+    ]
+
+    changes, regressed = compare(base, head, max_regression=0.1)
+
+    assert regressed
+    assert [change["regressed"] for change in changes] == [False, True]
+    assert changes[0]["p95_ms"] == pytest.approx(0.05)
+
+
+@pytest.mark.anyio
+async def test_benchmark_app(stand_in_app: Tuple[FastAPI, str]) -> None:
+    """Checks that the app runs on SQLite and fakeredis stand-ins."""
+    app, api_key = stand_in_app
+    async with AsyncClient(app=app, base_url="http://benchmark") as client:
+        usage = (await client.get("/api/key/", params={"key": api_key})).json()["usage"]
+        result = await run_load(client, "password_strength", api_key,
+                                concurrency=1, requests=10)
+        response = await client.get("/api/key/", params={"key": api_key})
+
+    assert result["statuses"] == {"200": 10}
+    assert response.json()["usage"] == usage + 10
@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+from prometheus_client import REGISTRY
+
+from insightguard.services.insightguard.models import (BullyingScanner,
+                                                       bullying_index_from_labels,
+                                                       split_windows)
+from insightguard.settings import Settings, settings
+
+
+@pytest.mark.parametrize(
+    "id2label, index",
+    [
+        ({0: "not_cyberbullying", 1: "cyberbullying"}, 1),
+        ({0: "Bullying", 1: "Non-bullying"}, 0),
+        ({0: "neutral", 1: "toxic", 2: "other"}, 1),
+        ({0: "LABEL_0", 1: "LABEL_1"}, None),
+        ({}, None),
+    ],
+)
+def test_bullying_index_from_labels(id2label, index) -> None:
+    """Checks that the bullying label is found from label names."""
+    assert bullying_index_from_labels(id2label) == index
+
+
+def test_bullying_index_ambiguous_labels() -> None:
+    """Checks that ambiguous label layouts are rejected."""
+    with pytest.raises(RuntimeError):
+        bullying_index_from_labels({0: "toxic", 1: "hate"})
+
+
+@pytest.mark.parametrize(
+    "length, windows",
+    [
+        (3, [[0, 1, 2]]),
+        (4, [[0, 1, 2, 3]]),
+        (7, [[0, 1, 2, 3], [3, 4, 5, 6]]),
+        (8, [[0, 1, 2, 3], [3, 4, 5, 6], [6, 7]]),
+    ],
+)
+def test_split_windows(length, windows) -> None:
+    """Checks that windows overlap and cover all tokens."""
+    assert split_windows(list(range(length)), size=4, overlap=1) == windows
+
+
+@pytest.mark.parametrize("overlap", [-1, 4, 5])
+def test_split_windows_must_advance(overlap: int) -> None:
+    """Checks that windows not advancing are refused."""
+    with pytest.raises(ValueError):
+        split_windows(list(range(8)), size=4, overlap=overlap)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"bullying_window_size": 128, "bullying_window_overlap": 128},
+        {"bullying_window_overlap": -1},
+        {"bullying_window_reducer": "min"},
+        {"bullying_early_exit_threshold": 1.5},
+        {"bullying_early_exit_threshold": -0.1},
+    ],
+)
+def test_invalid_window_settings(options) -> None:
+    """Checks that invalid window settings fail on startup."""
+    with pytest.raises(ValueError):
+        Settings(**options)
+
+
+class FakeTokenizer:
+    """Tokenizer splitting on spaces, every word is its token id."""
+
+    model_max_length = 6
+    model_input_names = ["input_ids", "attention_mask"]
+
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [[int(word) for word in text.split()] for text in texts]}
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def build_inputs_with_special_tokens(self, ids):
+        return [0] + ids + [0]
+
+    def pad(self, features, return_tensors):
+        length = max(len(feature["input_ids"]) for feature in features)
+        return {
+            key: np.array([
+                feature[key] + [0] * (length - len(feature[key]))
+                for feature in features
+            ])
+            for key in features[0]
+        }
+
+
+class FakeBackend:
+    """Model scoring a window as bullying if it contains token 9."""
+
+    def __init__(self):
+        self.windows = 0
+
+    def __call__(self, encoded_input):
+        self.windows += len(encoded_input["input_ids"])
+        bullying = (encoded_input["input_ids"] == 9).any(axis=1) * 10.0
+        return np.stack([np.full_like(bullying, 5.0), bullying], axis=1)
+
+
+@pytest.fixture
+def scanner(monkeypatch) -> BullyingScanner:
+    """
+    Scanner with fake tokenizer and model, windows of 4 tokens overlapping by 1.
+
+    :param monkeypatch: pytest fixture patching settings.
+    :return: scanner.
+    """
+    monkeypatch.setattr(settings, "bullying_window_overlap", 1)
+    scanner = object.__new__(BullyingScanner)
+    scanner.lang = "en"
+    scanner.tokenizer = FakeTokenizer()
+    scanner.backend = FakeBackend()
+    scanner.bullying_index = 1
+    return scanner
+
+
+def test_long_text_windows(scanner: BullyingScanner, monkeypatch) -> None:
+    """Checks that bullying at the end of a long text isn't truncated."""
+    monkeypatch.setattr(settings, "bullying_early_exit_threshold", 0)
+
+    scores = scanner.predict_scores(["1 2 3", "1 2 3 4 5 6 7 9"])
+
+    assert scores[0] < 0.5
+    assert scores[1] > 0.5
+    assert scanner.backend.windows == 4
+
+
+def test_long_text_early_exit(scanner: BullyingScanner, monkeypatch) -> None:
+    """Checks that windows after one above the threshold are skipped."""
+    monkeypatch.setattr(settings, "bullying_window_batch_size", 1)
+    monkeypatch.setattr(settings, "bullying_early_exit_threshold", 0.9)
+
+    scores = scanner.predict_scores(["1 2 3 4 9 6 7 8 1 2 3 4"])
+
+    assert scores[0] > 0.9
+    assert scanner.backend.windows == 2
+
+
+def test_stage_timings(scanner: BullyingScanner) -> None:
+    """Checks that every stage of a prediction is timed."""
+    stages = ("tokenize", "pad", "forward", "softmax", "reduce")
+
+    def counts():  # noqa: WPS430
+        return [
+            REGISTRY.get_sample_value(
+                "insightguard_inference_stage_seconds_count",
+                {"model": "bullying", "language": "en", "stage": stage},
+            ) or 0
+            for stage in stages
+        ]
+
+    before = counts()
+    scanner.predict_scores(["1 2 3", "4 5"])
+
+    assert [after - count for after, count in zip(counts(), before)] == [1, 1, 1, 1, 1]
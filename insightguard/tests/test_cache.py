@@ -0,0 +1,174 @@
+from typing import List, Set
+
+import pytest
+from redis.asyncio import ConnectionPool, Redis
+
+from insightguard.services.insightguard import models
+from insightguard.services.insightguard.cache import (LRUCache, PredictionCache,
+                                                      bullying_cache_key,
+                                                      canonicalize_url,
+                                                      phishing_url_cache_key)
+from insightguard.services.insightguard.url_index import URLIndexStore
+
+
+def test_lru_cache_evicts_and_expires() -> None:
+    """Checks size bound and TTL of the local tier."""
+    cache: LRUCache[int] = LRUCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    cache.set("a", 1, ttl=-1)
+    assert cache.get("a") is None
+
+
+def test_cache_key_normalizes_text_and_versions_model() -> None:
+    """Checks that whitespace doesn't matter and model version does."""
+    key = bullying_cache_key("en", "v1", "you  are\tsilly ")
+    assert key == bullying_cache_key("en", "v1", "you are silly")
+    assert key != bullying_cache_key("en", "v2", "you are silly")
+
+
+@pytest.mark.anyio
+async def test_prediction_cache_tiers(fake_redis_pool: ConnectionPool) -> None:
+    """Checks that repeated keys are computed once and shared through redis."""
+    computed: List[List[int]] = []
+
+    async def compute(indexes: List[int]) -> List[float]:
+        computed.append(indexes)
+        return [0.5 + index for index in indexes]
+
+    cache = PredictionCache("test", max_size=10, ttl=60)
+    scores = await cache.cached(["a", "b", "a"], compute, fake_redis_pool)
+    assert scores == [0.5, 1.5, 0.5]
+    assert computed == [[0, 1]]
+
+    other_worker = PredictionCache("test", max_size=10, ttl=60)
+    scores = await other_worker.cached(["b", "c"], compute, fake_redis_pool)
+    assert scores == [1.5, 1.5]
+    assert computed == [[0, 1], [1]]
+
+
+@pytest.mark.parametrize(
+    "url, canonical",
+    [
+        ("HTTPS://Example.COM:443/Login?utm_source=mail&id=7&fbclid=x#top",
+         "https://example.com/Login?id=7"),
+        ("example.com/a?UTM_Medium=1", "example.com/a"),
+        ("http://example.com:8080/?q=a%20b", "http://example.com:8080/?q=a%20b"),
+        (" http://[abc/login ", "http://[abc/login"),
+    ],
+)
+def test_canonicalize_url(url: str, canonical: str) -> None:
+    """Checks that variants of an URL share the canonical form."""
+    assert canonicalize_url(url) == canonical
+
+
+@pytest.mark.anyio
+async def test_phishing_url_predictions_cached(fake_redis_pool: ConnectionPool,
+                                               monkeypatch) -> None:
+    """Checks that variants of an URL are predicted once and cached with a TTL."""
+    predicted: List[Set[str]] = []
+
+    async def run(function, urls, *args, **kwargs):
+        predicted.append(urls)
+        return [{"url": url, "prediction": 0.1, "source": "model"} for url in urls]
+
+    monkeypatch.setattr(models.inference_executor, "run", run)
+    monkeypatch.setattr(models.settings, "phishing_index_enabled", False)
+    monkeypatch.setattr(models, "phishing_url_cache",
+                        PredictionCache("phishing_url", max_size=10, ttl=60))
+
+    urls = {"https://a.com/?utm_source=x", "https://A.com/#b"}
+    results = await models.phishing_url_predictions(urls, fake_redis_pool)
+    assert predicted == [{"https://a.com/"}]
+    assert sorted(result["url"] for result in results) == sorted(urls)
+
+    models.phishing_url_cache.local = LRUCache(max_size=10, ttl=60)
+    await models.phishing_url_predictions({"https://a.com/"}, fake_redis_pool)
+    assert len(predicted) == 1
+
+    async with Redis(connection_pool=fake_redis_pool) as redis:
+        ttl = await redis.ttl(phishing_url_cache_key("https://a.com/"))
+    assert 0 < ttl <= models.settings.phishing_url_negative_cache_ttl
+
+
+@pytest.mark.anyio
+async def test_malformed_url_in_batch(fake_redis_pool: ConnectionPool,
+                                      monkeypatch) -> None:
+    """Checks that a malformed URL is scored and cached next to valid ones."""
+    predicted: List[Set[str]] = []
+
+    async def run(function, urls, *args, **kwargs):
+        predicted.append(urls)
+        return [{"url": url, "prediction": 0.9, "source": "model"} for url in urls]
+
+    monkeypatch.setattr(models.inference_executor, "run", run)
+    monkeypatch.setattr(models.settings, "phishing_index_enabled", False)
+    monkeypatch.setattr(models, "phishing_url_cache",
+                        PredictionCache("phishing_url", max_size=10, ttl=60))
+
+    urls = {"http://[abc", "https://a.com/?utm_source=x", "b.com"}
+    results = await models.phishing_url_predictions(urls, fake_redis_pool)
+    assert predicted == [{"http://[abc", "https://a.com/", "b.com"}]
+    assert sorted(result["url"] for result in results) == sorted(urls)
+
+    await models.phishing_url_predictions({" http://[abc"}, fake_redis_pool)
+    assert len(predicted) == 1
+
+
+@pytest.mark.anyio
+async def test_phishing_url_index_looked_up_once(fake_redis_pool: ConnectionPool,
+                                                 tmp_path, monkeypatch) -> None:
+    """Checks that URLs the loaded index didn't answer skip the worker lookup."""
+    dataset = tmp_path / "index.tsv"
+    dataset.write_text("1\thttps://bad.com/login\n")
+    store = URLIndexStore(dataset, [], error_rate=1e-6, check_interval=60)
+    calls = []
+
+    async def run(function, urls, lookup, **kwargs):
+        calls.append((urls, lookup))
+        return [{"url": url, "prediction": 0.1, "source": "model"} for url in urls]
+
+    monkeypatch.setattr(models.inference_executor, "run", run)
+    monkeypatch.setattr(models.settings, "phishing_index_enabled", True)
+    monkeypatch.setattr(models.settings, "prediction_cache_enabled", False)
+    monkeypatch.setattr(models, "url_index", store)
+
+    await models.phishing_url_predictions({"https://a.com/"}, fake_redis_pool)
+    store.refresh()
+    results = await models.phishing_url_predictions(
+        {"https://bad.com/login", "https://b.com/"}, fake_redis_pool)
+
+    assert calls == [({"https://a.com/"}, True), ({"https://b.com/"}, False)]
+    assert {result["url"]: result["source"] for result in results} == {
+        "https://bad.com/login": "index", "https://b.com/": "model",
+    }
+
+
+@pytest.mark.anyio
+async def test_malformed_url_skips_index(fake_redis_pool: ConnectionPool,
+                                         tmp_path, monkeypatch) -> None:
+    """Checks that the model scores malformed URLs the index can't parse."""
+    dataset = tmp_path / "index.tsv"
+    dataset.write_text("1\thttps://bad.com/login\n")
+    store = URLIndexStore(dataset, [], error_rate=1e-6, check_interval=60)
+    store.refresh()
+
+    async def run(function, urls, lookup, **kwargs):
+        return [{"url": url, "prediction": 0.1, "source": "model"} for url in urls]
+
+    monkeypatch.setattr(models.inference_executor, "run", run)
+    monkeypatch.setattr(models.settings, "phishing_index_enabled", True)
+    monkeypatch.setattr(models.settings, "prediction_cache_enabled", False)
+    monkeypatch.setattr(models, "url_index", store)
+
+    results = await models.phishing_url_predictions(
+        {"https://bad.com/login", "http://[abc"}, fake_redis_pool)
+
+    assert {result["url"]: result["source"] for result in results} == {
+        "https://bad.com/login": "index", "http://[abc": "model",
+    }
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+
+import pytest
+
+from insightguard.services.insightguard.batching import QueueFullError
+from insightguard.services.insightguard.executor import InferenceExecutor
+
+
+@pytest.mark.anyio
+async def test_inference_runs_off_the_event_loop() -> None:
+    """Checks that calls run in worker threads and the queue is bounded."""
+    executor = InferenceExecutor(kind="thread", workers=1, max_queue=1)
+    release = threading.Event()
+
+    def blocking() -> str:
+        release.wait(5)
+        return threading.current_thread().name
+
+    call = asyncio.ensure_future(executor.run(blocking, model="test"))
+    await asyncio.sleep(0)
+    with pytest.raises(QueueFullError):
+        await executor.run(blocking, model="test")
+    release.set()
+
+    assert (await call).startswith("inference")
+    executor.shutdown()
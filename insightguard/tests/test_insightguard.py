@@ -15,3 +15,23 @@ async def test_health(client: AsyncClient, fastapi_app: FastAPI) -> None:
     url = fastapi_app.url_path_for("health_check")
     response = await client.get(url)
     assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.anyio
+async def test_ready(client: AsyncClient, fastapi_app: FastAPI) -> None:
+    """
+    Checks the readiness endpoint before and after models are warmed up.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    """
+    url = fastapi_app.url_path_for("readiness_check")
+    fastapi_app.state.models_ready = False
+    response = await client.get(url)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    fastapi_app.state.models_ready = True
+    fastapi_app.state.model_load_times = {"pl": 1.5}
+    response = await client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"models": {"pl": 1.5}}
@@ -0,0 +1,152 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+from redis.asyncio import ConnectionPool
+
+from insightguard.services.insightguard.batching import QueueFullError
+from insightguard.services.jobs import worker
+from insightguard.services.jobs.queue import DONE, FAILED, QUEUED, JobQueue
+from insightguard.services.jobs.worker import JobWorker
+
+pytest.importorskip("lupa")
+
+
+async def upper(items: List[str], redis_pool: ConnectionPool) -> List[Dict[str, Any]]:
+    """
+    Fake scan upper-casing items.
+
+    :param items: items to scan.
+    :param redis_pool: unused.
+    :return: results.
+    """
+    return [{"item": item.upper()} for item in items]
+
+
+@pytest.mark.anyio
+async def test_job_is_processed_in_chunks(fake_redis_pool: ConnectionPool,
+                                          monkeypatch) -> None:
+    """Checks that a worker stores results of every item and acks the job."""
+    monkeypatch.setitem(worker.scans, "url", upper)
+    queue = JobQueue(fake_redis_pool, lease=60, max_attempts=2, ttl=60)
+    job_id = await queue.submit("url", ["a", "b", "c"], owner="me")
+
+    lease = await queue.claim()
+    assert lease.job_id == job_id
+    await JobWorker(queue, fake_redis_pool, chunk_size=2).process(lease)
+
+    job = await queue.get(job_id)
+    assert (job["status"], job["processed"], job["attempts"]) == (DONE, "3", "1")
+    assert await queue.results(job_id, 1, 5) == [{"item": "B"}, {"item": "C"}]
+    assert await queue.claim() is None
+
+
+@pytest.mark.anyio
+async def test_failed_job_is_retried_then_failed(fake_redis_pool: ConnectionPool,
+                                                 monkeypatch) -> None:
+    """Checks that failing jobs are requeued until max attempts."""
+    async def broken(items, redis_pool):
+        raise RuntimeError("model is down")
+
+    monkeypatch.setitem(worker.scans, "url", broken)
+    queue = JobQueue(fake_redis_pool, lease=60, max_attempts=2, ttl=60)
+    job_id = await queue.submit("url", ["a"], owner="me")
+    job_worker = JobWorker(queue, fake_redis_pool, chunk_size=2)
+
+    await job_worker.process(await queue.claim())
+    assert (await queue.get(job_id))["status"] == QUEUED
+
+    await job_worker.process(await queue.claim())
+    job = await queue.get(job_id)
+    assert (job["status"], job["error"]) == (FAILED, "model is down")
+
+
+@pytest.mark.anyio
+async def test_full_inference_queue_keeps_attempts(fake_redis_pool: ConnectionPool,
+                                                   monkeypatch) -> None:
+    """Checks that jobs postponed by a full inference queue don't use attempts."""
+    async def busy(items, redis_pool):
+        raise QueueFullError("256 inference calls are already queued.")
+
+    monkeypatch.setitem(worker.scans, "url", busy)
+    monkeypatch.setattr(worker, "RETRY_DELAY", 0)
+    queue = JobQueue(fake_redis_pool, lease=60, max_attempts=1, ttl=60)
+    job_id = await queue.submit("url", ["a"], owner="me")
+    job_worker = JobWorker(queue, fake_redis_pool, chunk_size=2)
+
+    for _ in range(3):
+        await job_worker.process(await queue.claim())
+
+    job = await queue.get(job_id)
+    assert (job["status"], job["attempts"]) == (QUEUED, "0")
+
+
+@pytest.mark.anyio
+async def test_worker_survives_redis_errors(fake_redis_pool: ConnectionPool,
+                                            monkeypatch) -> None:
+    """Checks that an error of the worker loop is retried, not raised."""
+    stop = asyncio.Event()
+
+    async def scan(items, redis_pool):
+        stop.set()
+        return await upper(items, redis_pool)
+
+    monkeypatch.setitem(worker.scans, "url", scan)
+    monkeypatch.setattr(worker, "RETRY_DELAY", 0)
+    queue = JobQueue(fake_redis_pool, lease=60, max_attempts=2, ttl=60)
+    job_id = await queue.submit("url", ["a"], owner="me")
+    expired = queue.expired
+    errors = [ConnectionError("Connection reset by peer")] * 2
+
+    async def flaky_expired():
+        if errors:
+            raise errors.pop()
+        return await expired()
+
+    monkeypatch.setattr(queue, "expired", flaky_expired)
+
+    await asyncio.wait_for(JobWorker(queue, fake_redis_pool, chunk_size=2).run(stop), 5)
+
+    assert (await queue.get(job_id))["status"] == DONE
+
+
+@pytest.mark.anyio
+async def test_expired_lease_resumes_job(fake_redis_pool: ConnectionPool,
+                                         monkeypatch) -> None:
+    """Checks that a job of a crashed worker is requeued and resumed."""
+    monkeypatch.setitem(worker.scans, "url", upper)
+    queue = JobQueue(fake_redis_pool, lease=-1, max_attempts=3, ttl=60)
+    job_id = await queue.submit("url", ["a", "b"], owner="me")
+    lease = await queue.claim()
+    assert await queue.add_results(lease, 0, [{"item": "A"}])
+
+    assert await queue.expired() == [job_id]
+    assert await queue.release(job_id) == QUEUED
+    assert await queue.release(job_id) == ""
+
+    queue.lease = 60
+    await JobWorker(queue, fake_redis_pool, chunk_size=10).process(
+        await queue.claim())
+    assert await queue.results(job_id, 0, 10) == [{"item": "A"}, {"item": "B"}]
+
+
+@pytest.mark.anyio
+async def test_lost_lease_is_fenced(fake_redis_pool: ConnectionPool) -> None:
+    """Checks that a worker whose lease was taken over can't store results."""
+    queue = JobQueue(fake_redis_pool, lease=-1, max_attempts=3, ttl=60)
+    job_id = await queue.submit("url", ["a", "b"], owner="me")
+    stale = await queue.claim()
+    assert await queue.release(job_id) == QUEUED
+    queue.lease = 60
+    current = await queue.claim()
+
+    assert not await queue.add_results(stale, 0, [{"item": "A"}])
+    assert await queue.add_results(current, 0, [{"item": "A"}])
+    assert not await queue.add_results(current, 0, [{"item": "A"}])
+    assert not await queue.ack(stale)
+    assert await queue.release(job_id, "slow", stale.token) == ""
+
+    assert await queue.ack(current)
+    job = await queue.get(job_id)
+    assert (job["status"], job["processed"], job["attempts"]) == (DONE, "1", "2")
+    assert await queue.results(job_id, 0, 10) == [{"item": "A"}]
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from insightguard.services.insightguard import models
+from insightguard.services.insightguard.models import PhishingEmailClassifier
+from insightguard.services.insightguard.vocabulary import FrozenVocabulary
+
+
+class FakeModel:
+    """Keras-like model scoring a row by the share of known words."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, input_data, batch_size=None):
+        self.calls += 1
+        return (input_data > 0).mean(axis=1, keepdims=True) * 10
+
+
+def test_email_batch_single_model_call(monkeypatch) -> None:
+    """Checks that a batch of emails is predicted with one padded model call."""
+    monkeypatch.setattr(models, "preprocess_emails",
+                        lambda contents: [content.lower() for content in contents])
+    classifier = object.__new__(PhishingEmailClassifier)
+    classifier.model = FakeModel()
+    classifier.vocabulary = FrozenVocabulary({"bank": 1, "account": 2})
+
+    predictions = classifier.predict_batch(["Bank account", "hello", "bank"])
+
+    np.testing.assert_allclose(predictions, [0.2, 0.0, 0.1])
+    assert classifier.model.calls == 1
+
+
+def test_email_classifier_loads_its_own_model(monkeypatch) -> None:
+    """Checks that the email classifier doesn't load the URL model by default."""
+    loaded = []
+    tensorflow = SimpleNamespace(keras=SimpleNamespace(models=SimpleNamespace(
+        load_model=lambda path: loaded.append(path) or FakeModel(),
+    )))
+    monkeypatch.setattr(models.SingletonMeta, "_instances", {})
+    monkeypatch.setattr(models.resources, "get", lambda name: tensorflow)
+    monkeypatch.setattr(PhishingEmailClassifier, "load_vocabulary",
+                        staticmethod(lambda path: FrozenVocabulary({})))
+
+    PhishingEmailClassifier()
+
+    assert loaded == [models.phishing_email_model_path]
+    assert models.phishing_email_model_path != models.phishing_model_path
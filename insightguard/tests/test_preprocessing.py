@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+from insightguard.services.insightguard import preprocessing
+from insightguard.services.insightguard.preprocessing import (preprocess_email,
+                                                              preprocess_email_nltk,
+                                                              preprocess_emails,
+                                                              split_sentences,
+                                                              tokenize,
+                                                              tokenize_sentence)
+from insightguard.services.insightguard.resources import FRAUD_EMAILS_PATH
+
+# Emails with quotes, contractions, abbreviations, URLs and unicode, for
+# which preprocessing must match the NLTK pipeline exactly.
+CORPUS = (
+    'He said "click here" and I didn\'t. She said \'no\' twice.',
+    "We can't, won't and shouldn't wait; you'll see what they're doing.",
+    "Dear Mr. Smith, Dr. Jones asked for documents, e.g. passports, by Friday.",
+    "Verify your account at https://secure-bank.example.com/login?id=42&ref=mail now!",
+    "Send $1,500.00 to help@example.org (urgent) -- reply ASAP...",
+    "“Your parcel” is waiting at the café, Zoë’s order № 7.",
+    "CONGRATULATIONS!!! YOU HAVE WON. Claim it: call +1 (555) 010-9999.",
+    "I'm gonna wanna know why 'tis so. Lemme see, gimme the cannot list.",
+    "",
+)
+
+
+@pytest.mark.parametrize(
+    "text, tokens",
+    [
+        ("Don't send $100, please!",
+         ["Do", "n't", "send", "$", "100", ",", "please", "!"]),
+        ('He said "hi" (twice).',
+         ["He", "said", "``", "hi", "''", "(", "twice", ")", "."]),
+        ("Mr. Smith paid 3,000 dollars.",
+         ["Mr.", "Smith", "paid", "3,000", "dollars", "."]),
+        ("I cannot go", ["I", "can", "not", "go"]),
+        ("", []),
+    ],
+)
+def test_tokenize_sentence(text: str, tokens) -> None:
+    """Checks that the precompiled Treebank rules follow NLTKWordTokenizer."""
+    assert tokenize_sentence(text) == tokens
+
+
+def test_tokenize(nltk_pipeline: None) -> None:
+    """Checks that text is split into sentences before the Treebank rules."""
+    assert tokenize("Hello world. Bye.") == ["Hello", "world", ".", "Bye", "."]
+
+
+def test_split_sentences_keeps_whitespace(nltk_pipeline: None) -> None:
+    """Checks that sentences match Punkt and keep whitespace inside them."""
+    text = "Dear  sir.\nSend it to Mr. Smith  today.  Thanks"
+    nltk = pytest.importorskip("nltk")
+
+    assert split_sentences(text) == nltk.sent_tokenize(text)
+    assert split_sentences(text)[1] == "Send it to Mr. Smith  today."
+
+
+def test_preprocess_emails_batch(monkeypatch) -> None:
+    """Checks that batches drop stopwords, stem and skip non-string values."""
+    monkeypatch.setattr(preprocessing, "split_sentences", lambda text: [text])
+    monkeypatch.setattr(
+        preprocessing,
+        "stem_function",
+        lambda: lambda token: None if token.lower() in {"the", "a"} else token.lower(),
+    )
+
+    emails = ["The Bank needs a reply.", float("nan"), "The Bank needs a reply."]
+
+    assert preprocess_emails(emails) == ["bank needs reply .", "", "bank needs reply ."]
+
+
+@pytest.fixture(scope="module")
+def nltk_pipeline() -> None:
+    """Skips tests comparing with NLTK if it or its data isn't available."""
+    pytest.importorskip("nltk")
+    try:
+        preprocess_email_nltk("Warm up.")
+    except LookupError:
+        pytest.skip("NLTK data is not available.")
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_corpus_equivalence_with_nltk(text: str, nltk_pipeline: None) -> None:
+    """Checks that preprocessing matches the NLTK pipeline on the fixed corpus."""
+    assert preprocess_email(text) == preprocess_email_nltk(text)
+
+
+def load_emails():
+    """
+    Emails of the bundled CSV.
+
+    :return: list of emails.
+    """
+    pandas = pytest.importorskip("pandas")
+    pytest.importorskip("nltk")
+    if not FRAUD_EMAILS_PATH.exists():
+        pytest.skip("Fraud emails CSV is not bundled.")
+    return [text for text in pandas.read_csv(FRAUD_EMAILS_PATH)["Text"]
+            if isinstance(text, str)]
+
+
+def test_equivalence_with_nltk(nltk_pipeline: None) -> None:
+    """Checks that preprocessing matches the NLTK pipeline on the bundled CSV."""
+    for email in load_emails():
+        assert preprocess_email(email) == preprocess_email_nltk(email)
+
+
+@pytest.mark.benchmark
+def test_throughput(nltk_pipeline: None) -> None:
+    """Checks that batch preprocessing is faster than the NLTK pipeline."""
+    emails = load_emails()[:500]
+    preprocess_email_nltk(emails[0])
+
+    start = time.perf_counter()
+    for email in emails:
+        preprocess_email_nltk(email)
+    nltk_throughput = len(emails) / (time.perf_counter() - start)
+
+    fast_throughput = preprocessing.benchmark(emails, preprocess_emails)
+
+    assert fast_throughput > nltk_throughput
@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from fastapi import HTTPException
+from httpx import AsyncClient
+from starlette.requests import Request
+from starlette.responses import Response
+
+from insightguard.ratelimiter.limiter import RateLimiter
+from insightguard.settings import settings
+from insightguard.tests.benchmarks.stand_ins import rate_limiters
+
+pytest.importorskip("lupa")
+
+
+def api_request(api_key: str) -> Request:
+    """
+    Request with an API key header.
+
+    :param api_key: API key.
+    :return: request.
+    """
+    return Request({"type": "http", "headers": [(b"x-api-key", api_key.encode())]})
+
+
+@pytest.mark.anyio
+async def test_rate_limit_headers() -> None:
+    """Checks that quota is reported in headers and requests above it rejected."""
+    limiter = RateLimiter(rate_limit=3, rate_limit_window=60,
+                          redis_client=FakeRedis(server=FakeServer()))
+
+    remaining = []
+    for _ in range(3):
+        response = Response()
+        headers = await limiter(api_request("key"), response)
+        assert response.headers["RateLimit-Policy"] == "3;w=60"
+        remaining.append(headers["RateLimit-Remaining"])
+    assert remaining == ["2", "1", "0"]
+
+    with pytest.raises(HTTPException) as error:
+        await limiter(api_request("key"), Response())
+    assert error.value.status_code == 429
+    assert error.value.headers["RateLimit-Remaining"] == "0"
+    assert error.value.headers["RateLimit-Reset"] == "60"
+    assert error.value.headers["Retry-After"] == "20"
+
+    await limiter(api_request("other"), Response())
+
+
+@pytest.mark.anyio
+async def test_rate_limit_concurrent_requests() -> None:
+    """Checks that concurrent requests can't pass more than the limit."""
+    limiter = RateLimiter(rate_limit=5, rate_limit_window=60,
+                          redis_client=FakeRedis(server=FakeServer()))
+
+    results = await asyncio.gather(*(limiter.check("key") for _ in range(20)))
+
+    assert sum(allowed for allowed, *_ in results) == 5
+
+
+@pytest.mark.anyio
+async def test_rate_limit_cost() -> None:
+    """Checks that a batch costs its number of items and can't exceed the quota."""
+    limiter = RateLimiter(rate_limit=10, rate_limit_window=60,
+                          redis_client=FakeRedis(server=FakeServer()))
+
+    headers = await limiter.charge("key", cost=7)
+    assert headers["RateLimit-Remaining"] == "3"
+
+    with pytest.raises(HTTPException) as error:
+        await limiter.charge("key", cost=4)
+    assert error.value.status_code == 429
+    assert error.value.headers["RateLimit-Remaining"] == "3"
+
+    headers = await limiter.charge("key", cost=3)
+    assert headers["RateLimit-Remaining"] == "0"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "url, item",
+    [
+        ("/api/bullying/batch", {"text": "text", "language": "en"}),
+        ("/api/phishing/email/batch", {"content": "email"}),
+    ],
+)
+async def test_batch_costs_its_items(url, item, stand_in_app, monkeypatch) -> None:
+    """Checks that a batch above the remaining quota is rejected before scoring."""
+    app, api_key = stand_in_app
+    for limiter in rate_limiters(app):
+        monkeypatch.setattr(limiter, "rate_limit", 3)
+    items = [{**item, "id": str(index)} for index in range(4)]
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        before = await client.get("/api/key/", params={"key": api_key})
+        response = await client.post(url, json={"items": items},
+                                     headers={"X-API-KEY": api_key})
+        after = await client.get("/api/key/", params={"key": api_key})
+
+    assert response.status_code == 429
+    assert response.headers["RateLimit-Limit"] == "3"
+    assert after.json()["usage"] == before.json()["usage"]
+
+
+@pytest.mark.anyio
+async def test_stream_costs_its_urls(stand_in_app, monkeypatch) -> None:
+    """Checks that a chunk of URLs above the remaining quota ends the stream."""
+    app, api_key = stand_in_app
+    for limiter in rate_limiters(app):
+        monkeypatch.setattr(limiter, "rate_limit", 3)
+    monkeypatch.setattr(settings, "phishing_url_stream_chunk_size", 3)
+    urls = "".join(f"https://{index}.example.com\n" for index in range(3))
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/api/phishing/url/stream", content=urls,
+                                     headers={"X-API-KEY": api_key})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert len(lines) == 1
+    assert lines[0]["error"].startswith("Rate limit exceeded")
+
+
+@pytest.mark.anyio
+async def test_job_costs_its_items(stand_in_app, monkeypatch) -> None:
+    """Checks that jobs are charged per item against their own quota."""
+    from insightguard.web.api.jobs.views import job_rate_limiter  # noqa: WPS433
+
+    app, api_key = stand_in_app
+    monkeypatch.setattr(job_rate_limiter, "rate_limit", 3)
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        accepted = await client.post("/api/jobs/url", json={"urls": ["a", "b"]},
+                                     headers={"X-API-KEY": api_key})
+        rejected = await client.post("/api/jobs/url", json={"urls": ["c", "d"]},
+                                     headers={"X-API-KEY": api_key})
+
+    assert accepted.status_code == 202
+    assert accepted.headers["RateLimit-Remaining"] == "1"
+    assert rejected.status_code == 429
@@ -0,0 +1,92 @@
+from typing import Dict, List
+
+import pytest
+
+from insightguard.services.insightguard.residency import ModelResidency
+
+
+def make_residency(loaded: Dict[str, str], **kwargs) -> ModelResidency:
+    """
+    Residency of fake models of 100 bytes each.
+
+    :param loaded: dict the fake models are cached in.
+    :param kwargs: residency options.
+    :return: residency.
+    """
+    return ModelResidency(
+        "test",
+        load=lambda key: loaded.setdefault(key, f"model-{key}"),
+        unload=lambda key: loaded.pop(key),
+        size=lambda model: 100,
+        **kwargs,
+    )
+
+
+def use_all(residency: ModelResidency, keys: List[str]) -> None:
+    """
+    Use models one after another.
+
+    :param residency: residency of the models.
+    :param keys: keys of the models.
+    """
+    for key in keys:
+        with residency.use(key):
+            pass  # noqa: WPS420
+
+
+def test_unloads_least_recently_used_above_budget() -> None:
+    """Least recently used models are unloaded once the budget is exceeded."""
+    loaded: Dict[str, str] = {}
+    residency = make_residency(loaded, budget=200)
+
+    use_all(residency, ["pl", "en", "pl", "ca"])
+
+    assert residency.resident == ["pl", "ca"]
+    assert set(loaded) == {"pl", "ca"}
+    assert residency.resident_bytes == 200
+
+
+def test_pinned_and_used_models_stay() -> None:
+    """Pinned models and models in use are never unloaded."""
+    loaded: Dict[str, str] = {}
+    residency = make_residency(loaded, budget=100, pinned=["pl"])
+
+    with residency.use("en") as model:
+        use_all(residency, ["pl", "ca"])
+        assert model == "model-en"
+        assert "en" in loaded
+
+    assert residency.resident == ["pl", "ca"]
+
+
+def test_unloads_idle_models() -> None:
+    """Models unused for longer than idle_ttl are unloaded and loaded again later."""
+    loaded: Dict[str, str] = {}
+    residency = make_residency(loaded)
+
+    use_all(residency, ["jp", "en"])
+    residency.idle_ttl = 1e-9
+    assert residency.enforce() == ["jp"]
+    assert residency.resident == ["en"]
+
+    use_all(residency, ["jp"])
+    assert "jp" in loaded
+
+
+def test_failed_load_releases_model() -> None:
+    """A model whose load fails isn't kept in use and can still be unloaded."""
+    loaded: Dict[str, str] = {}
+    residency = make_residency(loaded, budget=100)
+    use_all(residency, ["en"])
+
+    def load(key: str) -> str:
+        if key == "en":
+            raise OSError("model files are gone")
+        return loaded.setdefault(key, f"model-{key}")
+
+    residency.load = load
+    with pytest.raises(OSError):
+        use_all(residency, ["en"])
+    use_all(residency, ["pl"])
+
+    assert residency.resident == ["pl"]
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+from insightguard.services.insightguard.resources import ResourceRegistry
+
+
+def test_resources_load_once() -> None:
+    """Checks that resources are loaded lazily, once, and timed."""
+    registry = ResourceRegistry()
+    calls = []
+
+    @registry.register("answer")
+    def _load_answer() -> int:
+        calls.append(1)
+        return 42
+
+    assert registry.load_times == {}
+    assert registry.get("answer") == 42
+    assert registry.get("answer") == 42
+    assert len(calls) == 1
+    assert set(registry.warmup()) == {"answer"}
+    assert registry.load_times["answer"] >= 0
+
+
+def test_models_import_is_lazy() -> None:
+    """Checks that importing the models module does not load heavy libraries."""
+    code = (
+        "import sys; import insightguard.services.insightguard.models; "
+        "heavy = {'tensorflow', 'transformers', 'datasets', 'pandas', 'nltk'}; "
+        "sys.exit(len(heavy & set(sys.modules)))"
+    )
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
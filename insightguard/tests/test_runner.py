@@ -0,0 +1,71 @@
+import json
+import os
+import signal
+import time
+import urllib.request
+from typing import Any, Callable, Dict
+
+import pytest
+
+uvicorn = pytest.importorskip("uvicorn")
+
+from insightguard.web.runner import PreforkRunner  # noqa: E402
+
+
+async def pid_app(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    """
+    ASGI app answering with pid of the worker.
+
+    :param scope: connection scope.
+    :param receive: receive channel.
+    :param send: send channel.
+    """
+    if scope["type"] != "http":
+        return
+    body = json.dumps({"pid": os.getpid()}).encode()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def get_pid(port: int, timeout: float = 10) -> int:
+    """
+    Ask a worker for its pid, waiting for workers to start listening.
+
+    :param port: port of the server.
+    :param timeout: seconds to wait.
+    :return: pid.
+    """
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with opener.open(f"http://127.0.0.1:{port}/", timeout=timeout) as response:
+                return json.loads(response.read())["pid"]
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def test_prefork_runner_replaces_workers() -> None:
+    """Checks that forked workers serve requests and dead ones are replaced."""
+    config = uvicorn.Config(pid_app, host="127.0.0.1", port=0, lifespan="off",
+                            log_level="warning")
+    config.load()
+    sock = config.bind_socket()
+    port = sock.getsockname()[1]
+    runner = PreforkRunner(config, [sock], workers=2)
+    runner.start()
+    try:
+        pids = {process.pid for process in runner.processes.values()}
+        assert get_pid(port) in pids
+
+        os.kill(runner.processes[0].pid, signal.SIGKILL)
+        runner.check(timeout=10)
+        assert runner.processes[0].pid not in pids
+        assert runner.processes[0].is_alive()
+        assert get_pid(port) in {process.pid for process in runner.processes.values()}
+    finally:
+        runner.stop(timeout=10)
+    assert not any(process.is_alive() for process in runner.processes.values())
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+import pytest
+
+from insightguard.services.insightguard import models, server as inference_server
+from insightguard.services.insightguard.executor import InferenceExecutor
+from insightguard.services.insightguard.server import (InferenceServer,
+                                                       preload_models,
+                                                       private_dir)
+from insightguard.settings import settings
+
+
+def fail(message: str) -> None:
+    """
+    Raise an error in the inference server.
+
+    :param message: message of the error.
+    :raises ValueError: always.
+    """
+    raise ValueError(message)
+
+
+@pytest.fixture
+def server(tmp_path):
+    """
+    Inference server with two forked workers.
+
+    :param tmp_path: temporary directory of the socket.
+    :yield: running server.
+    """
+    server = InferenceServer(tmp_path / "inference.sock", workers=2, threads=2)
+    server.start()
+    yield server
+    server.stop(timeout=5)
+
+
+@pytest.mark.anyio
+async def test_server_executor(server: InferenceServer) -> None:
+    """Checks that calls run in server workers and errors are raised by clients."""
+    executor = InferenceExecutor("server", workers=1, max_queue=8,
+                                 socket_path=server.socket_path)
+
+    pids = {await executor.run(os.getpid, model="test") for _ in range(8)}
+    assert os.getpid() not in pids
+    assert pids <= {process.pid for process in server.processes.values()}
+    assert await executor.run(sorted, [3, 1, 2], model="test") == [1, 2, 3]
+
+    with pytest.raises(ValueError, match="broken"):
+        await executor.run(fail, "broken", model="test")
+    assert executor.pending == 0
+
+
+@pytest.mark.anyio
+async def test_server_of_another_user_is_refused(server: InferenceServer,
+                                                 monkeypatch) -> None:
+    """Checks that clients don't unpickle responses of another user's server."""
+    executor = InferenceExecutor("server", workers=1, max_queue=8,
+                                 socket_path=server.socket_path)
+    monkeypatch.setattr(os, "getuid", lambda: os.geteuid() + 1)
+
+    with pytest.raises(PermissionError):
+        await executor.run(os.getpid, model="test")
+
+
+def test_socket_dir_must_be_private(tmp_path) -> None:
+    """Checks that the server doesn't listen in a directory others can write to."""
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+
+    with pytest.raises(PermissionError):
+        InferenceServer(shared / "inference.sock", workers=1, threads=1).start()
+
+    private_dir(tmp_path / "private")
+    assert (tmp_path / "private").stat().st_mode & 0o777 == 0o700
+
+
+def test_preload_onnx_models(monkeypatch) -> None:
+    """Checks that only ONNX models are loaded before forking, on one thread."""
+    loaded = []
+
+    def warmup_model(name: str) -> float:
+        loaded.append((name, settings.onnx_threads))
+        return 0.0
+
+    monkeypatch.setattr(models, "warmup_model", warmup_model)
+    monkeypatch.setattr(settings, "bullying_backends", {"pl": "onnx", "en": "tf"})
+    monkeypatch.setattr(settings, "onnx_threads", 0)
+
+    assert preload_models(["en", "pl", "phishing_url"]) == ["pl"]
+    assert loaded == [("pl", 1)]
+
+
+def test_crashing_workers_back_off(tmp_path, monkeypatch) -> None:
+    """Checks that workers failing to warm up aren't restarted in a loop."""
+
+    def warmup_model(name: str) -> float:
+        raise RuntimeError("Model is missing.")
+
+    monkeypatch.setattr(models, "warmup_model", warmup_model)
+    monkeypatch.setattr(inference_server, "RESTART_DELAY", 0.5)
+    crashing = InferenceServer(tmp_path / "inference.sock", workers=1, threads=1,
+                               warmup=["pl"])
+    crashing.start()
+    supervisor = threading.Thread(target=crashing.supervise)
+    supervisor.start()
+    time.sleep(2.5)
+    crashing.stop(timeout=5)
+    supervisor.join()
+
+    # Restarted after 0.5 and 1 seconds, the next one is due after 2.
+    assert 2 <= crashing.restarts[0] <= 3
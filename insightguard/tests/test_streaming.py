@@ -0,0 +1,74 @@
+from typing import AsyncIterator, List
+
+import anyio
+import pytest
+from starlette.requests import Request
+
+from insightguard.web.api.phishing.streaming import (DuplexStreamingResponse,
+                                                     LineTooLongError,
+                                                     iter_batches,
+                                                     iter_lines)
+
+
+async def chunks(*parts: bytes) -> AsyncIterator[bytes]:
+    """
+    Stream given parts.
+
+    :param parts: body parts.
+    :yield: parts one by one.
+    """
+    for part in parts:
+        yield part
+
+
+@pytest.mark.anyio
+async def test_iter_lines_and_batches() -> None:
+    """Checks that lines split across chunks and multibyte characters survive."""
+    snowman = "☃".encode("utf-8")
+    lines = iter_lines(
+        chunks(b"a.com\n\n b", b".com\r\nc", snowman[:1], snowman[1:]), 100)
+
+    batches = [batch async for batch in iter_batches(lines, 2)]
+
+    assert batches == [["a.com", "b.com"], ["c☃"]]
+
+
+@pytest.mark.anyio
+async def test_iter_lines_too_long() -> None:
+    """Checks that unbounded lines are rejected."""
+    with pytest.raises(LineTooLongError):
+        async for _ in iter_lines(chunks(b"x" * 10, b"x" * 10), 15):
+            pass  # noqa: WPS420
+
+
+@pytest.mark.anyio
+async def test_duplex_response_streams_while_reading_body() -> None:
+    """Checks that results are sent before the rest of the body is received."""
+    response_started = anyio.Event()
+    messages = [
+        {"type": "http.request", "body": b"a\n", "more_body": True},
+        {"type": "http.request", "body": b"b\n", "more_body": False},
+    ]
+    sent: List[bytes] = []
+
+    async def receive():
+        if len(messages) == 1:
+            await response_started.wait()
+        return messages.pop(0)
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            sent.append(message["body"])
+            response_started.set()
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": []}
+    request = Request(scope, receive)
+
+    async def body() -> AsyncIterator[str]:
+        async for line in iter_lines(request.stream(), 100):
+            yield f"{line.upper()}\n"
+
+    with anyio.fail_after(1):
+        await DuplexStreamingResponse(body())(scope, receive, send)
+
+    assert sent == [b"A\n", b"B\n"]
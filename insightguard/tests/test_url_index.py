@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from insightguard.services.insightguard.url_index import (BloomFilter,
+                                                          URLIndexStore,
+                                                          parent_domains,
+                                                          url_key)
+
+
+@pytest.mark.parametrize(
+    "url, key",
+    [
+        ("https://User@Example.COM/login/?a=1#top", "example.com/login?a=1"),
+        ("example.com/", "example.com"),
+        ("  http://example.com:8080/a ", "example.com:8080/a"),
+    ],
+)
+def test_url_key(url: str, key: str) -> None:
+    """Checks that trivially different URLs share a key."""
+    assert url_key(url) == key
+
+
+def test_parent_domains() -> None:
+    """Checks that subdomains are matched by their parents."""
+    assert parent_domains("a.evil.co/x") == ["a.evil.co", "evil.co"]
+    assert parent_domains("localhost:80") == ["localhost"]
+
+
+def test_bloom_filter() -> None:
+    """Checks that added items are found and others mostly aren't."""
+    bloom = BloomFilter(1000, 1e-4)
+    for index in range(1000):
+        bloom.add(f"domain{index}.com")
+
+    assert all(f"domain{index}.com" in bloom for index in range(1000))
+    assert sum(f"other{index}.com" in bloom for index in range(1000)) <= 2
+
+
+def test_index_sources_and_reload(tmp_path) -> None:
+    """Checks dataset labels, blocklists and reload after files change."""
+    dataset = tmp_path / "index.tsv"
+    dataset.write_text("1\thttp://bad.example.com/login\n0\tgood.example.org/\n")
+    blocklist = tmp_path / "blocklist.txt"
+    blocklist.write_text("# operator feed\nevil.net\nhttps://good.example.org/\n")
+    store = URLIndexStore(dataset, [blocklist], error_rate=1e-6, check_interval=0)
+
+    assert store.lookup_many([
+        "https://bad.example.com/login", "http://login.evil.net/x",
+        "good.example.org", "https://unknown.com/",
+    ]) == {
+        "https://bad.example.com/login": 1.0,
+        "http://login.evil.net/x": 1.0,
+        "good.example.org": 1.0,
+    }
+
+    old_index = store.index
+    blocklist.write_text("evil.net\n")
+    os.utime(blocklist, ns=(0, 0))
+    assert store.refresh()
+    assert store.index is not old_index
+    assert store.lookup_many(["good.example.org"]) == {"good.example.org": 0.0}
+    assert not store.refresh()
+
+
+def test_malformed_lines_and_urls(tmp_path) -> None:
+    """Checks that malformed lines are skipped and malformed URLs are unknown."""
+    dataset = tmp_path / "index.tsv"
+    dataset.write_text("1\thttp://[abc/login\nx\tgood.example.org\n0\tok.example.org\n")
+    blocklist = tmp_path / "blocklist.txt"
+    blocklist.write_text("https://[evil/\nevil.net\nhttps://bad.example.com/\n")
+    store = URLIndexStore(dataset, [blocklist], error_rate=1e-6, check_interval=0)
+
+    assert store.index.skipped == 3
+    assert store.lookup_many([
+        "http://[abc/login", "ok.example.org", "http://a.evil.net/",
+        "https://bad.example.com", "good.example.org",
+    ]) == {
+        "ok.example.org": 0.0,
+        "http://a.evil.net/": 1.0,
+        "https://bad.example.com": 1.0,
+    }
@@ -0,0 +1,81 @@
+import pytest
+
+from insightguard.services.insightguard import preprocessing
+from insightguard.services.insightguard.vocabulary import (URL_VOCABULARY_PATH,
+                                                           FrozenVocabulary,
+                                                           main,
+                                                           pad_sequences)
+
+URLS = [
+    "https://www.example.com/login?next=/account",
+    "http://paypal.com.secure-update.example.ru/signin",
+    "example.com",
+    "HTTP://WWW.EXAMPLE.COM/Index.html",
+    "ftp://files.example.org/pub/a_b-c.zip",
+    "",
+]
+
+
+def test_fit_ranks_words_by_frequency(tmp_path) -> None:
+    """Checks that the index is ranked like keras and survives a round trip."""
+    vocabulary = FrozenVocabulary.fit(URLS, num_words=5)
+
+    assert vocabulary.word_index == {"example": 1, "com": 2, "www": 3, "http": 4}
+    assert vocabulary.texts_to_sequences(["www.example.com/unknown"]) == [[3, 1, 2]]
+
+    path = tmp_path / "vocab.json"
+    vocabulary.save(path)
+    loaded = FrozenVocabulary.load(path)
+    assert loaded.texts_to_sequences(URLS) == vocabulary.texts_to_sequences(URLS)
+
+
+def test_pad_sequences() -> None:
+    """Checks front padding and truncation."""
+    padded = pad_sequences([[1, 2, 3], [], [4]], maxlen=2)
+    assert padded.tolist() == [[2, 3], [0, 0], [0, 4]]
+
+
+def test_fit_matches_keras_tokenizer() -> None:
+    """Checks that fitting gives the same sequences as the keras tokenizer."""
+    text = pytest.importorskip("keras.preprocessing.text")
+
+    tokenizer = text.Tokenizer(num_words=8)
+    tokenizer.fit_on_texts(URLS)
+    vocabulary = FrozenVocabulary.fit(URLS, num_words=8)
+
+    assert vocabulary.texts_to_sequences(URLS) == tokenizer.texts_to_sequences(URLS)
+
+
+def test_url_artifact_matches_refit() -> None:
+    """Checks that the shipped URL vocabulary matches refitting on the dataset."""
+    if not URL_VOCABULARY_PATH.exists():
+        pytest.skip("URL vocabulary artifact is not built.")
+    text = pytest.importorskip("keras.preprocessing.text")
+    datasets = pytest.importorskip("datasets")
+
+    urls = datasets.load_dataset("Mitake/PhishingURLsANDBenignURLs")["train"]["url"]
+    tokenizer = text.Tokenizer(num_words=10000)
+    tokenizer.fit_on_texts(urls)
+    vocabulary = FrozenVocabulary.load(URL_VOCABULARY_PATH)
+
+    sample = urls[::max(len(urls) // 1000, 1)] + URLS
+    assert vocabulary.texts_to_sequences(sample) == tokenizer.texts_to_sequences(sample)
+
+
+def test_email_vocabulary_cli(tmp_path, monkeypatch) -> None:
+    """Checks that the email command fits preprocessed emails of the CSV."""
+    pytest.importorskip("pandas")
+    monkeypatch.setattr(preprocessing, "preprocess_emails",
+                        lambda emails: [email.upper() for email in emails])
+    csv_path = tmp_path / "emails.csv"
+    csv_path.write_text("Text,Class\nwin money now,1\nmoney transfer,1\nhi bob,0\n")
+    output = tmp_path / "email.vocab.json"
+
+    main([
+        "email", "--input", str(csv_path), "--output", str(output),
+        "--num-words", "3",
+    ])
+
+    vocabulary = FrozenVocabulary.load(output)
+    assert vocabulary.word_index == {"money": 1, "win": 2}
+    assert vocabulary.metadata["source"] == "emails.csv"
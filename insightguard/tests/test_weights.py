@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import numpy as np
+
+from insightguard.services.insightguard.weights import (load_weights,
+                                                        memory_usage,
+                                                        save_weights,
+                                                        weights_dir)
+
+
+def test_weights_are_memory_mapped(tmp_path: Path) -> None:
+    """Checks that stored weights load mapped and their data offsets are right."""
+    arrays = {
+        "encoder/kernel:0": np.arange(600, dtype=np.float32).reshape(20, 30),
+        "classifier/bias:0": np.array([1, -1], dtype=np.int8),
+    }
+    directory = weights_dir(tmp_path / "model.int8.onnx")
+    assert directory.name == "model.int8.weights"
+
+    locations = save_weights(arrays, directory)
+    loaded = load_weights(directory)
+
+    assert list(loaded) == list(arrays)
+    for name, array in arrays.items():
+        assert isinstance(loaded[name], np.memmap)
+        assert not loaded[name].flags.writeable
+        np.testing.assert_array_equal(loaded[name], array)
+
+        file_name, offset, length = locations[name]
+        data = (directory / file_name).read_bytes()[offset:offset + length]
+        assert data == array.tobytes()
+
+
+def test_memory_usage(tmp_path: Path) -> None:
+    """Checks that shared and private memory are parsed from smaps_rollup."""
+    smaps = tmp_path / "smaps_rollup"
+    smaps.write_text(
+        "55d0c0a00000-7ffd1a5fe000 ---p 00000000 00:00 0    [rollup]\n"
+        "Rss:              204800 kB\n"
+        "Pss:              120000 kB\n"
+        "Shared_Clean:     150000 kB\n"
+        "Shared_Dirty:        800 kB\n"
+        "Private_Clean:      4000 kB\n"
+        "Private_Dirty:     50000 kB\n",
+    )
+
+    assert memory_usage(smaps) == {
+        "rss": 204800 * 1024,
+        "pss": 120000 * 1024,
+        "shared": 150800 * 1024,
+        "private": 54000 * 1024,
+    }
+    assert memory_usage(tmp_path / "missing") == {}
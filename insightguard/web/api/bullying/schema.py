@@ -14,3 +14,7 @@ class PredictionOutputDTO(BaseModel):
 class PredictionInputDTO(BaseModel):
     text: str
     language: str
+
+
+class BatchPredictionInputDTO(BaseModel):
+    items: List[PredictionInputDTO]
@@ -1,13 +1,22 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, List
+
 import redis.asyncio as redis
-from fastapi import APIRouter, Depends, HTTPException, Header
+from redis.asyncio import ConnectionPool
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
 from starlette import status
 from starlette.requests import Request
 
 from insightguard.db.dao.key_dao import KeyDAO
 from insightguard.ratelimiter.limiter import RateLimiter
-from insightguard.services.insightguard.models import BullyingScanner
+from insightguard.services.insightguard.batching import QueueFullError
+from insightguard.services.insightguard.models import bullying_score, bullying_scores
+from insightguard.services.redis.dependency import get_redis_pool
 from insightguard.settings import settings
-from insightguard.web.api.bullying.schema import PredictionOutputDTO, PredictionInputDTO
+from insightguard.web.api.bullying.schema import (PredictionOutputDTO,
+                                                  PredictionInputDTO,
+                                                  BatchPredictionInputDTO)
 
 router = APIRouter()
 
@@ -20,7 +29,8 @@ async def predict(input: PredictionInputDTO,
                   request: Request,
                   x_api_key: str = Header(),
                   key_dao: KeyDAO = Depends(),
-                  rate_limiter: RateLimiter = Depends(
+                  redis_pool: ConnectionPool = Depends(get_redis_pool),
+                  rate_limit_headers: Dict[str, str] = Depends(
                       bullying_rate_limiter)) -> PredictionOutputDTO:
     """
     Predicts class for input data.
@@ -29,7 +39,8 @@ async def predict(input: PredictionInputDTO,
     :param request: current request.
     :param x_api_key: API key.
     :param key_dao: key DAO.
-    :param rate_limiter: rate limiter.
+    :param redis_pool: redis pool of the prediction cache.
+    :param rate_limit_headers: quota headers of the rate limiter.
     :return: prediction output.
     """
 
@@ -47,8 +58,12 @@ async def predict(input: PredictionInputDTO,
         )
 
     try:
-        scanner = BullyingScanner(input.language)
-        prediction = await scanner.predict(input.text)
+        prediction = await bullying_score(input.language, input.text, redis_pool)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many predictions in progress, try again later.",
+        )
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -63,3 +78,85 @@ async def predict(input: PredictionInputDTO,
     await key_dao.update_key_usage(key)
 
     return p
+
+
+@router.post("/batch", response_model=List[PredictionOutputDTO])
+async def predict_batch(input: BatchPredictionInputDTO,
+                        request: Request,
+                        response: Response,
+                        x_api_key: str = Header(),
+                        key_dao: KeyDAO = Depends(),
+                        redis_pool: ConnectionPool = Depends(get_redis_pool)
+                        ) -> List[PredictionOutputDTO]:
+    """
+    Predicts class for many texts at once.
+
+    Texts are grouped by language and every group is predicted in buckets
+    of similar length. Every text counts as a request for the rate limit
+    and key usage.
+
+    :param input: input data.
+    :param request: current request.
+    :param response: response, gets the quota headers.
+    :param x_api_key: API key.
+    :param key_dao: key DAO.
+    :param redis_pool: redis pool of the prediction cache.
+    :return: prediction outputs, in order of input items.
+    """
+
+    key = await key_dao.get_key(x_api_key)
+    if not key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid API key.",
+        )
+
+    if len(input.items) > settings.bullying_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch can't have more than "
+                   f"{settings.bullying_batch_max_items} items.",
+        )
+
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for index, item in enumerate(input.items):
+        groups[item.language].append(index)
+
+    unsupported = set(groups) - set(request.app.state.scanner.langs)
+    if unsupported:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Language not supported: {', '.join(sorted(unsupported))}.",
+        )
+
+    await bullying_rate_limiter.charge(x_api_key, max(len(input.items), 1), response)
+
+    try:
+        results = await asyncio.gather(*(
+            bullying_scores(language, [input.items[i].text for i in indexes],
+                            redis_pool)
+            for language, indexes in groups.items()
+        ))
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many predictions in progress, try again later.",
+        )
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error predicting message.",
+        )
+
+    predictions = [0.0] * len(input.items)
+    for indexes, scores in zip(groups.values(), results):
+        for index, score in zip(indexes, scores):
+            predictions[index] = score
+
+    await key_dao.update_key_usage(key, len(input.items))
+
+    return [
+        PredictionOutputDTO(prediction=prediction, text=item.text,
+                            language=item.language)
+        for item, prediction in zip(input.items, predictions)
+    ]
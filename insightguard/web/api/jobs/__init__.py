@@ -0,0 +1,4 @@
+"""Scan jobs API."""
+from insightguard.web.api.jobs.views import router
+
+__all__ = ["router"]
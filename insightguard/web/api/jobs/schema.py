@@ -0,0 +1,23 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class JobURLInputDTO(BaseModel):
+    urls: List[str]
+
+
+class JobOutputDTO(BaseModel):
+    id: str
+    kind: str
+    status: str
+    total: int
+    processed: int
+    attempts: int
+    error: Optional[str] = None
+
+
+class JobResultsOutputDTO(BaseModel):
+    items: List[Dict[str, Any]]
+    # Offset of the next page, None when all results of a finished job were read
+    next_offset: Optional[int] = None
@@ -0,0 +1,214 @@
+import hashlib
+from typing import Any, List
+
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from redis.asyncio import ConnectionPool
+from starlette import status
+from starlette.requests import Request
+
+from insightguard.db.dao.key_dao import KeyDAO
+from insightguard.ratelimiter.limiter import RateLimiter
+from insightguard.services.jobs.queue import DONE, FAILED, JobQueue
+from insightguard.services.redis.dependency import get_redis_pool
+from insightguard.settings import settings
+from insightguard.web.api.bullying.schema import BatchPredictionInputDTO
+from insightguard.web.api.jobs.schema import (JobOutputDTO, JobResultsOutputDTO,
+                                              JobURLInputDTO)
+from insightguard.web.api.phishing.schema import PhishingEmailBatchInputDTO
+
+router = APIRouter()
+
+job_rate_limiter = RateLimiter(rate_limit=settings.job_rate_limit,
+                               rate_limit_window=settings.job_rate_limit_window,
+                               redis_client=redis.from_url(str(settings.redis_url)),
+                               prefix="ratelimit:jobs")
+
+
+def get_job_queue(redis_pool: ConnectionPool = Depends(get_redis_pool)) -> JobQueue:
+    """
+    Queue of scan jobs.
+
+    :param redis_pool: redis connection pool.
+    :return: job queue.
+    """
+    return JobQueue(redis_pool, lease=settings.job_lease_seconds,
+                    max_attempts=settings.job_max_attempts, ttl=settings.job_ttl)
+
+
+def owner_of(x_api_key: str) -> str:
+    """
+    Owner of jobs submitted with an API key, without storing the key itself.
+
+    :param x_api_key: API key.
+    :return: hash of the key.
+    """
+    return hashlib.sha256(x_api_key.encode("utf-8")).hexdigest()
+
+
+async def submit(kind: str, items: List[Any], x_api_key: str, key_dao: KeyDAO,
+                 queue: JobQueue, response: Response) -> JobOutputDTO:
+    """
+    Validate key and size of a job and queue it.
+
+    Every item counts against the job quota of the key.
+
+    :param kind: kind of the scan.
+    :param items: input items.
+    :param x_api_key: API key.
+    :param key_dao: key DAO.
+    :param queue: job queue.
+    :param response: response, gets the quota headers.
+    :return: queued job.
+    """
+    key = await key_dao.get_key(x_api_key)
+    if not key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid API key.",
+        )
+
+    if len(items) > settings.job_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Job can't have more than {settings.job_max_items} items.",
+        )
+
+    await job_rate_limiter.charge(x_api_key, max(len(items), 1), response)
+
+    job_id = await queue.submit(kind, items, owner_of(x_api_key))
+    await key_dao.update_key_usage(key, len(items))
+
+    return JobOutputDTO(id=job_id, kind=kind, status="queued", total=len(items),
+                        processed=0, attempts=0)
+
+
+@router.post("/bullying", response_model=JobOutputDTO,
+             status_code=status.HTTP_202_ACCEPTED)
+async def submit_bullying_job(input: BatchPredictionInputDTO,
+                              request: Request,
+                              response: Response,
+                              x_api_key: str = Header(),
+                              key_dao: KeyDAO = Depends(),
+                              queue: JobQueue = Depends(get_job_queue)
+                              ) -> JobOutputDTO:
+    """
+    Queues bullying scan of many texts.
+
+    :param input: texts with their languages.
+    :param request: current request.
+    :param response: response, gets the quota headers.
+    :param x_api_key: API key.
+    :param key_dao: key DAO.
+    :param queue: job queue.
+    :return: queued job.
+    """
+    unsupported = {item.language for item in input.items} - set(
+        request.app.state.scanner.langs)
+    if unsupported:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Language not supported: {', '.join(sorted(unsupported))}.",
+        )
+    items = [item.dict() for item in input.items]
+    return await submit("bullying", items, x_api_key, key_dao, queue, response)
+
+
+@router.post("/url", response_model=JobOutputDTO,
+             status_code=status.HTTP_202_ACCEPTED)
+async def submit_url_job(input: JobURLInputDTO,
+                         response: Response,
+                         x_api_key: str = Header(),
+                         key_dao: KeyDAO = Depends(),
+                         queue: JobQueue = Depends(get_job_queue)) -> JobOutputDTO:
+    """
+    Queues phishing scan of many URLs.
+
+    :param input: URLs.
+    :param response: response, gets the quota headers.
+    :param x_api_key: API key.
+    :param key_dao: key DAO.
+    :param queue: job queue.
+    :return: queued job.
+    """
+    return await submit("url", input.urls, x_api_key, key_dao, queue, response)
+
+
+@router.post("/email", response_model=JobOutputDTO,
+             status_code=status.HTTP_202_ACCEPTED)
+async def submit_email_job(input: PhishingEmailBatchInputDTO,
+                           response: Response,
+                           x_api_key: str = Header(),
+                           key_dao: KeyDAO = Depends(),
+                           queue: JobQueue = Depends(get_job_queue)) -> JobOutputDTO:
+    """
+    Queues phishing scan of many emails.
+
+    :param input: emails with client supplied ids.
+    :param response: response, gets the quota headers.
+    :param x_api_key: API key.
+    :param key_dao: key DAO.
+    :param queue: job queue.
+    :return: queued job.
+    """
+    items = [item.dict() for item in input.items]
+    return await submit("email", items, x_api_key, key_dao, queue, response)
+
+
+async def get_owned_job(job_id: str, x_api_key: str, queue: JobQueue) -> dict:
+    """
+    Get job submitted with the API key.
+
+    :param job_id: id of the job.
+    :param x_api_key: API key.
+    :param queue: job queue.
+    :return: job hash.
+    """
+    job = await queue.get(job_id)
+    if job is None or job["owner"] != owner_of(x_api_key):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found.",
+        )
+    return job
+
+
+@router.get("/{job_id}", response_model=JobOutputDTO)
+async def get_job(job_id: str,
+                  x_api_key: str = Header(),
+                  queue: JobQueue = Depends(get_job_queue)) -> JobOutputDTO:
+    """
+    Gets status and progress of a job.
+
+    :param job_id: id of the job.
+    :param x_api_key: API key the job was submitted with.
+    :param queue: job queue.
+    :return: job.
+    """
+    job = await get_owned_job(job_id, x_api_key, queue)
+    return JobOutputDTO(**{**job, "error": job.get("error") or None})
+
+
+@router.get("/{job_id}/results", response_model=JobResultsOutputDTO)
+async def get_job_results(job_id: str,
+                          offset: int = Query(0, ge=0),
+                          limit: int = Query(100, ge=1, le=1000),
+                          x_api_key: str = Header(),
+                          queue: JobQueue = Depends(get_job_queue)
+                          ) -> JobResultsOutputDTO:
+    """
+    Gets a page of results, available while the job is still running.
+
+    :param job_id: id of the job.
+    :param offset: index of the first result.
+    :param limit: maximum number of results.
+    :param x_api_key: API key the job was submitted with.
+    :param queue: job queue.
+    :return: results in order of items and offset of the next page.
+    """
+    job = await get_owned_job(job_id, x_api_key, queue)
+    items = await queue.results(job_id, offset, limit)
+    next_offset = offset + len(items)
+    finished = job["status"] in {DONE, FAILED} and next_offset >= int(job["processed"])
+    return JobResultsOutputDTO(items=items,
+                               next_offset=None if finished else next_offset)
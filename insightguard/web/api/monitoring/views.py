@@ -1,4 +1,12 @@
-from fastapi import APIRouter
+import os
+from typing import Dict
+
+
+from fastapi import APIRouter, HTTPException
+from starlette import status
+from starlette.requests import Request
+
+from insightguard.services.insightguard.weights import memory_usage
 
 router = APIRouter()
 
@@ -10,3 +18,40 @@ def health_check() -> None:
 
     It returns 200 if the project is healthy.
     """
+
+
+@router.get("/ready")
+def readiness_check(request: Request) -> Dict[str, Dict[str, float]]:
+    """
+    Checks if models are warmed up.
+
+    It returns 503 until all models from `warmup_models` setting are loaded,
+    so only warm workers get traffic.
+
+    :param request: current request.
+    :return: warmup time of every model in seconds.
+    """
+    state = request.app.state
+    if not getattr(state, "models_ready", False):
+        detail = "Models are warming up."
+        if getattr(state, "model_warmup_errors", None):
+            failed = ", ".join(state.model_warmup_errors)
+            detail = f"Models failed to warm up: {failed}."
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+        )
+    return {"models": state.model_load_times}
+
+
+@router.get("/memory")
+def memory_check() -> Dict[str, int]:
+    """
+    Reports memory of the worker serving the request.
+
+    Weights memory-mapped by several workers count as shared,
+    so private memory is what every extra worker costs.
+
+    :return: pid and rss, pss, shared and private bytes.
+    """
+    return {"pid": os.getpid(), **memory_usage()}
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Union, Set, Dict, Any
+from typing import Union, Set, Dict, Any, List
 
 from pydantic import BaseModel
 
@@ -12,6 +12,8 @@ class PhishingURLOutputDTO(BaseModel):
     created_at: datetime = datetime.now()
     url: str
     prediction: float
+    # "index" for known URLs, "model" for predicted ones
+    source: str = "model"
 
 
 class PhishingEmailOutputDTO(BaseModel):
@@ -20,3 +22,17 @@ class PhishingEmailOutputDTO(BaseModel):
 
 class PhishingEmailInputDTO(BaseModel):
     content: str
+
+
+class PhishingEmailBatchItemDTO(BaseModel):
+    id: str
+    content: str
+
+
+class PhishingEmailBatchInputDTO(BaseModel):
+    items: List[PhishingEmailBatchItemDTO]
+
+
+class PhishingEmailBatchOutputDTO(BaseModel):
+    id: str
+    prediction: float
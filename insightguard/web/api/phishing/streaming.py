@@ -0,0 +1,72 @@
+"""Helpers of streaming endpoints."""
+import codecs
+from typing import AsyncIterable, AsyncIterator, List
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class LineTooLongError(Exception):
+    """Raised when a line of the request body exceeds the limit."""
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Streaming response that can be sent while the request body is still read.
+
+    ``StreamingResponse`` listens for client disconnect by receiving request
+    messages, which would swallow body chunks the endpoint streams in.
+    Here the disconnect is noticed by the endpoint reading the body instead.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def iter_lines(chunks: AsyncIterable[bytes],
+                     max_length: int) -> AsyncIterator[str]:
+    """
+    Split streamed UTF-8 bytes into stripped, non-empty lines.
+
+    :param chunks: body chunks, e.g. ``request.stream()``.
+    :param max_length: maximum length of a line.
+    :raises LineTooLongError: if a line is longer than max_length.
+    :yield: lines without line endings.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        if len(pending) > max_length:
+            raise LineTooLongError(f"Line is longer than {max_length} characters.")
+        for line in lines:
+            line = line.strip()
+            if len(line) > max_length:
+                raise LineTooLongError(f"Line is longer than {max_length} characters.")
+            if line:
+                yield line
+    pending = (pending + decoder.decode(b"", final=True)).strip()
+    if pending:
+        yield pending
+
+
+async def iter_batches(lines: AsyncIterable[str],
+                       size: int) -> AsyncIterator[List[str]]:
+    """
+    Group lines into lists of at most `size` lines.
+
+    :param lines: lines to group.
+    :param size: size of a batch.
+    :yield: batches, the last one may be smaller.
+    """
+    batch: List[str] = []
+    async for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,20 +1,33 @@
+import json
 import traceback
-from typing import List
+from typing import AsyncIterator, Dict, List
 
-from fastapi import APIRouter, Header, HTTPException, Depends
+from fastapi import APIRouter, Header, HTTPException, Depends, Response
 
 import redis.asyncio as redis
+from redis.asyncio import ConnectionPool
 from starlette import status
+from starlette.requests import ClientDisconnect, Request
 
 from insightguard.db.dao.key_dao import KeyDAO
 from insightguard.ratelimiter.limiter import RateLimiter
-from insightguard.services.insightguard.models import (PhishingURLClassifier,
-                                                       PhishingEmailClassifier)
+from insightguard.services.insightguard.batching import QueueFullError
+from insightguard.services.insightguard.executor import inference_executor
+from insightguard.services.insightguard.models import (phishing_url_predictions,
+                                                       predict_phishing_email,
+                                                       predict_phishing_emails)
+from insightguard.services.redis.dependency import get_redis_pool
 from insightguard.settings import settings
+from insightguard.web.api.phishing.streaming import (DuplexStreamingResponse,
+                                                     LineTooLongError,
+                                                     iter_batches,
+                                                     iter_lines)
 from insightguard.web.api.phishing.schema import (PhishingURLInputDTO,
                                                   PhishingURLOutputDTO,
                                                   PhishingEmailOutputDTO,
-                                                  PhishingEmailInputDTO)
+                                                  PhishingEmailInputDTO,
+                                                  PhishingEmailBatchInputDTO,
+                                                  PhishingEmailBatchOutputDTO)
 
 router = APIRouter()
 
@@ -27,13 +40,16 @@ bullying_rate_limiter = RateLimiter(rate_limit=15000, rate_limit_window=86400,
 async def predict_url(input: PhishingURLInputDTO,
                       x_api_key: str = Header(),
                       key_dao: KeyDAO = Depends(),
-                      rate_limiter: RateLimiter = Depends(bullying_rate_limiter)):
+                      redis_pool: ConnectionPool = Depends(get_redis_pool),
+                      rate_limit_headers: Dict[str, str] = Depends(
+                          bullying_rate_limiter)):
     """
     Predicts class for input data.
 
     :param input: input data.
     :param key_dao: key dao.
-    :param rate_limiter: rate limiter.
+    :param redis_pool: redis pool of the result cache.
+    :param rate_limit_headers: quota headers of the rate limiter.
     :param x_api_key: API key.
 
     :return: prediction output.
@@ -47,9 +63,12 @@ async def predict_url(input: PhishingURLInputDTO,
         )
 
     try:
-        scanner = PhishingURLClassifier(
-            "insightguard/services/insightguard/models/phishing.h5")
-        prediction = scanner.predict(input.url, normalize=True)
+        prediction = await phishing_url_predictions(input.url, redis_pool)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many predictions in progress, try again later.",
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -59,15 +78,84 @@ async def predict_url(input: PhishingURLInputDTO,
     await key_dao.update_key_usage(key)
 
     return [PhishingURLOutputDTO(url=val['url'], prediction=val['prediction'],
-                                 created_at=val['created_at']) for val in prediction]
+                                 created_at=val['created_at'], source=val['source'])
+            for val in prediction]
+
+
+@router.post("/url/stream", response_class=DuplexStreamingResponse)
+async def predict_url_stream(request: Request,
+                             x_api_key: str = Header(),
+                             key_dao: KeyDAO = Depends(),
+                             redis_pool: ConnectionPool = Depends(get_redis_pool),
+                             rate_limit_headers: Dict[str, str] = Depends(
+                                 bullying_rate_limiter)
+                             ) -> DuplexStreamingResponse:
+    """
+    Predicts class for a stream of URLs.
+
+    The body has one URL per line and is read as it arrives. URLs are scored
+    in chunks of `phishing_url_stream_chunk_size`, and results of every chunk
+    are streamed back as NDJSON lines with url, prediction and source, before
+    the next chunk is read. An error ends the stream with an "error" line.
+    Opening the stream counts as one request for the rate limit and every
+    URL as one more, a chunk that doesn't fit the quota ends the stream.
+    Key usage grows by the number of URLs.
+
+    :param request: current request.
+    :param x_api_key: API key.
+    :param key_dao: key DAO.
+    :param redis_pool: redis pool of the result cache.
+    :param rate_limit_headers: quota headers of the rate limiter.
+    :return: NDJSON stream of predictions.
+    """
+
+    key = await key_dao.get_key(x_api_key)
+    if not key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid API key.",
+        )
+
+    async def results() -> AsyncIterator[str]:
+        lines = iter_lines(request.stream(), settings.phishing_url_stream_max_line)
+        try:
+            chunk_size = settings.phishing_url_stream_chunk_size
+            async for urls in iter_batches(lines, chunk_size):
+                allowed, _, _, retry_after = await bullying_rate_limiter.check(
+                    x_api_key, cost=len(urls))
+                if not allowed:
+                    yield json.dumps({'error': "Rate limit exceeded, try again in "
+                                               f"{retry_after} seconds."}) + "\n"
+                    return
+                predictions = await phishing_url_predictions(set(urls), redis_pool)
+                by_url = {prediction['url']: prediction for prediction in predictions}
+                await key_dao.update_key_usage(key, len(urls))
+                yield "".join(
+                    json.dumps({'url': url, 'prediction': by_url[url]['prediction'],
+                                'source': by_url[url]['source']}) + "\n"
+                    for url in urls
+                )
+        except ClientDisconnect:
+            return
+        except LineTooLongError as exc:
+            yield json.dumps({'error': str(exc)}) + "\n"
+        except QueueFullError:
+            yield json.dumps(
+                {'error': "Too many predictions in progress, try again later."}) + "\n"
+        except Exception:
+            traceback.print_exc()
+            yield json.dumps({'error': "Error predicting message."}) + "\n"
+
+    return DuplexStreamingResponse(results(), media_type="application/x-ndjson",
+                                   headers=rate_limit_headers)
 
 
 @router.post('/email', response_model=PhishingEmailOutputDTO)
 async def predict_email(input: PhishingEmailInputDTO,
                         x_api_key: str = Header(),
                         key_dao: KeyDAO = Depends(),
-                        rate_limiter: RateLimiter = Depends(bullying_rate_limiter)
-                        ):
+                        rate_limit_headers: Dict[str, str] = Depends(
+                            bullying_rate_limiter)):
     """
     Predicts class for input data.
 
@@ -84,9 +172,13 @@ async def predict_email(input: PhishingEmailInputDTO,
         )
 
     try:
-        scanner = PhishingEmailClassifier(
-            "insightguard/services/insightguard/models/phishing.h5")
-        prediction = scanner.predict(input.content)
+        prediction = await inference_executor.run(
+            predict_phishing_email, input.content, model="phishing_email")
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many predictions in progress, try again later.",
+        )
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(
@@ -97,3 +189,71 @@ async def predict_email(input: PhishingEmailInputDTO,
     await key_dao.update_key_usage(key)
 
     return PhishingEmailOutputDTO(prediction=prediction)
+
+
+@router.post('/email/batch', response_model=List[PhishingEmailBatchOutputDTO])
+async def predict_email_batch(input: PhishingEmailBatchInputDTO,
+                              response: Response,
+                              x_api_key: str = Header(),
+                              key_dao: KeyDAO = Depends(),
+                              ) -> List[PhishingEmailBatchOutputDTO]:
+    """
+    Predicts class for many emails at once.
+
+    Emails are preprocessed together and predicted in one padded model call.
+    Every email counts as a request for the rate limit and key usage.
+
+    :param input: emails with client supplied ids.
+    :param response: response, gets the quota headers.
+    :param x_api_key: API key.
+    :param key_dao: key DAO.
+    :return: prediction of every id, in order of input items.
+    """
+
+    key = await key_dao.get_key(x_api_key)
+    if not key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid API key.",
+        )
+
+    if len(input.items) > settings.phishing_email_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch can't have more than "
+                   f"{settings.phishing_email_batch_max_items} items.",
+        )
+
+    if len({item.id for item in input.items}) != len(input.items):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Item ids must be unique.",
+        )
+
+    await bullying_rate_limiter.charge(x_api_key, max(len(input.items), 1), response)
+
+    if not input.items:
+        return []
+
+    try:
+        predictions = await inference_executor.run(
+            predict_phishing_emails, [item.content for item in input.items],
+            model="phishing_email")
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many predictions in progress, try again later.",
+        )
+    except Exception:
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error predicting message.",
+        )
+
+    await key_dao.update_key_usage(key, len(input.items))
+
+    return [
+        PhishingEmailBatchOutputDTO(id=item.id, prediction=prediction)
+        for item, prediction in zip(input.items, predictions)
+    ]
@@ -1,6 +1,7 @@
 from fastapi.routing import APIRouter
 
-from insightguard.web.api import user, monitoring, key, bullying, password, phishing
+from insightguard.web.api import (user, monitoring, key, bullying, password, phishing,
+                                  jobs)
 
 api_router = APIRouter()
 api_router.include_router(monitoring.router)
@@ -9,3 +10,4 @@ api_router.include_router(key.router, prefix="/key", tags=["key"])
 api_router.include_router(bullying.router, prefix="/bullying", tags=["bullying"])
 api_router.include_router(password.router, prefix="/password", tags=["password"])
 api_router.include_router(phishing.router, prefix="/phishing", tags=["phishing"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
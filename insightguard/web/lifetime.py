@@ -9,7 +9,7 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 
-from insightguard.services.insightguard.lifetime import init_models
+from insightguard.services.insightguard.lifetime import init_models, shutdown_models
 from insightguard.services.redis.lifetime import init_redis, shutdown_redis
 from insightguard.settings import settings
 
@@ -85,6 +85,7 @@ def register_shutdown_event(
     async def _shutdown() -> None:  # noqa: WPS430
         await app.state.db_engine.dispose()
 
+        await shutdown_models(app)
         await shutdown_redis(app)
         pass  # noqa: WPS420
 
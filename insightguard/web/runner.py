@@ -0,0 +1,207 @@
+"""
+Preload-and-fork runner of the web server.
+
+The master process imports the application with its heavy dependencies
+and loads resources once, then forks uvicorn workers accepting on a shared
+socket. Workers start with all of it in memory, so starting one only runs
+the application's startup events. Workers that exit are replaced.
+
+Models are still loaded by every worker on startup, TensorFlow doesn't
+work in processes forked after it ran an operation.
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+
+from insightguard.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Workers dying sooner after start are restarted after this delay.
+RESTART_DELAY = 1.0
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    Uvicorn server of a forked worker, logging its startup time.
+
+    :param config: loaded uvicorn config of the master.
+    :param forked_at: monotonic time of the fork.
+    """
+
+    def __init__(self, config: uvicorn.Config, forked_at: float):
+        super().__init__(config)
+        self.forked_at = forked_at
+
+    async def startup(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        """
+        Run application startup and start serving.
+
+        :param sockets: sockets inherited from the master.
+        """
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            logger.info("Worker %d started in %.2fs", os.getpid(),
+                        time.monotonic() - self.forked_at)
+
+
+def run_worker(config: uvicorn.Config, sockets: List[socket.socket],
+               forked_at: float) -> None:
+    """
+    Main function of a forked worker.
+
+    :param config: loaded uvicorn config of the master.
+    :param sockets: listening sockets.
+    :param forked_at: monotonic time of the fork.
+    """
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+    WorkerServer(config, forked_at).run(sockets=sockets)
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drop live gauges of a dead worker from prometheus multiprocess files.
+
+    :param pid: pid of the worker.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # noqa: WPS433
+
+        multiprocess.mark_process_dead(pid)
+
+
+class PreforkRunner:
+    """
+    Master forking and supervising uvicorn workers.
+
+    :param config: loaded uvicorn config with the preloaded app.
+    :param sockets: listening sockets shared by workers.
+    :param workers: number of workers.
+    """
+
+    def __init__(self, config: uvicorn.Config, sockets: List[socket.socket],
+                 workers: int):
+        self.config = config
+        self.sockets = sockets
+        self.workers = workers
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.forked_at: Dict[int, float] = {}
+        self.should_exit = False
+        self._context = multiprocessing.get_context("fork")
+
+    def start(self) -> None:
+        """Fork all workers."""
+        # Preloaded objects live as long as the master, keep the collector
+        # from touching them, so their pages stay shared.
+        gc.freeze()
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+    def spawn(self, slot: int) -> None:
+        """
+        Fork a worker into a slot.
+
+        :param slot: index of the worker.
+        """
+        forked_at = time.monotonic()
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.config, self.sockets, forked_at),
+            name=f"web-{slot}",
+        )
+        process.start()
+        self.processes[slot] = process
+        self.forked_at[slot] = forked_at
+        logger.info("Forked worker %d (pid %d)", slot, process.pid)
+
+    def check(self, timeout: float = 1) -> None:
+        """
+        Wait for workers to exit and replace them.
+
+        :param timeout: seconds to wait.
+        """
+        sentinels = {process.sentinel: slot for slot, process in self.processes.items()}
+        for sentinel in wait(list(sentinels), timeout=timeout):
+            slot = sentinels[sentinel]  # type: ignore
+            process = self.processes[slot]
+            process.join()
+            mark_process_dead(process.pid)
+            if self.should_exit:
+                return
+            uptime = time.monotonic() - self.forked_at[slot]
+            logger.error("Worker %d (pid %d) exited with %s after %.1fs, restarting",
+                         slot, process.pid, process.exitcode, uptime)
+            if uptime < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            self.spawn(slot)
+
+    def supervise(self) -> None:
+        """Replace exited workers until :attr:`should_exit` is set."""
+        while not self.should_exit:
+            self.check()
+
+    def stop(self, timeout: float = 30) -> None:
+        """
+        Stop workers gracefully, killing ones still running after timeout.
+
+        :param timeout: seconds to wait for workers.
+        """
+        self.should_exit = True
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():  # noqa: WPS440
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+            mark_process_dead(process.pid)
+        for sock in self.sockets:
+            sock.close()
+
+
+def run_preforked(workers: int) -> None:
+    """
+    Preload the application and serve it from forked workers.
+
+    :param workers: number of workers.
+    """
+    logging.basicConfig(level=settings.log_level.value)
+    started = time.monotonic()
+
+    # Imported here, so prometheus sees the multiprocess directory.
+    import insightguard.services.insightguard.models  # noqa: F401, WPS301, WPS433
+    from insightguard.services.insightguard.resources import resources  # noqa: WPS433
+    from insightguard.web.application import get_app  # noqa: WPS433
+
+    resources.warmup(settings.preload_resources)
+    config = uvicorn.Config(
+        get_app(),
+        host=settings.host,
+        port=settings.port,
+        log_level=settings.log_level.value.lower(),
+    )
+    config.load()
+    runner = PreforkRunner(config, [config.bind_socket()], workers)
+    logger.info("Preloaded application in %.2fs", time.monotonic() - started)
+
+    def stop(signum: int, frame: Any) -> None:  # noqa: WPS430
+        runner.should_exit = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    runner.start()
+    try:
+        runner.supervise()
+    finally:
+        runner.stop()